@@ -1,4 +1,5 @@
-from typing import Dict, Any, List
+from array import array
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 
 
 def allocate_payment(
@@ -85,3 +86,192 @@ def allocate_payment(
 
     return {"allocations": allocations, "remaining_credit": int(remaining)}
 
+
+def status_for_balance(balance: int) -> str:
+    """Return the STUDENTS_MASTER status for a balance (PARTIAL / PAID / OVERPAID)."""
+    if balance > 0:
+        return "PARTIAL"
+    if balance == 0:
+        return "PAID"
+    return "OVERPAID"
+
+
+# Status by sign of the balance: negative, zero, positive
+STATUS_BY_SIGN = ("OVERPAID", "PAID", "PARTIAL")
+
+
+def statuses_for_balances(balances):
+    """Vectorized `status_for_balance` over a numpy array of balances."""
+    import numpy as np
+
+    return np.asarray(STATUS_BY_SIGN, dtype=object)[np.sign(balances) + 1]
+
+
+def split_credit(remaining_credit: int, refs: List[str]) -> Dict[str, int]:
+    """Split `remaining_credit` evenly across `refs`, earlier refs taking the remainder."""
+    shares: Dict[str, int] = {}
+    if remaining_credit <= 0 or not refs:
+        return shares
+    n = len(refs)
+    base = remaining_credit // n
+    rem = remaining_credit % n
+    for idx, adm in enumerate(refs):
+        share = base + (1 if idx < rem else 0)
+        if share > 0:
+            shares[adm] = share
+    return shares
+
+
+class AllocationEngine:
+    """Reusable allocator over a roster that was validated once.
+
+    Built from STUDENTS_MASTER rows (validated with the same rules and
+    messages as `allocate_payment`), the engine keeps balances in a compact
+    int64 array addressed through an admission_no -> slot index. Each
+    payment then costs O(k log k) in the k referenced students rather than
+    O(N) in the roster. `allocate` returns exactly what `allocate_payment`
+    returns for the same balances; `apply` updates the engine's own state
+    the way `apply_payment_to_excel` does, credit shares included.
+    """
+
+    __slots__ = ("_slots", "_balances")
+
+    def __init__(self, students: List[Dict[str, Any]]):
+        if not isinstance(students, list):
+            raise ValueError("students must be a list of dicts")
+        self._slots: Dict[str, int] = {}
+        self._balances = array("q")
+        for idx, s in enumerate(students):
+            if not isinstance(s, dict):
+                raise ValueError(f"student at index {idx} is not a dict")
+            if "admission_no" not in s:
+                raise ValueError(f"student at index {idx} missing 'admission_no'")
+            if "balance" not in s:
+                raise ValueError(f"student at index {idx} missing 'balance'")
+            adm = s["admission_no"]
+            bal = s["balance"]
+            if not isinstance(adm, str):
+                raise ValueError(f"admission_no at index {idx} must be a string")
+            if not isinstance(bal, int):
+                raise ValueError(f"balance for {adm!s} must be an int")
+            # keep first occurrence if duplicates in students list
+            if adm not in self._slots:
+                self._slots[adm] = len(self._balances)
+                self._balances.append(bal)
+
+    @classmethod
+    def from_balances(cls, balances: Dict[str, int]) -> "AllocationEngine":
+        """Build an engine from an admission_no -> balance map without validation."""
+        engine = cls.__new__(cls)
+        engine._slots = {adm: i for i, adm in enumerate(balances)}
+        engine._balances = array("q", balances.values())
+        return engine
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, admission_no: str) -> bool:
+        return admission_no in self._slots
+
+    def balance(self, admission_no: str) -> Optional[int]:
+        slot = self._slots.get(admission_no)
+        return None if slot is None else self._balances[slot]
+
+    def balances(self) -> Dict[str, int]:
+        balances = self._balances
+        return {adm: balances[slot] for adm, slot in self._slots.items()}
+
+    def allocate(self, amount: int, reference_order: List[str]) -> Dict[str, Any]:
+        """Allocate like `allocate_payment` against the current balances, without applying."""
+        if not isinstance(reference_order, list):
+            raise ValueError("reference_order must be a list of admission numbers")
+        if not isinstance(amount, int) or amount < 0:
+            raise ValueError("amount must be a non-negative integer")
+        slots = self._slots
+        balances = self._balances
+        allocations: Dict[str, int] = {}
+        remaining = amount
+
+        if len(reference_order) == 1:
+            adm = reference_order[0]
+            if not isinstance(adm, str):
+                raise ValueError("reference_order must contain strings")
+            slot = slots.get(adm)
+            if slot is not None and remaining > 0:
+                bal = balances[slot]
+                if bal > 0:
+                    alloc = bal if remaining >= bal else remaining
+                    allocations[adm] = alloc
+                    remaining -= alloc
+            return {"allocations": allocations, "remaining_credit": remaining}
+
+        seen = set()
+        eligible = []
+        for ref_index, adm in enumerate(reference_order):
+            if not isinstance(adm, str):
+                raise ValueError("reference_order must contain strings")
+            if adm in seen:
+                continue
+            seen.add(adm)
+            slot = slots.get(adm)
+            if slot is None:
+                continue
+            bal = balances[slot]
+            if bal > 0:
+                eligible.append((-bal, ref_index, adm))
+        # Highest balance first, tie-breaker: lower ref_index
+        eligible.sort()
+        for neg_bal, _, adm in eligible:
+            if remaining <= 0:
+                break
+            alloc = -neg_bal if remaining >= -neg_bal else remaining
+            allocations[adm] = alloc
+            remaining -= alloc
+        return {"allocations": allocations, "remaining_credit": remaining}
+
+    def apply(self, result: Dict[str, Any], reference_order: List[str]) -> Dict[str, int]:
+        """Apply an allocation result to the engine's balances. Returns the credit shares.
+
+        Raises ValueError if an allocation targets an unknown admission_no.
+        """
+        slots = self._slots
+        balances = self._balances
+        for adm in result["allocations"]:
+            if adm not in slots:
+                raise ValueError(f"admission_no '{adm}' not found in STUDENTS_MASTER")
+        for adm, alloc in result["allocations"].items():
+            balances[slots[adm]] -= alloc
+        shares = split_credit(result["remaining_credit"], [r for r in reference_order if r in slots])
+        for adm, share in shares.items():
+            balances[slots[adm]] -= share
+        return shares
+
+    def process(self, amount: int, reference_order: List[str]) -> Dict[str, Any]:
+        """Allocate a payment and apply it; returns the `allocate` result."""
+        result = self.allocate(amount, reference_order)
+        self.apply(result, reference_order)
+        return result
+
+
+def allocate_batch(
+    balances: Dict[str, int],
+    payments: Iterable[Tuple[int, List[str]]],
+) -> List[Dict[str, Any]]:
+    """Allocate many payments, in order, against one shared balance state.
+
+    - `balances` maps admission_no -> balance and is updated in place.
+    - `payments` yields `(amount, reference_order)` pairs.
+
+    Each payment follows the `allocate_payment` rules (balance-first,
+    reference-order tie-break, non-positive balances ignored). Any
+    `remaining_credit` is then split across the referenced students that
+    exist, as `apply_payment_to_excel` does, lowering their balances before
+    the next payment is allocated. The roster is indexed once into an
+    `AllocationEngine`, so each payment only touches the students it names.
+
+    Returns one {"allocations", "remaining_credit"} dict per payment.
+    """
+    engine = AllocationEngine.from_balances(balances)
+    results = [engine.process(amount, reference_order) for amount, reference_order in payments]
+    balances.update(engine.balances())
+    return results
@@ -0,0 +1,156 @@
+import csv
+import os
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from app.core.excel import HISTORY_HEADERS, _to_int, read_history_rows
+
+TERM_COL = HISTORY_HEADERS["TRANSACTIONS"].index("Term")
+# Columns holding amounts, re-typed when reading CSV shards back
+INT_COLS = {"TRANSACTIONS": (1, 4), "ALLOCATIONS": (2,), "CREDITS": (2,)}
+
+
+def archive_dir_for(workbook_path: str) -> Path:
+    """Default archive location: `<workbook stem>_archive/` next to the workbook."""
+    p = Path(workbook_path)
+    return p.with_name(p.stem + "_archive")
+
+
+def _term_dir(archive_dir: Path, term: str) -> Path:
+    return archive_dir / "".join(c if c.isalnum() or c in "-_." else "_" for c in term)
+
+
+def _append_csv(path: Path, headers: List[str], rows: Iterable[tuple]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    new = not path.exists()
+    with open(path, "a", newline="", encoding="utf-8") as fh:
+        writer = csv.writer(fh)
+        if new:
+            writer.writerow(headers)
+        writer.writerows(rows)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
+def rotate_history(wb, current_terms: Iterable[str], archive_dir: Path) -> int:
+    """Move history rows of terms not in `current_terms` out of an open workbook.
+
+    TRANSACTIONS rows are assigned to shards by their Term column, and
+    ALLOCATIONS/CREDITS rows follow their transaction. Each shard is an
+    append-only CSV under `archive_dir/<term>/<SHEET>.csv`. The shards are
+    written and fsync'd before the sheets are trimmed; the caller saves the
+    workbook. Returns the number of rows moved.
+
+    Rows are appended in time order, so the check is a single cell when the
+    oldest live transaction already belongs to one of `current_terms`.
+    """
+    current_terms = set(current_terms)
+    if "TRANSACTIONS" not in wb.sheetnames:
+        return 0
+    ws_tx = wb["TRANSACTIONS"]
+    first = next(ws_tx.iter_rows(min_row=2, max_row=2, values_only=True), None)
+    if first is None or first[TERM_COL] in current_terms:
+        return 0
+
+    tx_terms: Dict[str, str] = {}
+    for row in ws_tx.iter_rows(min_row=2, values_only=True):
+        if row[0] is not None and row[TERM_COL] not in current_terms:
+            tx_terms[str(row[0])] = str(row[TERM_COL] or "unassigned")
+
+    moved = 0
+    for sheet_name, headers in HISTORY_HEADERS.items():
+        if sheet_name not in wb.sheetnames:
+            continue
+        ws = wb[sheet_name]
+        keep: List[tuple] = []
+        shards: Dict[str, List[tuple]] = defaultdict(list)
+        for row in ws.iter_rows(min_row=2, values_only=True):
+            term = tx_terms.get(str(row[0])) if row and row[0] is not None else None
+            if term is None:
+                keep.append(row)
+            else:
+                shards[term].append(row[:len(headers)])
+        if not shards:
+            continue
+        for term, rows in shards.items():
+            _append_csv(_term_dir(archive_dir, term) / f"{sheet_name}.csv", headers, rows)
+            moved += len(rows)
+        ws.delete_rows(2, ws.max_row)
+        for row in keep:
+            ws.append(row)
+    return moved
+
+
+def archived_terms(archive_dir: Path) -> List[str]:
+    """Return the terms that have archive shards, in name order."""
+    if not archive_dir.exists():
+        return []
+    return sorted(d.name for d in archive_dir.iterdir() if d.is_dir())
+
+
+def _read_shard(path: Path, sheet_name: str) -> Iterator[tuple]:
+    if not path.exists():
+        return
+    int_cols = INT_COLS[sheet_name]
+    with open(path, newline="", encoding="utf-8") as fh:
+        reader = csv.reader(fh)
+        next(reader, None)
+        for row in reader:
+            yield tuple(_to_int(v) if i in int_cols else v for i, v in enumerate(row))
+
+
+def iter_history(
+    workbook_path: str,
+    sheet_name: str,
+    terms: Optional[Iterable[str]] = None,
+    archive_dir: Optional[Path] = None,
+) -> Iterator[tuple]:
+    """Yield history rows across the archive shards and the live workbook.
+
+    `sheet_name` is TRANSACTIONS, ALLOCATIONS or CREDITS; rows come in that
+    sheet's column order, archived terms first. Pass `terms` to read only
+    those terms. A row that was archived but is still live (a crash between
+    writing the shard and saving the workbook) is returned once.
+    """
+    if sheet_name not in HISTORY_HEADERS:
+        raise ValueError(f"Unknown history sheet: {sheet_name}")
+    archive_dir = archive_dir or archive_dir_for(workbook_path)
+    wanted = set(terms) if terms is not None else None
+
+    def key(row):
+        return row[0] if sheet_name == "TRANSACTIONS" else (row[0], row[1])
+
+    seen = set()
+    for term_dir in archived_terms(archive_dir):
+        if wanted is not None and term_dir not in {_term_dir(archive_dir, t).name for t in wanted}:
+            continue
+        for row in _read_shard(archive_dir / term_dir / f"{sheet_name}.csv", sheet_name):
+            if key(row) not in seen:
+                seen.add(key(row))
+                yield row
+
+    if not Path(workbook_path).exists():
+        return
+    live_tx = None
+    if wanted is not None:
+        live_tx = {str(r[0]) for r in read_history_rows(workbook_path, "TRANSACTIONS") if r[TERM_COL] in wanted}
+    for row in read_history_rows(workbook_path, sheet_name):
+        row = (str(row[0]),) + row[1:]
+        if live_tx is not None and row[0] not in live_tx:
+            continue
+        if key(row) not in seen:
+            seen.add(key(row))
+            yield row
+
+
+def history_transaction_results(workbook_path: str, archive_dir: Optional[Path] = None) -> Dict[str, Dict[str, Any]]:
+    """Rebuild TxID -> {"allocations", "remaining_credit"} across archive and live sheets."""
+    results: Dict[str, Dict[str, Any]] = {}
+    for row in iter_history(workbook_path, "TRANSACTIONS", archive_dir=archive_dir):
+        results[row[0]] = {"allocations": {}, "remaining_credit": _to_int(row[4])}
+    for row in iter_history(workbook_path, "ALLOCATIONS", archive_dir=archive_dir):
+        result = results.get(row[0])
+        if result is not None and row[1] is not None:
+            result["allocations"][str(row[1])] = _to_int(row[2])
+    return results
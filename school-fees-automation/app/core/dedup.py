@@ -0,0 +1,92 @@
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from app.core.journal import PaymentJournal
+from app.core.storage import LedgerBackend, open_backend
+
+
+def index_path_for(workbook_path: str) -> str:
+    return str(workbook_path) + ".txids"
+
+
+class TransactionIndex:
+    """In-memory TransID -> allocation result index for duplicate detection.
+
+    The index is persisted in an append-only JSON-lines sidecar next to the
+    ledger. The stored history (TRANSACTIONS/ALLOCATIONS for a workbook) is
+    scanned only once, to seed the sidecar when it does not exist yet; after
+    that, loading the index reads the sidecar and `refresh` reads only the
+    entries other processes have appended since.
+    """
+
+    def __init__(self, backend: Union[LedgerBackend, str], index_path: Optional[str] = None):
+        self.backend = open_backend(backend) if isinstance(backend, str) else backend
+        self.sidecar = PaymentJournal(index_path or index_path_for(self.backend.path))
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._offset: Optional[int] = None
+
+    def _seed_from_backend(self) -> None:
+        if not self.backend.exists():
+            return
+        results = self.backend.transaction_results()
+        self.sidecar.extend({"tx_id": tx_id, **result} for tx_id, result in results.items())
+
+    def refresh(self) -> None:
+        """Load the index on first use, then pick up newly appended entries."""
+        if self._offset is None:
+            if not self.sidecar.path.exists():
+                self._seed_from_backend()
+            self._offset = 0
+        entries, self._offset = self.sidecar.read_from(self._offset)
+        self._add(entries)
+
+    def _add(self, entries: Iterable[Dict[str, Any]]) -> None:
+        for entry in entries:
+            if entry.get("forgotten"):
+                self._results.pop(entry["tx_id"], None)
+                continue
+            self._results.setdefault(entry["tx_id"], {
+                "allocations": entry["allocations"],
+                "remaining_credit": entry["remaining_credit"],
+            })
+
+    def get(self, tx_id: str) -> Optional[Dict[str, Any]]:
+        """Return the original allocation result for `tx_id`, or None if unseen."""
+        return self._results.get(tx_id)
+
+    def __contains__(self, tx_id: str) -> bool:
+        return tx_id in self._results
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        """Persist and index a newly applied payment's result."""
+        self.record_many([entry])
+
+    def record_many(self, entries: List[Dict[str, Any]]) -> None:
+        self.refresh()
+        self._offset = self.sidecar.extend(
+            {"tx_id": e["tx_id"], "allocations": e["allocations"], "remaining_credit": e["remaining_credit"]}
+            for e in entries
+        )
+        self._add(entries)
+
+    def forget(self, tx_ids: List[str]) -> None:
+        """Un-index payments taken back out of the journal before they were saved."""
+        self.refresh()
+        self._offset = self.sidecar.extend({"tx_id": tx_id, "forgotten": True} for tx_id in tx_ids)
+        self._add({"tx_id": tx_id, "forgotten": True} for tx_id in tx_ids)
+
+    def add_pending(self, entries: Iterable[Dict[str, Any]]) -> None:
+        """Index journalled payments, persisting any the sidecar is missing.
+
+        A crash between the journal write and the sidecar append, or a
+        sidecar seeded from a backend that lacks the journal, leaves
+        journalled payments out of the sidecar. They are recorded here, so
+        the index still knows them once they are saved and the journal is
+        truncated.
+        """
+        self.refresh()
+        missing = [e for e in entries if e["tx_id"] not in self._results]
+        if missing:
+            self.record_many(missing)
@@ -1,7 +1,14 @@
+import os
+import threading
+import zipfile
 from pathlib import Path
-from typing import List, Dict
+from xml.etree import ElementTree
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from openpyxl import load_workbook
+from app.core.allocator import split_credit, statuses_for_balances
+
+# openpyxl (and pandas, in load_school_data) are imported where they are
+# used: importing openpyxl pulls in numpy, which app startup should not pay for.
 
 
 def load_school_data(path: str):
@@ -11,38 +18,443 @@ def load_school_data(path: str):
     # keep existing behavior simple: delegate to pandas if available
     try:
         import pandas as pd
+    except ImportError:
+        pd = None
+    if pd is not None:
+        try:
+            return pd.read_excel(p)
+        except Exception:
+            pass
+    # Fallback: return the openpyxl workbook object
+    from openpyxl import load_workbook
 
-        return pd.read_excel(p)
-    except Exception:
-        # Fallback: return the openpyxl workbook object
-        return load_workbook(p)
+    return load_workbook(p)
 
 
 def _normalize(s: str) -> str:
     return "" if s is None else "".join(c for c in s.lower() if c.isalnum())
 
 
-def _find_header_map(ws):
-    """Return map of normalized header -> column index (1-based) from first non-empty row."""
-    if ws.max_row < 1:
-        return {}
-    headers = [cell.value for cell in ws[1]]
-    header_map = {}
-    for idx, h in enumerate(headers, start=1):
-        key = _normalize(h)
-        if key:
-            header_map[key] = idx
-    return header_map
-
-
-def _get_col_index_by_candidates(header_map: Dict[str, int], candidates: List[str]):
-    for c in candidates:
-        k = _normalize(c)
-        if k in header_map:
-            return header_map[k]
+def _to_int(value) -> int:
+    try:
+        return int(value or 0)
+    except Exception:
+        return 0
+
+
+# STUDENTS_MASTER fields -> normalized header candidates, in priority order
+STUDENTS_MASTER_COLUMNS = {
+    "admission_no": ("admissionno", "admission", "admissionnumber"),
+    "name": ("name", "studentname"),
+    "class_name": ("class", "form", "grade"),
+    "paid_total": ("paidtotal",),
+    "credit": ("credit",),
+    "balance": ("balance",),
+    "status": ("status",),
+}
+# How each field is named in error messages
+_COLUMN_LABELS = {
+    "admission_no": "admission_no", "name": "Name", "class_name": "Class", "paid_total": "PaidTotal",
+    "credit": "Credit", "balance": "Balance", "status": "Status",
+}
+
+
+class StudentsMasterSchema:
+    """Column layout of a STUDENTS_MASTER header row.
+
+    Each field attribute is the field's 1-based column index, or None when
+    the sheet has no such column. `headers` is the header row it was
+    resolved from (trailing blanks dropped).
+    """
+
+    __slots__ = ("headers",) + tuple(STUDENTS_MASTER_COLUMNS)
+
+    def __init__(self, headers: Tuple[Any, ...]):
+        self.headers = headers
+        header_map: Dict[str, int] = {}
+        for idx, h in enumerate(headers, start=1):
+            key = _normalize(str(h)) if h is not None else ""
+            if key:
+                header_map[key] = idx
+        for field, candidates in STUDENTS_MASTER_COLUMNS.items():
+            setattr(self, field, next((header_map[c] for c in candidates if c in header_map), None))
+
+    def missing(self, fields: Iterable[str]) -> List[str]:
+        return [f for f in fields if getattr(self, f) is None]
+
+    def require(self, fields: Iterable[str]) -> None:
+        """Raise ValueError naming every field in `fields` that has no column."""
+        missing = self.missing(fields)
+        if missing:
+            labels = ", ".join(_COLUMN_LABELS[f] for f in missing)
+            raise ValueError(f"Required columns ({labels}) not found in STUDENTS_MASTER (header row: {list(self.headers)})")
+
+
+# Workbook path -> last resolved schema
+_schemas: Dict[str, StudentsMasterSchema] = {}
+_schemas_lock = threading.Lock()
+
+
+def students_master_schema(ws, workbook_path: Optional[str] = None, required: Iterable[str] = ()) -> StudentsMasterSchema:
+    """Return the column layout of STUDENTS_MASTER worksheet `ws`.
+
+    Only the header row is read. The resolved schema is cached per
+    workbook path and reused while that row is unchanged; an edited
+    layout is resolved again. Raises ValueError if a `required` field has
+    no column.
+    """
+    row = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ())
+    headers = tuple(row)
+    while headers and headers[-1] is None:
+        headers = headers[:-1]
+    key = os.path.abspath(workbook_path) if workbook_path is not None else None
+    with _schemas_lock:
+        schema = _schemas.get(key) if key is not None else None
+        if schema is None or schema.headers != headers:
+            schema = StudentsMasterSchema(headers)
+            if key is not None:
+                _schemas[key] = schema
+    schema.require(required)
+    return schema
+
+
+def iter_students_master(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream STUDENTS_MASTER as ledger rows without loading the rest of the workbook.
+
+    Each row is a dict with `admission_no`, `name`, `class_name`, `balance`,
+    `paid_total`, `credit` and `status`. Only the admission number and
+    balance columns are required; missing optional columns read as 0 / "".
+
+    The workbook is opened in read-only mode and only STUDENTS_MASTER is
+    read, value by value, so memory stays flat however many history rows
+    the file carries and load time tracks the number of students.
+
+    Raises ValueError if the sheet or required columns are missing.
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        if "STUDENTS_MASTER" not in wb.sheetnames:
+            raise ValueError("STUDENTS_MASTER sheet not found in workbook")
+        ws = wb["STUDENTS_MASTER"]
+        # Don't trust the stored dimensions: files written by other tools may
+        # understate them, which would silently truncate the read
+        ws.reset_dimensions()
+        schema = students_master_schema(ws, path, required=("admission_no", "balance"))
+        adm_col, bal_col = schema.admission_no, schema.balance
+        paid_col, credit_col, status_col = schema.paid_total, schema.credit, schema.status
+        name_col, class_col = schema.name, schema.class_name
+
+        def value(row, col):
+            # read-only rows are not padded past the last non-empty cell
+            return row[col - 1] if col and col <= len(row) else None
+
+        for row in ws.iter_rows(min_row=2, values_only=True):
+            adm = value(row, adm_col)
+            if adm is None:
+                continue
+            yield {
+                "admission_no": str(adm).strip(),
+                "name": str(value(row, name_col) or ""),
+                "class_name": str(value(row, class_col) or ""),
+                "balance": _to_int(value(row, bal_col)),
+                "paid_total": _to_int(value(row, paid_col)),
+                "credit": _to_int(value(row, credit_col)),
+                "status": value(row, status_col) or "",
+            }
+    finally:
+        wb.close()
+
+
+def read_students_master(path: str) -> List[Dict[str, Any]]:
+    """Read STUDENTS_MASTER into a list of ledger rows (see `iter_students_master`)."""
+    return list(iter_students_master(path))
+
+
+STUDENTS_MASTER_HEADERS = ["Admission_No", "Name", "Class", "PaidTotal", "Credit", "Balance", "Status"]
+HISTORY_HEADERS = {
+    "TRANSACTIONS": ["TxID", "Amount", "Term", "ReferenceOrder", "RemainingCredit", "ReceivedAt"],
+    "ALLOCATIONS": ["TxID", "AdmissionNo", "AllocatedAmount"],
+    "CREDITS": ["TxID", "AdmissionNo", "CreditAmount"],
+}
+
+
+def read_history_rows(path: str, sheet_name: str) -> List[tuple]:
+    """Return the data rows of a history sheet (TRANSACTIONS, ALLOCATIONS, CREDITS).
+
+    Rows come back in the sheet's column order, which is the order of
+    `HISTORY_HEADERS[sheet_name]`. A missing sheet reads as no rows.
+    """
+    from openpyxl import load_workbook
+
+    width = len(HISTORY_HEADERS[sheet_name])
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        if sheet_name not in wb.sheetnames:
+            return []
+        rows = []
+        for row in wb[sheet_name].iter_rows(min_row=2, values_only=True):
+            if not row or row[0] is None:
+                continue
+            rows.append(tuple(row[:width]) + (None,) * (width - len(row)))
+        return rows
+    finally:
+        wb.close()
+
+
+def write_school_workbook(
+    path: str,
+    students: List[Dict[str, Any]],
+    history: Dict[str, List[tuple]],
+) -> None:
+    """Write a complete workbook in the STUDENTS_MASTER/TRANSACTIONS/ALLOCATIONS/CREDITS layout.
+
+    `students` are rows as returned by `read_students_master`; `history`
+    maps each history sheet name to its data rows.
+    """
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "STUDENTS_MASTER"
+    ws.append(STUDENTS_MASTER_HEADERS)
+    for s in students:
+        ws.append([s["admission_no"], s.get("name", ""), s.get("class_name", ""),
+                   s.get("paid_total", 0), s.get("credit", 0), s["balance"], s.get("status", "")])
+    for sheet_name, headers in HISTORY_HEADERS.items():
+        ws = wb.create_sheet(sheet_name)
+        ws.append(headers)
+        for row in history.get(sheet_name, []):
+            ws.append(list(row))
+    wb.save(path)
+
+
+# Custom document property recording the last TxID saved into the workbook
+COMMIT_MARKER = "FeesLastTxID"
+
+
+def read_commit_marker(path: str) -> Optional[str]:
+    """Return the TxID of the last payment saved into the workbook, or None.
+
+    Reads only docProps/custom.xml from the archive, so it costs the same
+    whatever the size of the workbook.
+    """
+    try:
+        with zipfile.ZipFile(path) as zf:
+            data = zf.read("docProps/custom.xml")
+    except (FileNotFoundError, KeyError, zipfile.BadZipFile):
+        return None
+    for prop in ElementTree.fromstring(data):
+        if prop.get("name") == COMMIT_MARKER:
+            return next((child.text for child in prop), None)
     return None
 
 
+def _set_commit_marker(wb, tx_id: str) -> None:
+    from openpyxl.packaging.custom import StringProperty
+
+    props = wb.custom_doc_props
+    if COMMIT_MARKER in props.names:
+        props[COMMIT_MARKER].value = tx_id
+    else:
+        props.append(StringProperty(name=COMMIT_MARKER, value=tx_id))
+
+
+def save_workbook_atomic(wb, path: Path) -> None:
+    """Save `wb` to a temp file next to `path`, fsync it and rename it over `path`.
+
+    A crash mid-save leaves the previous workbook intact instead of a
+    truncated file.
+    """
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.tmp")
+    try:
+        wb.save(tmp)
+        with open(tmp, "rb") as fh:
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    if hasattr(os, "O_DIRECTORY"):
+        # Make the rename itself durable
+        fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class StudentColumns:
+    """The numeric STUDENTS_MASTER columns of an open worksheet as int64 arrays.
+
+    The sheet is read once, each value converted once; `add` then applies
+    amounts per admission number with numpy, and `write_back` derives the
+    status of the selected rows in one pass and writes only the cells whose
+    value changed. Slot i is sheet row i + 2; for a duplicated admission
+    number the last row wins, as it always has.
+    """
+
+    __slots__ = ("ws", "schema", "index", "raw", "paid_total", "credit", "balance")
+
+    FIELDS = ("paid_total", "credit", "balance", "status")
+
+    def __init__(self, ws, schema: StudentsMasterSchema):
+        import numpy as np
+
+        self.ws = ws
+        self.schema = schema
+        self.index: Dict[str, int] = {}
+        cols = [getattr(schema, f) for f in self.FIELDS]
+        adm_col = schema.admission_no
+        raw: List[tuple] = []
+        for slot, row in enumerate(ws.iter_rows(min_row=2, values_only=True)):
+            adm = row[adm_col - 1] if adm_col <= len(row) else None
+            if adm is not None:
+                self.index[str(adm).strip()] = slot
+            raw.append(tuple(row[c - 1] if c and c <= len(row) else None for c in cols))
+        self.raw = raw
+        for i, field in enumerate(self.FIELDS[:3]):
+            setattr(self, field, np.fromiter((_to_int(r[i]) for r in raw), dtype=np.int64, count=len(raw)))
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def add(self, field: str, admission_nos: List[str], amounts: List[int]):
+        """Add `amounts` to `field` for each admission number; returns the rows touched."""
+        import numpy as np
+
+        touched = np.zeros(len(self), dtype=bool)
+        if admission_nos:
+            slots = np.fromiter((self.index[a] for a in admission_nos), dtype=np.intp, count=len(admission_nos))
+            np.add.at(getattr(self, field), slots, np.asarray(amounts, dtype=np.int64))
+            touched[slots] = True
+        return touched
+
+    def write_back(self, rows=None) -> int:
+        """Write the columns and derived status of `rows` (a mask; default all) to the sheet.
+
+        Returns the number of rows with at least one changed cell.
+        """
+        import numpy as np
+
+        slots = np.arange(len(self)) if rows is None else np.flatnonzero(rows)
+        statuses = statuses_for_balances(self.balance[slots])
+        columns = [getattr(self.schema, f) for f in self.FIELDS]
+        values = [getattr(self, f)[slots].tolist() for f in self.FIELDS[:3]] + [statuses.tolist()]
+        changed = 0
+        for i, slot in enumerate(slots.tolist()):
+            raw = self.raw[slot]
+            dirty = False
+            for j, col in enumerate(columns):
+                value = values[j][i]
+                if raw[j] != value:
+                    self.ws.cell(row=slot + 2, column=col, value=value)
+                    dirty = True
+            changed += dirty
+        return changed
+
+
+def recompute_students_master(
+    workbook_path: str,
+    allocations: Iterable[tuple],
+    credits: Iterable[tuple],
+    force: bool = False,
+) -> int:
+    """Rebuild PaidTotal, Credit, Balance and Status for the whole roster from history.
+
+    `allocations` and `credits` are ALLOCATIONS / CREDITS rows (TxID,
+    AdmissionNo, amount), typically every row across the archive and the
+    live sheets. Each student keeps their fees charged (balance + paid +
+    credit as currently recorded); PaidTotal and Credit become the history
+    sums and the balance follows. Status is derived for every row. Rows for
+    admission numbers not on the roster are ignored.
+
+    PaidTotal or Credit on the roster that the history does not account for
+    (opening amounts carried over from before the app, or a hand edit) would
+    be lost, so the recompute refuses to run with a ValueError naming those
+    students; `force=True` rebuilds them from the history anyway.
+
+    The workbook is saved once, atomically, and only if something changed.
+    Returns the number of students whose row changed.
+    """
+    import numpy as np
+    from openpyxl import load_workbook
+
+    wb_path = Path(workbook_path)
+    if not wb_path.exists():
+        raise FileNotFoundError(f"Excel file not found: {workbook_path}")
+    wb = load_workbook(wb_path)
+    if "STUDENTS_MASTER" not in wb.sheetnames:
+        raise ValueError("STUDENTS_MASTER sheet not found in workbook")
+    ws = wb["STUDENTS_MASTER"]
+    schema = students_master_schema(ws, workbook_path, required=("admission_no", "paid_total", "credit", "balance", "status"))
+    students = StudentColumns(ws, schema)
+
+    charged = students.balance + students.paid_total + students.credit
+    # Rows without an admission number (or shadowed by a later duplicate) are left alone
+    listed = np.zeros(len(students), dtype=bool)
+    listed[list(students.index.values())] = True
+    disagree = np.zeros(len(students), dtype=bool)
+    for field, rows in (("paid_total", allocations), ("credit", credits)):
+        adms: List[str] = []
+        amounts: List[int] = []
+        for row in rows:
+            adm = str(row[1]).strip() if row[1] is not None else None
+            if adm in students.index:
+                adms.append(adm)
+                amounts.append(_to_int(row[2]))
+        column = getattr(students, field)
+        recorded = column.copy()
+        column[listed] = 0
+        students.add(field, adms, amounts)
+        disagree |= column != recorded
+    if disagree.any() and not force:
+        names = {slot: adm for adm, slot in students.index.items()}
+        slots = np.flatnonzero(disagree)
+        shown = ", ".join(names[s] for s in slots[:10]) + (", ..." if len(slots) > 10 else "")
+        raise ValueError(
+            f"PaidTotal/Credit of {len(slots)} student(s) on STUDENTS_MASTER disagree with the "
+            f"ALLOCATIONS/CREDITS history ({shown}); recompute with force=True to rebuild them from history"
+        )
+    students.balance = charged - students.paid_total - students.credit
+    changed = students.write_back()
+    if changed:
+        save_workbook_atomic(wb, wb_path)
+    wb.close()
+    return changed
+
+
+def _validate_payment(
+    amount: int,
+    reference_order: List[str],
+    allocations: Dict[str, int],
+    remaining_credit: int,
+) -> None:
+    if not isinstance(amount, int) or amount < 0:
+        raise ValueError("amount must be a non-negative int")
+    if not isinstance(remaining_credit, int) or remaining_credit < 0:
+        raise ValueError("remaining_credit must be a non-negative int")
+    if not isinstance(reference_order, list) or not all(isinstance(r, str) for r in reference_order):
+        raise ValueError("reference_order must be a list of strings")
+    if not isinstance(allocations, dict):
+        raise ValueError("allocations must be a dict mapping admission_no to int")
+
+
+def _get_or_create_sheet(wb, name: str, headers: List[str]):
+    if name not in wb.sheetnames:
+        ws = wb.create_sheet(name)
+        ws.append(headers)
+        return ws
+    ws = wb[name]
+    # Sheets written before a column was added get the missing header cells
+    for idx, header in enumerate(headers, start=1):
+        if ws.cell(row=1, column=idx).value is None:
+            ws.cell(row=1, column=idx, value=header)
+    return ws
+
+
 def apply_payment_to_excel(
     workbook_path: str,
     tx_id: str,
@@ -59,18 +471,45 @@ def apply_payment_to_excel(
 
     Raises ValueError for missing expected sheets/columns or invalid inputs.
     """
-    if not isinstance(amount, int) or amount < 0:
-        raise ValueError("amount must be a non-negative int")
-    if not isinstance(remaining_credit, int) or remaining_credit < 0:
-        raise ValueError("remaining_credit must be a non-negative int")
-    if not isinstance(reference_order, list) or not all(isinstance(r, str) for r in reference_order):
-        raise ValueError("reference_order must be a list of strings")
-    if not isinstance(allocations, dict):
-        raise ValueError("allocations must be a dict mapping admission_no to int")
+    apply_payments_to_excel(workbook_path, [{
+        "tx_id": tx_id,
+        "amount": amount,
+        "reference_order": reference_order,
+        "allocations": allocations,
+        "remaining_credit": remaining_credit,
+        "term": term,
+    }])
+
+
+def apply_payments_to_excel(
+    workbook_path: str,
+    payments: List[Dict[str, Any]],
+    before_save: Optional[Callable[[Any], None]] = None,
+) -> None:
+    """Persist a batch of allocation results in a single load/save cycle.
+
+    Each payment is a dict with the keyword arguments of `apply_payment_to_excel`
+    (`tx_id`, `amount`, `reference_order`, `allocations`, `remaining_credit`,
+    `term`) and optionally `received_at` (ISO timestamp). Payments are applied in order, exactly as if
+    `apply_payment_to_excel` had been called once per payment. All payments
+    are validated before the workbook is touched. `before_save`, if given,
+    is called with the open workbook just before it is saved.
+
+    The save is atomic (see `save_workbook_atomic`) and records the last
+    payment's TxID as the workbook's commit marker (`read_commit_marker`).
+
+    Raises ValueError for missing expected sheets/columns or invalid inputs.
+    """
+    for p in payments:
+        _validate_payment(p["amount"], p["reference_order"], p["allocations"], p["remaining_credit"])
 
     wb_path = Path(workbook_path)
     if not wb_path.exists():
         raise FileNotFoundError(f"Excel file not found: {workbook_path}")
+    if not payments:
+        return
+
+    from openpyxl import load_workbook
 
     wb = load_workbook(wb_path)
 
@@ -78,147 +517,58 @@ def apply_payment_to_excel(
     if "STUDENTS_MASTER" not in wb.sheetnames:
         raise ValueError("STUDENTS_MASTER sheet not found in workbook")
     ws_students = wb["STUDENTS_MASTER"]
-    header_map = _find_header_map(ws_students)
-
-    adm_col = _get_col_index_by_candidates(header_map, ["admission_no", "admissionno", "admission", "admissionnumber", "admissionno"])
-    paid_col = _get_col_index_by_candidates(header_map, ["paidtotal", "paid_total", "paidtotal"])
-    credit_col = _get_col_index_by_candidates(header_map, ["credit"])
-    balance_col = _get_col_index_by_candidates(header_map, ["balance"])
-    status_col = _get_col_index_by_candidates(header_map, ["status"])
-
-    if adm_col is None or paid_col is None or credit_col is None or balance_col is None or status_col is None:
-        raise ValueError("Required columns (admission_no, PaidTotal, Credit, Balance, Status) not all present in STUDENTS_MASTER")
-
-    # Build admission_no -> row index map
-    adm_row_map = {}
-    for row in range(2, ws_students.max_row + 1):
-        cell = ws_students.cell(row=row, column=adm_col).value
-        if cell is None:
-            continue
-        adm_row_map[str(cell).strip()] = row
-
-    # Update students based on allocations
-    # Keep track of credit increments to apply later if remaining_credit split
-    credit_increments: Dict[str, int] = {}
-
-    for adm, alloc_amt in allocations.items():
-        if not isinstance(adm, str):
-            raise ValueError("allocation keys must be admission numbers (strings)")
-        if not isinstance(alloc_amt, int) or alloc_amt < 0:
-            raise ValueError("allocation amounts must be non-negative ints")
-        row = adm_row_map.get(adm)
-        if row is None:
-            raise ValueError(f"admission_no '{adm}' not found in STUDENTS_MASTER")
-
-        # Read existing values
-        old_paid = ws_students.cell(row=row, column=paid_col).value or 0
-        old_credit = ws_students.cell(row=row, column=credit_col).value or 0
-        old_balance = ws_students.cell(row=row, column=balance_col).value or 0
-
-        # Ensure numeric types
-        try:
-            old_paid = int(old_paid)
-        except Exception:
-            old_paid = 0
-        try:
-            old_credit = int(old_credit)
-        except Exception:
-            old_credit = 0
-        try:
-            old_balance = int(old_balance)
-        except Exception:
-            old_balance = 0
-
-        new_paid = old_paid + alloc_amt
-        # Allocation reduces the outstanding balance
-        new_balance = old_balance - alloc_amt
-
-        ws_students.cell(row=row, column=paid_col, value=new_paid)
-        ws_students.cell(row=row, column=balance_col, value=new_balance)
-
-        # Temporarily leave credit unchanged; credits from remaining_credit handled below
-        # Set status based on new_balance (PARTIAL / PAID / OVERPAID)
-        if new_balance > 0:
-            status_val = "PARTIAL"
-        elif new_balance == 0:
-            status_val = "PAID"
-        else:
-            status_val = "OVERPAID"
-        ws_students.cell(row=row, column=status_col, value=status_val)
-
-    # Handle remaining_credit splitting across reference_order if any
-    credits_appended: Dict[str, int] = {}
-    if remaining_credit > 0 and reference_order:
-        refs = [r for r in reference_order if r in adm_row_map]
-        if refs:
-            n = len(refs)
-            base = remaining_credit // n
-            rem = remaining_credit % n
-            for idx, adm in enumerate(refs):
-                share = base + (1 if idx < rem else 0)
-                if share <= 0:
-                    continue
-                row = adm_row_map[adm]
-                old_credit = ws_students.cell(row=row, column=credit_col).value or 0
-                try:
-                    old_credit = int(old_credit)
-                except Exception:
-                    old_credit = 0
-                new_credit = old_credit + share
-                ws_students.cell(row=row, column=credit_col, value=new_credit)
-
-                # Adjust balance as credits reduce outstanding
-                old_balance = ws_students.cell(row=row, column=balance_col).value or 0
-                try:
-                    old_balance = int(old_balance)
-                except Exception:
-                    old_balance = 0
-                new_balance = old_balance - share
-                ws_students.cell(row=row, column=balance_col, value=new_balance)
-
-                # Update status based on new_balance (PARTIAL / PAID / OVERPAID)
-                if new_balance > 0:
-                    status_val = "PARTIAL"
-                elif new_balance == 0:
-                    status_val = "PAID"
-                else:
-                    status_val = "OVERPAID"
-                ws_students.cell(row=row, column=status_col, value=status_val)
-
-                credits_appended[adm] = share
-
-    # Append to TRANSACTIONS sheet
-    tx_sheet_name = "TRANSACTIONS"
-    if tx_sheet_name not in wb.sheetnames:
-        ws_tx = wb.create_sheet(tx_sheet_name)
-        ws_tx.append(["TxID", "Amount", "Term", "ReferenceOrder", "RemainingCredit"])
-    else:
-        ws_tx = wb[tx_sheet_name]
-
-    ref_joined = "|".join(reference_order)
-    ws_tx.append([tx_id, amount, term, ref_joined, remaining_credit])
-
-    # Append to ALLOCATIONS sheet (one row per allocation)
-    alloc_sheet_name = "ALLOCATIONS"
-    if alloc_sheet_name not in wb.sheetnames:
-        ws_alloc = wb.create_sheet(alloc_sheet_name)
-        ws_alloc.append(["TxID", "AdmissionNo", "AllocatedAmount"])
-    else:
-        ws_alloc = wb[alloc_sheet_name]
-
-    for adm, alloc_amt in allocations.items():
-        ws_alloc.append([tx_id, adm, alloc_amt])
-
-    # Append to CREDITS sheet if any credits were applied or remaining_credit>0
-    credit_sheet_name = "CREDITS"
-    if credit_sheet_name not in wb.sheetnames:
-        ws_cred = wb.create_sheet(credit_sheet_name)
-        ws_cred.append(["TxID", "AdmissionNo", "CreditAmount"])
-    else:
-        ws_cred = wb[credit_sheet_name]
-
-    for adm, share in credits_appended.items():
-        ws_cred.append([tx_id, adm, share])
-
-    # Save workbook (open -> modify -> save)
-    wb.save(wb_path)
+    schema = students_master_schema(
+        ws_students, workbook_path, required=("admission_no", "paid_total", "credit", "balance", "status")
+    )
+    students = StudentColumns(ws_students, schema)
+
+    ws_tx = _get_or_create_sheet(wb, "TRANSACTIONS", HISTORY_HEADERS["TRANSACTIONS"])
+    ws_alloc = _get_or_create_sheet(wb, "ALLOCATIONS", HISTORY_HEADERS["ALLOCATIONS"])
+    ws_cred = _get_or_create_sheet(wb, "CREDITS", HISTORY_HEADERS["CREDITS"])
+
+    # Allocations and credit shares are additive, so the batch is collected
+    # first and applied to the columns in one vectorized step
+    paid_adms: List[str] = []
+    paid_amounts: List[int] = []
+    credit_adms: List[str] = []
+    credit_amounts: List[int] = []
+    for p in payments:
+        tx_id = p["tx_id"]
+        reference_order = p["reference_order"]
+        allocations = p["allocations"]
+        remaining_credit = p["remaining_credit"]
+
+        for adm, alloc_amt in allocations.items():
+            if not isinstance(adm, str):
+                raise ValueError("allocation keys must be admission numbers (strings)")
+            if not isinstance(alloc_amt, int) or alloc_amt < 0:
+                raise ValueError("allocation amounts must be non-negative ints")
+            if adm not in students.index:
+                raise ValueError(f"admission_no '{adm}' not found in STUDENTS_MASTER")
+            paid_adms.append(adm)
+            paid_amounts.append(alloc_amt)
+
+        # Split remaining_credit across the referenced students that exist
+        shares = split_credit(remaining_credit, [r for r in reference_order if r in students.index])
+        credit_adms.extend(shares)
+        credit_amounts.extend(shares.values())
+
+        # Append to TRANSACTIONS, ALLOCATIONS (one row per allocation) and CREDITS
+        ws_tx.append([tx_id, p["amount"], p["term"], "|".join(reference_order), remaining_credit, p.get("received_at")])
+        for adm, alloc_amt in allocations.items():
+            ws_alloc.append([tx_id, adm, alloc_amt])
+        for adm, share in shares.items():
+            ws_cred.append([tx_id, adm, share])
+
+    touched = students.add("paid_total", paid_adms, paid_amounts)
+    touched |= students.add("credit", credit_adms, credit_amounts)
+    # Allocations and credits both reduce the outstanding balance
+    students.add("balance", paid_adms + credit_adms, [-a for a in paid_amounts + credit_amounts])
+    students.write_back(touched)
+
+    if before_save is not None:
+        before_save(wb)
+
+    # Save workbook once for the whole batch
+    _set_commit_marker(wb, str(payments[-1]["tx_id"]))
+    save_workbook_atomic(wb, wb_path)
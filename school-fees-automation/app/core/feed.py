@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+from array import array
+from typing import Any, Dict, List, Optional
+
+from app.core.journal import PaymentJournal
+
+
+def feed_path_for(workbook_path: str) -> str:
+    return str(workbook_path) + ".feed"
+
+
+class ChangeFeed:
+    """Ordered, append-only log of committed payments for downstream consumers.
+
+    Every payment applied to the ledger becomes one event: its TxID, the
+    allocations and credit shares, and each touched student's balance,
+    status, PaidTotal and Credit right after it. Events carry a sequence
+    number that increases by one per event across every process serving the
+    ledger, and are appended (fsync'd) to a JSON-lines file next to it.
+
+    The feed is a ledger listener: `payment_applied` only buffers the
+    event, and the writer calls `commit` under its lock once the payment is
+    journalled, which is what assigns the sequence number. Payments are
+    replayed from the journal after a reload or a crash; an event already in
+    the log (by TxID) is not written again, and one a crash kept out of it
+    is written on replay.
+
+    A published payment the writer later takes back (its journal entry is
+    parked in suspense, see `WriteBehindWriter.sync`) gets a retraction
+    event, `{"seq", "tx_id", "retracted": true, "reason"}`; consumers undo
+    its earlier event, and the TxID may then be published again when the
+    payment is re-processed.
+
+    `read(after)` resumes from a sequence number through an in-memory
+    seq -> byte offset index, so catching up costs one seek.
+    """
+
+    def __init__(self, path: str):
+        self.journal = PaymentJournal(path)
+        self._lock = threading.Lock()
+        self._buffer: List[Dict[str, Any]] = []
+        self._tx_ids = set()
+        # _offsets[i] is the byte offset of event seq i + 1; _end where reading resumes
+        self._offsets = array("q")
+        self._end = 0
+
+    # Ledger listener interface
+
+    def ledger_loaded(self, ledger) -> None:
+        pass
+
+    def payment_applied(self, ledger, entry: Dict[str, Any], shares: Dict[str, int], before) -> None:
+        students = {}
+        for adm in before:
+            rec = ledger.get(adm)
+            students[adm] = {"balance": rec.balance, "status": rec.status,
+                             "paid_total": rec.paid_total, "credit": rec.credit}
+        event = {
+            "tx_id": entry["tx_id"],
+            "amount": entry["amount"],
+            "term": entry["term"],
+            "received_at": entry.get("received_at"),
+            "reference_order": entry["reference_order"],
+            "allocations": entry["allocations"],
+            "credits": shares,
+            "students": students,
+        }
+        with self._lock:
+            self._buffer.append(event)
+
+    # Log
+
+    def _refresh(self) -> None:
+        # Index events appended since we last looked, by us or another process
+        if not self.journal.path.exists():
+            return
+        with open(self.journal.path, "rb") as fh:
+            fh.seek(self._end)
+            data = fh.read()
+        pos = 0
+        while True:
+            nl = data.find(b"\n", pos)
+            if nl < 0:
+                break
+            line = data[pos:nl]
+            if line.strip():
+                event = json.loads(line)
+                self._offsets.append(self._end + pos)
+                if event.get("retracted"):
+                    self._tx_ids.discard(event["tx_id"])
+                else:
+                    self._tx_ids.add(event["tx_id"])
+            pos = nl + 1
+        self._end += pos
+
+    def commit(self) -> int:
+        """Append buffered events not in the log yet, numbering them. Returns how many.
+
+        Must be called under the ledger writer's lock, which orders the
+        log across processes.
+        """
+        with self._lock:
+            if not self._buffer:
+                return 0
+            buffer, self._buffer = self._buffer, []
+            self._refresh()
+            events = []
+            for event in buffer:
+                if event["tx_id"] in self._tx_ids:
+                    continue
+                self._tx_ids.add(event["tx_id"])
+                events.append({"seq": len(self._offsets) + len(events) + 1, **event})
+            if events:
+                self.journal.extend(events)
+                self._refresh()
+            return len(events)
+
+    def retract(self, tx_ids: List[str], reason: str) -> int:
+        """Append a retraction event for each published TxID. Returns how many.
+
+        Must be called under the ledger writer's lock, like `commit`.
+        """
+        with self._lock:
+            self._refresh()
+            events = []
+            for tx_id in tx_ids:
+                if tx_id not in self._tx_ids:
+                    continue
+                self._tx_ids.discard(tx_id)
+                events.append({"seq": len(self._offsets) + len(events) + 1, "tx_id": tx_id,
+                               "retracted": True, "reason": reason})
+            if events:
+                self.journal.extend(events)
+                self._refresh()
+            return len(events)
+
+    def discard(self) -> None:
+        """Drop buffered events of payments that were not committed."""
+        with self._lock:
+            self._buffer.clear()
+
+    def last_seq(self) -> int:
+        with self._lock:
+            if self.journal.path.exists() and os.path.getsize(self.journal.path) != self._end:
+                self._refresh()
+            return len(self._offsets)
+
+    def read(self, after: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return events with seq > `after`, oldest first, at most `limit` of them."""
+        if after < 0:
+            raise ValueError("after must be a non-negative sequence number")
+        with self._lock:
+            self._refresh()
+            if after >= len(self._offsets):
+                return []
+            start = self._offsets[after]
+            stop = len(self._offsets) if limit is None else min(len(self._offsets), after + limit)
+            end = self._offsets[stop] if stop < len(self._offsets) else self._end
+            with open(self.journal.path, "rb") as fh:
+                fh.seek(start)
+                data = fh.read(end - start)
+        return [json.loads(line) for line in data.splitlines() if line.strip()]
@@ -0,0 +1,93 @@
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _lock_fd(fd: int, blocking: bool = True) -> bool:
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+    while True:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            # LK_LOCK gives up after ~10s; keep waiting like flock does
+            time.sleep(0.05)
+
+
+def _unlock_fd(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class FileLock:
+    """Exclusive lock shared by every process that opens the same `path`.
+
+    The lock is reentrant within a process: nested `with lock:` blocks in
+    the same thread only take the OS-level lock once, and other threads in
+    the process wait on an in-process lock first.
+    """
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._owner = None
+        self._fh = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Take the lock. With `blocking=False`, return False instead of waiting."""
+        if not self._rlock.acquire(blocking):
+            return False
+        if self._depth == 0:
+            try:
+                fh = open(self.path, "a+b")
+                try:
+                    locked = _lock_fd(fh.fileno(), blocking)
+                except BaseException:
+                    fh.close()
+                    raise
+            except BaseException:
+                self._rlock.release()
+                raise
+            if not locked:
+                fh.close()
+                self._rlock.release()
+                return False
+            self._fh = fh
+            self._owner = threading.get_ident()
+        self._depth += 1
+        return True
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0:
+            self._owner = None
+            _unlock_fd(self._fh.fileno())
+            self._fh.close()
+            self._fh = None
+        self._rlock.release()
+
+    def owned(self) -> bool:
+        """True if the calling thread holds the lock."""
+        return self._owner == threading.get_ident()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.release()
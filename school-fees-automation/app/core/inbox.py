@@ -0,0 +1,70 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.core.journal import PaymentJournal
+
+
+def inbox_path_for(workbook_path: str) -> str:
+    return str(workbook_path) + ".inbox"
+
+
+class PaymentInbox:
+    """Durable record of callbacks acknowledged before they were allocated.
+
+    In async acknowledgement mode a validated callback is appended here
+    (fsync'd) and acknowledged straight away; the payment pipeline then
+    allocates it in the background. Entries whose TransID has been applied
+    are dropped by `compact`, and anything left over after a crash is
+    picked up again by `pending`. A payment that could not be applied is
+    kept as a failure marker so its status can still be reported.
+
+    Callers serialize `accept`, `fail` and `compact` across processes with
+    the ledger writer's lock.
+    """
+
+    def __init__(self, path: str):
+        self.journal = PaymentJournal(path)
+
+    def accept(self, tx_id: str, amount: int, reference_order: List[str], payload: Dict[str, Any]) -> Dict[str, Any]:
+        item = {
+            "tx_id": tx_id,
+            "amount": amount,
+            "reference_order": reference_order,
+            "payload": payload,
+            "accepted_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        self.journal.append(item)
+        return item
+
+    def fail(self, tx_id: str, error: str) -> None:
+        self.journal.append({"tx_id": tx_id, "failed": error})
+
+    def _items(self) -> Dict[str, Dict[str, Any]]:
+        # Failure markers are bare {"tx_id", "failed"} lines after the item
+        items: Dict[str, Dict[str, Any]] = {}
+        for entry in self.journal.read():
+            if "payload" not in entry:
+                if entry["tx_id"] in items:
+                    items[entry["tx_id"]]["failed"] = entry["failed"]
+            else:
+                items.setdefault(entry["tx_id"], entry)
+        return items
+
+    def pending(self, *settled) -> List[Dict[str, Any]]:
+        """Return accepted items, in order, that are not failed nor in any of `settled`."""
+        return [
+            i for i in self._items().values()
+            if "failed" not in i and not any(i["tx_id"] in s for s in settled)
+        ]
+
+    def get(self, tx_id: str) -> Optional[Dict[str, Any]]:
+        return self._items().get(tx_id)
+
+    def compact(self, *settled) -> int:
+        """Drop items whose TransID is in any of `settled` (applied, parked). Returns how many remain."""
+        items = [i for i in self._items().values() if not any(i["tx_id"] in s for s in settled)]
+        if not items:
+            self.journal.truncate()
+        else:
+            self.journal.rewrite(items)
+        return len(items)
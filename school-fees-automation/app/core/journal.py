@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+class PaymentJournal:
+    """Append-only JSON-lines journal of allocation results.
+
+    Every `append` is flushed and fsync'd before it returns, so an entry that
+    has been appended survives a crash. Entries stay in the journal until
+    `truncate` drops them after they have been persisted elsewhere.
+
+    Offsets are byte positions, so a reader can pick up only the entries
+    appended since it last looked (possibly by another process).
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _truncate_torn_tail(fh) -> None:
+        # A crash mid-append can leave a partial last line; cut it off so the
+        # next append starts on a fresh line.
+        size = fh.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        fh.seek(size - 1)
+        if fh.read(1) == b"\n":
+            return
+        fh.seek(0)
+        data = fh.read()
+        fh.truncate(data.rfind(b"\n") + 1)
+
+    def append(self, entry: Dict[str, Any]) -> int:
+        """Durably append `entry`. Returns the journal's end offset."""
+        return self.extend([entry])
+
+    def extend(self, entries: Iterable[Dict[str, Any]]) -> int:
+        """Durably append several entries with a single fsync. Returns the end offset."""
+        data = b"".join((json.dumps(e, separators=(",", ":")) + "\n").encode("utf-8") for e in entries)
+        with self._lock:
+            with open(self.path, "a+b") as fh:
+                self._truncate_torn_tail(fh)
+                fh.write(data)
+                fh.flush()
+                os.fsync(fh.fileno())
+                return fh.tell()
+
+    def read_from(self, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """Return entries appended at or after `offset`, and the offset to resume from.
+
+        A partial trailing line is not consumed.
+        """
+        with self._lock:
+            if not self.path.exists():
+                return [], 0
+            with open(self.path, "rb") as fh:
+                fh.seek(offset)
+                data = fh.read()
+            end = data.rfind(b"\n") + 1
+            entries = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+            return entries, offset + end
+
+    def read(self) -> List[Dict[str, Any]]:
+        """Return all journalled entries in append order."""
+        return self.read_from(0)[0]
+
+    def truncate(self) -> None:
+        """Drop every entry once they have all been persisted."""
+        with self._lock:
+            if not self.path.exists():
+                return
+            with open(self.path, "r+b") as fh:
+                fh.truncate(0)
+                fh.flush()
+                os.fsync(fh.fileno())
+
+    def rewrite(self, entries: Iterable[Dict[str, Any]]) -> None:
+        """Atomically replace the journal's contents with `entries`."""
+        data = b"".join((json.dumps(e, separators=(",", ":")) + "\n").encode("utf-8") for e in entries)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with self._lock:
+            with open(tmp, "wb") as fh:
+                fh.write(data)
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmp, self.path)
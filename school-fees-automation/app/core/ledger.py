@@ -0,0 +1,235 @@
+import os
+import threading
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Union
+
+from app.core.allocator import split_credit, status_for_balance
+from app.core.storage import LedgerBackend, open_backend
+
+
+class StudentRecord:
+    __slots__ = ("admission_no", "name", "class_name", "balance", "paid_total", "credit", "status")
+
+    def __init__(
+        self,
+        admission_no: str,
+        balance: int,
+        paid_total: int = 0,
+        credit: int = 0,
+        status: str = "",
+        name: str = "",
+        class_name: str = "",
+    ):
+        self.admission_no = admission_no
+        self.name = name
+        self.class_name = class_name
+        self.balance = balance
+        self.paid_total = paid_total
+        self.credit = credit
+        self.status = status
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "admission_no": self.admission_no,
+            "name": self.name,
+            "class_name": self.class_name,
+            "balance": self.balance,
+            "paid_total": self.paid_total,
+            "credit": self.credit,
+            "status": self.status,
+        }
+
+
+class StudentLedger:
+    """In-memory index of STUDENTS_MASTER keyed by admission_no.
+
+    The ledger is loaded once from its storage backend (the workbook by
+    default) and then updated in place as payments are applied, so the
+    callback path never re-reads storage. The backend's signature (file
+    mtime/size for a workbook) is remembered at load time; if someone edits
+    the data outside the app, `refresh_if_changed` reloads it.
+    """
+
+    def __init__(self, backend: Union[LedgerBackend, str]):
+        self.backend = open_backend(backend) if isinstance(backend, str) else backend
+        self._records: Dict[str, StudentRecord] = {}
+        self._signature: Optional[Hashable] = None
+        self._lock = threading.RLock()
+        self._listeners: List[Any] = []
+
+    def add_listener(self, listener: Any) -> None:
+        """Register an observer of ledger changes.
+
+        `listener.ledger_loaded(ledger)` is called after every (re)load and
+        `listener.payment_applied(ledger, entry, shares, before)` after every
+        `apply_entry`, where `before` maps each touched admission_no to its
+        (balance, status) prior to the payment.
+        """
+        self._listeners.append(listener)
+
+    @property
+    def loaded(self) -> bool:
+        return self._signature is not None
+
+    def load(self, pending: Iterable[Dict[str, Any]] = ()) -> List[Dict[str, Any]]:
+        """(Re)load from the workbook, then replay `pending` payments not yet saved to it.
+
+        Returns the pending payments that could not be replayed because
+        their students are no longer on the roster (see `can_apply`).
+        """
+        with self._lock:
+            signature = self.backend.signature()
+            if signature is None:
+                raise FileNotFoundError(f"Ledger not found: {self.backend.path}")
+            records: Dict[str, StudentRecord] = {}
+            for row in self.backend.load_students():
+                # keep first occurrence, like allocate_payment does
+                if row["admission_no"] not in records:
+                    records[row["admission_no"]] = StudentRecord(**row)
+            self._records = records
+            self._signature = signature
+            skipped = []
+            for entry in pending:
+                if self.can_apply(entry):
+                    self.apply_entry(entry)
+                else:
+                    skipped.append(entry)
+            for listener in self._listeners:
+                listener.ledger_loaded(self)
+            return skipped
+
+    def is_stale(self) -> bool:
+        return self._signature is None or self.backend.signature() != self._signature
+
+    def refresh_if_changed(self, pending: Iterable[Dict[str, Any]] = ()) -> bool:
+        """Reload from the workbook if it changed on disk. Returns True if reloaded.
+
+        Pending payments that no longer apply are skipped (see `load`).
+        """
+        with self._lock:
+            if not self.is_stale():
+                return False
+            self.load(pending)
+            return True
+
+    def invalidate(self) -> None:
+        """Force a reload on the next sync."""
+        with self._lock:
+            self._signature = None
+
+    def mark_synced(self) -> None:
+        """Record the backend's current signature after the app itself saved it."""
+        with self._lock:
+            if self._signature is not None:
+                self._signature = self.backend.signature()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, admission_no: str) -> bool:
+        return admission_no in self._records
+
+    def get(self, admission_no: str) -> Optional[StudentRecord]:
+        return self._records.get(admission_no)
+
+    def balances(self) -> Dict[str, int]:
+        """Return a copy of every student's balance, keyed by admission_no."""
+        with self._lock:
+            return {adm: rec.balance for adm, rec in self._records.items()}
+
+    def students_for(self, reference_order: List[str]) -> List[Dict[str, Any]]:
+        """Return `allocate_payment` input rows for the referenced students only."""
+        with self._lock:
+            students = []
+            for adm in reference_order:
+                rec = self._records.get(adm)
+                if rec is not None:
+                    students.append({"admission_no": adm, "balance": rec.balance})
+            return students
+
+    def can_apply(self, entry: Dict[str, Any]) -> bool:
+        """True if every student the entry pays, or credits, is on the roster.
+
+        False when the roster was edited (an admission number renamed or
+        removed) after the payment was allocated.
+        """
+        with self._lock:
+            if any(adm not in self._records for adm in entry["allocations"]):
+                return False
+            return not entry["remaining_credit"] or any(r in self._records for r in entry["reference_order"])
+
+    def apply_entry(self, entry: Dict[str, Any]) -> Dict[str, int]:
+        """Apply a journal entry (see `apply_allocation`) and notify listeners."""
+        with self._lock:
+            if not self._listeners:
+                return self.apply_allocation(entry["reference_order"], entry["allocations"], entry["remaining_credit"])
+            touched = set(entry["allocations"]) | set(entry["reference_order"])
+            before = {
+                adm: (self._records[adm].balance, self._records[adm].status)
+                for adm in touched if adm in self._records
+            }
+            shares = self.apply_allocation(entry["reference_order"], entry["allocations"], entry["remaining_credit"])
+            for listener in self._listeners:
+                listener.payment_applied(self, entry, shares, before)
+            return shares
+
+    def records(self) -> List[StudentRecord]:
+        with self._lock:
+            return list(self._records.values())
+
+    def apply_allocation(
+        self,
+        reference_order: List[str],
+        allocations: Dict[str, int],
+        remaining_credit: int,
+    ) -> Dict[str, int]:
+        """Apply an allocation result in place, mirroring `apply_payment_to_excel`.
+
+        Returns the credit shares given to each student from `remaining_credit`.
+        Raises ValueError if an allocation targets an unknown admission_no.
+        """
+        with self._lock:
+            for adm in allocations:
+                if adm not in self._records:
+                    raise ValueError(f"admission_no '{adm}' not found in STUDENTS_MASTER")
+            for adm, alloc_amt in allocations.items():
+                rec = self._records[adm]
+                rec.paid_total += alloc_amt
+                rec.balance -= alloc_amt
+                rec.status = status_for_balance(rec.balance)
+
+            refs = [r for r in reference_order if r in self._records]
+            shares = split_credit(remaining_credit, refs)
+            for adm, share in shares.items():
+                rec = self._records[adm]
+                rec.credit += share
+                rec.balance -= share
+                rec.status = status_for_balance(rec.balance)
+            return shares
+
+
+_ledgers: Dict[str, StudentLedger] = {}
+_ledgers_lock = threading.Lock()
+
+
+def get_ledger(workbook_path: str) -> StudentLedger:
+    """Return the process-wide ledger for `workbook_path`.
+
+    The ledger is not loaded here; the workbook's writer syncs it (see
+    `persistence.current_ledger`) so payments pending in the write-behind
+    journal are replayed on top of the workbook.
+    """
+    key = os.path.abspath(workbook_path)
+    with _ledgers_lock:
+        ledger = _ledgers.get(key)
+        if ledger is None:
+            ledger = StudentLedger(workbook_path)
+            _ledgers[key] = ledger
+    return ledger
+
+
+def discard_ledger(workbook_path: str, ledger: StudentLedger) -> None:
+    """Drop `ledger` from the process-wide registry if it is still the registered one."""
+    key = os.path.abspath(workbook_path)
+    with _ledgers_lock:
+        if _ledgers.get(key) is ledger:
+            del _ledgers[key]
@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional
+
+# Quantiles reported for every stage, computed over the most recent
+# WINDOW observations of that stage
+QUANTILES = (0.5, 0.95, 0.99)
+WINDOW = 2048
+
+_NULL = nullcontext()
+
+
+class LatencySummary:
+    """Count, sum and a sliding window of recent observations for one stage."""
+
+    __slots__ = ("count", "total", "window")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.window = deque(maxlen=WINDOW)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.window.append(seconds)
+
+    def quantiles(self) -> Dict[float, float]:
+        values = sorted(self.window)
+        if not values:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: values[min(len(values) - 1, int(q * len(values)))] for q in QUANTILES}
+
+
+class Metrics:
+    """Per-stage latency summaries and event counters for the callback path.
+
+    Recording is a perf_counter call and a deque append per stage; with
+    `enabled` False, `stage` returns a shared no-op context manager unless a
+    trace was requested. Scrape with `render`, which produces the Prometheus
+    text exposition format.
+    """
+
+    def __init__(self, enabled: bool = True, prefix: str = "fees"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._stages: Dict[str, LatencySummary] = {}
+        self._counters: Dict[str, int] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            summary = self._stages.get(stage)
+            if summary is None:
+                summary = self._stages[stage] = LatencySummary()
+            summary.observe(seconds)
+
+    def inc(self, result: str, amount: int = 1) -> None:
+        """Count a callback outcome: ok, accepted, duplicate, rejected or error."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[result] = self._counters.get(result, 0) + amount
+
+    def stage(self, name: str, trace: Optional[Dict[str, float]] = None):
+        """Time a block as stage `name`; also record it in `trace` (ms) if given."""
+        if not self.enabled and trace is None:
+            return _NULL
+        return self._timed(name, trace)
+
+    @contextmanager
+    def _timed(self, name: str, trace: Optional[Dict[str, float]]) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started, trace)
+
+    def record(self, name: str, seconds: float, trace: Optional[Dict[str, float]] = None) -> None:
+        """Record an already measured stage duration."""
+        if self.enabled:
+            self.observe(name, seconds)
+        if trace is not None:
+            trace[name] = round(seconds * 1000, 3)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Return {stage: {count, sum, p50, p95, p99}} in seconds."""
+        with self._lock:
+            stages = {name: (s.count, s.total, s.quantiles()) for name, s in self._stages.items()}
+        return {
+            name: {"count": count, "sum": total, **{f"p{int(q * 100)}": v for q, v in qs.items()}}
+            for name, (count, total, qs) in stages.items()
+        }
+
+    def counters(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            stages = sorted((name, s.count, s.total, s.quantiles()) for name, s in self._stages.items())
+            counters = sorted(self._counters.items())
+        p = self.prefix
+        lines: List[str] = [
+            f"# HELP {p}_stage_seconds Time spent in each stage of the payment callback path.",
+            f"# TYPE {p}_stage_seconds summary",
+        ]
+        for name, count, total, qs in stages:
+            for q, value in qs.items():
+                lines.append(f'{p}_stage_seconds{{stage="{name}",quantile="{q}"}} {value:.6f}')
+            lines.append(f'{p}_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'{p}_stage_seconds_count{{stage="{name}"}} {count}')
+        lines.append(f"# HELP {p}_callbacks_total Payment callbacks by outcome.")
+        lines.append(f"# TYPE {p}_callbacks_total counter")
+        for result, value in counters:
+            lines.append(f'{p}_callbacks_total{{result="{result}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+
+# Set FEES_METRICS=0 to turn recording off
+METRICS = Metrics(enabled=os.environ.get("FEES_METRICS", "1") != "0")
@@ -0,0 +1,368 @@
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.core.dedup import TransactionIndex
+from app.core.feed import ChangeFeed, feed_path_for
+from app.core.filelock import FileLock
+from app.core.journal import PaymentJournal
+from app.core.ledger import StudentLedger, discard_ledger, get_ledger
+from app.core.metrics import METRICS
+from app.core.resolver import AdmissionIndex
+from app.core.storage import LedgerBackend, open_backend
+from app.core.suspense import SuspenseQueue, suspense_path_for
+from app.reports.aggregates import ReportAggregates
+
+# Flush once the backend's batch size is reached, and otherwise every this
+# many seconds while anything is pending.
+DEFAULT_FLUSH_INTERVAL = 2.0
+
+
+def journal_path_for(workbook_path: str) -> str:
+    return str(workbook_path) + ".journal"
+
+
+def lock_path_for(workbook_path: str) -> str:
+    return str(workbook_path) + ".lock"
+
+
+def flush_lock_path_for(workbook_path: str) -> str:
+    return str(workbook_path) + ".flush.lock"
+
+
+class WriteBehindWriter:
+    """Write-behind persistence stage in front of the ledger's storage backend.
+
+    `submit` appends the allocation result to a durable journal, applies it
+    to the in-memory ledger and returns; the backend (the workbook by
+    default) is only written by `flush`, which hands it every pending
+    payment at once - one load/save cycle for a workbook. Flushes happen
+    when `batch_size` payments are pending, every `flush_interval` seconds
+    while the background thread runs, and on `close`.
+
+    The journal and a sidecar lock file are shared by every process serving
+    the same workbook. All reads and writes of shared state happen under
+    `lock`, and `sync` picks up journal entries appended by other processes,
+    so several uvicorn workers see one linear sequence of payments. The
+    backend save itself runs under a second lock, `flush_lock`, so payments
+    keep being journalled while a batch is written.
+    """
+
+    def __init__(
+        self,
+        workbook_path: str,
+        journal_path: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        ledger: Optional[StudentLedger] = None,
+        backend: Optional[LedgerBackend] = None,
+    ):
+        self.workbook_path = str(workbook_path)
+        if backend is None:
+            backend = ledger.backend if ledger is not None else open_backend(workbook_path)
+        self.backend = backend
+        self.journal = PaymentJournal(journal_path or journal_path_for(workbook_path))
+        self.lock = FileLock(lock_path_for(workbook_path))
+        self.flush_lock = FileLock(flush_lock_path_for(workbook_path))
+        self.ledger = ledger or StudentLedger(backend)
+        self.transactions = TransactionIndex(backend)
+        self.reports = ReportAggregates()
+        self.ledger.add_listener(self.reports)
+        self._reports_seeded = False
+        self.admissions = AdmissionIndex()
+        self.ledger.add_listener(self.admissions)
+        self.feed = ChangeFeed(feed_path_for(workbook_path))
+        self.ledger.add_listener(self.feed)
+        self.suspense = SuspenseQueue(suspense_path_for(workbook_path))
+        if self.ledger.loaded:
+            self.admissions.ledger_loaded(self.ledger)
+        self.batch_size = batch_size or backend.batch_size
+        self.flush_interval = flush_interval
+        self._recovered = False
+        # Journal bytes already reflected in the ledger, and how many entries that is
+        self._offset = 0
+        self._pending_count = 0
+        # The journal file read from; a rewrite by another process replaces it
+        self._journal_inode: Optional[int] = None
+        # Set while this process saves a batch: the backend changing is our own doing
+        self._saving = False
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sync(self) -> StudentLedger:
+        """Bring the ledger up to date with the workbook and the journal.
+
+        Reloads the workbook if it changed on disk (an external edit or a
+        flush by another process) and replays journal entries the ledger
+        has not seen yet. The TransID index is refreshed alongside.
+
+        Journalled payments for students no longer on the roster (renamed or
+        removed by an external edit) cannot be replayed; they are moved to
+        the suspense queue, so they do not block every later payment, and
+        retracted from the change feed.
+        """
+        with self.lock:
+            if not self._recovered:
+                self._drop_committed()
+            self.transactions.refresh()
+            if (self.ledger.is_stale() and not self._saving) or self._journal_replaced():
+                entries, self._offset = self.journal.read_from(0)
+                # Entries another process has saved but not yet dropped from the journal
+                done = self.backend.committed_count(entries) if entries else 0
+                orphaned = self.ledger.load(entries[done:])
+                self._pending_count = len(entries)
+                # Payments saved by someone else only show up in the history
+                self._reports_seeded = False
+            else:
+                entries, self._offset = self.journal.read_from(self._offset)
+                orphaned = []
+                for entry in entries:
+                    if self.ledger.can_apply(entry):
+                        self.ledger.apply_entry(entry)
+                    else:
+                        orphaned.append(entry)
+                self._pending_count += len(entries)
+            if orphaned:
+                self._park_orphaned(orphaned)
+                dropped = {e["tx_id"] for e in orphaned}
+                entries = [e for e in entries if e["tx_id"] not in dropped]
+            self.transactions.add_pending(entries)
+            self._journal_inode = self._current_journal_inode()
+            # Replayed payments missing from the change feed (a crash) go in now
+            self.feed.commit()
+            return self.ledger
+
+    def _current_journal_inode(self) -> Optional[int]:
+        try:
+            return os.stat(self.journal.path).st_ino
+        except FileNotFoundError:
+            return None
+
+    def _journal_replaced(self) -> bool:
+        # Offsets into a rewritten journal are meaningless: read it again from the start
+        return self._journal_inode is not None and self._current_journal_inode() != self._journal_inode
+
+    def _park_orphaned(self, orphaned: List[Dict[str, Any]]) -> None:
+        dropped = {e["tx_id"] for e in orphaned}
+        for entry in orphaned:
+            candidates = {}
+            for ref in entry["reference_order"]:
+                if ref not in self.ledger:
+                    res = self.admissions.lookup(ref)
+                    candidates[ref] = [res.admission_no] if res.admission_no else res.candidates
+            self.suspense.add(entry["tx_id"], entry["amount"], entry["reference_order"],
+                              "student not on roster", candidates, payload=entry)
+        remaining = [e for e in self.journal.read() if e["tx_id"] not in dropped]
+        self.journal.rewrite(remaining)
+        self.transactions.forget(sorted(dropped))
+        # Their events were published when first applied; re-processing publishes anew
+        self.feed.retract(sorted(dropped), "student not on roster")
+        self._offset = os.path.getsize(self.journal.path)
+        self._pending_count = len(remaining)
+
+    def _drop_committed(self) -> None:
+        # A crash after the backend saved a batch but before the journal was
+        # truncated leaves entries that are already persisted; replaying them
+        # would apply those payments twice.
+        entries = self.journal.read()
+        if entries and self.backend.exists():
+            done = self.backend.committed_count(entries)
+            if done:
+                # A new file, so other processes re-read it from the start
+                self.journal.rewrite(entries[done:])
+                self._offset = 0
+                self._pending_count = 0
+                self.ledger.invalidate()
+        self._recovered = True
+
+    def recover(self) -> int:
+        """Startup recovery: replay journalled payments the backend does not have yet.
+
+        Entries the backend already persisted are dropped from the journal
+        (see `LedgerBackend.committed_count`), the ledger is rebuilt from the
+        backend plus the rest, and the rest is flushed. Returns the number of
+        payments flushed.
+        """
+        self.sync()
+        return self.flush()
+
+    def report_aggregates(self) -> ReportAggregates:
+        """Return the running report totals, synced with the ledger.
+
+        The first call (and the first after an external change) counts the
+        stored history once; afterwards every payment updates the totals as
+        it is applied.
+        """
+        with self.lock:
+            self.sync()
+            if not self._reports_seeded:
+                self._seed_reports()
+            return self.reports
+
+    def rebuild_reports(self) -> ReportAggregates:
+        """Recount the payment totals from scratch: stored history plus the journal.
+
+        For totals that drifted, e.g. after history was corrected by hand.
+        """
+        with self.lock:
+            self.sync()
+            self.reports.reset_payments()
+            self._seed_reports()
+            # Journalled payments are not in the stored history yet
+            self.reports.add_entries(self.ledger, self.journal.read())
+            return self.reports
+
+    def _seed_reports(self) -> None:
+        self.reports.add_history(
+            self.ledger,
+            self.backend.history_rows("TRANSACTIONS"),
+            self.backend.history_rows("ALLOCATIONS"),
+            self.backend.history_rows("CREDITS"),
+        )
+        self._reports_seeded = True
+
+    def pending(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return self.journal.read()
+
+    def submit(self, entry: Dict[str, Any]) -> Dict[str, int]:
+        """Durably record one allocation result and apply it to the ledger.
+
+        The result must have been computed from the ledger while holding
+        `lock`. It reaches the backend on the next flush. Returns the credit
+        shares applied from `remaining_credit`.
+        """
+        return self.submit_many([entry])[0]
+
+    def submit_many(self, entries: List[Dict[str, Any]]) -> List[Dict[str, int]]:
+        """Like `submit` for a batch of results, journalled with a single fsync."""
+        with self.lock:
+            self.sync()
+            self._offset = self.journal.extend(entries)
+            self._pending_count += len(entries)
+            self.transactions.record_many(entries)
+            try:
+                shares = [self.ledger.apply_entry(e) for e in entries]
+            finally:
+                self.feed.commit()
+            full = self._pending_count >= self.batch_size
+        if full:
+            if self._thread is not None:
+                self._wakeup.set()
+            else:
+                self.flush()
+        return shares
+
+    def flush(self) -> int:
+        """Apply all pending payments to the backend in one batch. Returns the count.
+
+        The batch is read under `lock`, which is then released for the save
+        (only `flush_lock` is held), so callbacks in every worker keep
+        being journalled meanwhile; afterwards just the flushed entries are
+        dropped from the journal. A thread already holding `lock` saves
+        without releasing it, and gets 0 if another process is flushing.
+        """
+        if not self.flush_lock.acquire(blocking=not self.lock.owned()):
+            return 0
+        try:
+            with self.lock:
+                # A flush that died between its save and dropping the batch
+                self._drop_committed()
+                self.sync()
+                batch = self.journal.read()
+                if not batch:
+                    return 0
+                self._saving = True
+            try:
+                with METRICS.stage("flush"):
+                    self.backend.apply_payments(batch)
+            except BaseException:
+                with self.lock:
+                    self._saving = False
+                raise
+            with self.lock:
+                self._saving = False
+                self.ledger.mark_synced()
+                # Payments journalled by other workers during the save
+                self.sync()
+                flushed = {e["tx_id"] for e in batch}
+                remaining = [e for e in self.journal.read() if e["tx_id"] not in flushed]
+                self.journal.rewrite(remaining)
+                self._offset = os.path.getsize(self.journal.path)
+                self._pending_count = len(remaining)
+                self._journal_inode = self._current_journal_inode()
+            return len(batch)
+        finally:
+            self.flush_lock.release()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Entries stay journalled; retry on the next tick
+                time.sleep(self.flush_interval)
+
+    def close(self) -> None:
+        """Stop the background thread and flush everything still pending."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.flush()
+        finally:
+            self.backend.close()
+
+
+_writers: Dict[str, WriteBehindWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(workbook_path: str) -> WriteBehindWriter:
+    """Return the process-wide, already started writer for `workbook_path`."""
+    key = os.path.abspath(workbook_path)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = WriteBehindWriter(workbook_path, ledger=get_ledger(workbook_path))
+            writer.start()
+            _writers[key] = writer
+        return writer
+
+
+def current_ledger(workbook_path: str) -> StudentLedger:
+    """Return the ledger for `workbook_path`, synced with the workbook and journal."""
+    return get_writer(workbook_path).sync()
+
+
+def close_writer(writer: WriteBehindWriter) -> None:
+    """Flush and close one writer and forget it, so its ledger can be freed."""
+    key = os.path.abspath(writer.workbook_path)
+    with _writers_lock:
+        if _writers.get(key) is writer:
+            del _writers[key]
+    try:
+        writer.close()
+    finally:
+        discard_ledger(writer.workbook_path, writer.ledger)
+
+
+def close_writers() -> None:
+    """Flush and stop every writer; called on application shutdown."""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
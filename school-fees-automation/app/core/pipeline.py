@@ -0,0 +1,351 @@
+import asyncio
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from app.core.allocator import allocate_batch, allocate_payment
+from app.core.inbox import PaymentInbox, inbox_path_for
+from app.core.metrics import METRICS
+from app.core.persistence import WriteBehindWriter, close_writer, get_writer
+from app.core.suspense import SuspenseQueue, suspense_path_for
+
+# Callbacks waiting beyond this many queued payments are held back at `submit`
+MAX_QUEUED_PAYMENTS = 1000
+
+
+class PaymentPipeline:
+    """Single-writer pipeline that applies payments strictly one at a time.
+
+    Callbacks `await submit(...)`, which enqueues the payment and waits for
+    its result. One worker task takes payments off the queue in order and
+    runs allocation and persistence on a dedicated thread, so the event loop
+    never blocks on workbook I/O and no two payments ever read the same
+    balances. The writer's file lock extends that guarantee across processes.
+
+    `accept` is the asynchronous alternative to `submit`: the payment is
+    recorded in a durable inbox and queued, and the caller gets control back
+    without waiting for allocation. Inbox items left unapplied by a crash
+    are queued again on `start`; `status` reports where a TransID stands.
+
+    References are matched to the roster through the writer's
+    `AdmissionIndex` first ("41" pays "041"). A payment with a reference
+    that could belong to several students, or with no reference matching any
+    student, is parked in the suspense queue rather than allocated.
+    """
+
+    def __init__(self, workbook_path: str, term: str, writer: Optional[WriteBehindWriter] = None):
+        self.workbook_path = workbook_path
+        self.term = term
+        self._writer = writer
+        self.inbox = PaymentInbox(inbox_path_for(workbook_path))
+        self.suspense = SuspenseQueue(suspense_path_for(workbook_path))
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._inbox_dirty = False
+
+    @property
+    def writer(self) -> WriteBehindWriter:
+        if self._writer is None:
+            self._writer = get_writer(self.workbook_path)
+        return self._writer
+
+    async def start(self) -> None:
+        if self._worker is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=MAX_QUEUED_PAYMENTS)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="payment-pipeline")
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+        if self.inbox.journal.path.exists():
+            await self._replay_inbox()
+
+    async def _replay_inbox(self) -> None:
+        loop = asyncio.get_running_loop()
+        writer = self.writer
+
+        def unapplied():
+            with writer.lock:
+                writer.transactions.refresh()
+                return self.inbox.pending(writer.transactions, self.suspense)
+
+        for item in await loop.run_in_executor(self._executor, unapplied):
+            self._inbox_dirty = True
+            await self._queue.put((
+                item["tx_id"], item["amount"], item["reference_order"], item["payload"], None, time.perf_counter(), None,
+            ))
+
+    async def stop(self) -> None:
+        """Finish every queued payment, then stop the worker."""
+        if self._worker is None:
+            return
+        await self._queue.join()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._executor.shutdown(wait=True)
+        self._worker = None
+        self._executor = None
+        self._queue = None
+
+    async def close(self) -> None:
+        """Stop, then flush and release the writer (and its ledger) if one was opened."""
+        await self.stop()
+        if self._writer is not None:
+            await asyncio.get_running_loop().run_in_executor(None, close_writer, self._writer)
+
+    async def submit(
+        self,
+        tx_id: str,
+        amount: int,
+        reference_order: List[str],
+        trace: Optional[Dict[str, float]] = None,
+        payload: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Queue a payment and return its allocation result once it has been journalled.
+
+        A TransID that was already applied is not allocated again; its
+        original result is returned with `"duplicate": True`. A payment
+        parked in suspense returns `{"suspense": True, "candidates": ...}`.
+        Stage timings go to `METRICS`, and into `trace` (milliseconds) when
+        one is passed. `payload` (the callback) is kept with suspense items.
+        """
+        original = self.writer.transactions.get(tx_id)
+        if original is not None:
+            return {**original, "duplicate": True}
+        if self._worker is None:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((tx_id, amount, reference_order, payload, trace, time.perf_counter(), future))
+        return await future
+
+    async def accept(
+        self,
+        tx_id: str,
+        amount: int,
+        reference_order: List[str],
+        payload: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """Durably record a payment and queue it without waiting for allocation.
+
+        Returns `{"duplicate": True, ...}` with the original result for a
+        TransID that was already applied, `{"accepted": True}` otherwise.
+        """
+        writer = self.writer
+        original = writer.transactions.get(tx_id)
+        if original is not None:
+            return {**original, "duplicate": True}
+        if self._worker is None:
+            await self.start()
+
+        def record():
+            with writer.lock:
+                self.inbox.accept(tx_id, amount, reference_order, payload)
+
+        await asyncio.get_running_loop().run_in_executor(None, record)
+        self._inbox_dirty = True
+        await self._queue.put((tx_id, amount, reference_order, payload, None, time.perf_counter(), None))
+        return {"accepted": True}
+
+    async def park(
+        self,
+        tx_id: str,
+        amount: int,
+        reason: str,
+        payload: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """Park a payment whose reference could not be read at all.
+
+        Returns `{"suspense": True, ...}`, with `"duplicate": True` if the
+        TransID was already parked, or the original result if it was applied.
+        """
+        writer = self.writer
+
+        def record():
+            with writer.lock:
+                writer.transactions.refresh()
+                original = writer.transactions.get(tx_id)
+                if original is not None:
+                    return {**original, "duplicate": True}
+                parked = self.suspense.get(tx_id)
+                if parked is not None:
+                    return {"suspense": True, "candidates": parked["candidates"], "duplicate": True}
+                self.suspense.add(tx_id, amount, [], reason, payload=payload)
+                return {"suspense": True, "candidates": {}}
+
+        return await asyncio.get_running_loop().run_in_executor(None, record)
+
+    def suspended(self) -> List[Dict[str, Any]]:
+        """Return the payments parked in suspense, in arrival order."""
+        with self.writer.lock:
+            return self.suspense.items()
+
+    def reprocess_suspense(self, assign: Optional[Dict[str, List[str]]] = None) -> Dict[str, List[str]]:
+        """Allocate every parked payment that now matches the roster, in one batch.
+
+        Run after STUDENTS_MASTER has been corrected. `assign` maps TransIDs
+        to the admission numbers they should pay, overriding what the payer
+        typed. Items are resolved against the reloaded roster exactly like a
+        callback; those that resolve are allocated in arrival order against
+        one balance state, journalled with a single fsync and saved with a
+        single flush, then dropped from the queue along with any applied in
+        the meantime. Returns the TransIDs `applied` and still `pending`.
+
+        Raises ValueError if `assign` names a TransID that is not parked.
+        """
+        writer = self.writer
+        with writer.lock:
+            ledger = writer.sync()
+            items = self.suspense.items()
+            unknown = set(assign or ()) - {i["tx_id"] for i in items}
+            if unknown:
+                raise ValueError(f"Not in suspense: {', '.join(sorted(unknown))}")
+            ready = []
+            pending: List[str] = []
+            settled: List[str] = []
+            for item in items:
+                tx_id = item["tx_id"]
+                if tx_id in writer.transactions:
+                    settled.append(tx_id)
+                    continue
+                refs = (assign or {}).get(tx_id, item["reference_order"])
+                resolved, ambiguous = writer.admissions.resolve(refs)
+                if ambiguous or not any(r in ledger for r in resolved):
+                    pending.append(tx_id)
+                else:
+                    ready.append((item, resolved))
+
+            results = allocate_batch(ledger.balances(), [(item["amount"], refs) for item, refs in ready])
+            entries = [
+                {
+                    "tx_id": item["tx_id"],
+                    "amount": item["amount"],
+                    "reference_order": refs,
+                    "allocations": result["allocations"],
+                    "remaining_credit": result["remaining_credit"],
+                    "term": self.term,
+                    "received_at": item["received_at"],
+                }
+                for (item, refs), result in zip(ready, results)
+            ]
+            if entries:
+                writer.submit_many(entries)
+            applied = [e["tx_id"] for e in entries]
+            self.suspense.remove(applied + settled)
+        if entries:
+            writer.flush()
+        return {"applied": applied, "pending": pending}
+
+    async def reprocess(self, assign: Optional[Dict[str, List[str]]] = None) -> Dict[str, List[str]]:
+        """`reprocess_suspense` on the pipeline's thread, in turn with queued payments."""
+        if self._worker is None:
+            await self.start()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.reprocess_suspense, assign)
+
+    def status(self, tx_id: str) -> Dict[str, Any]:
+        """Return `{"status": applied|suspense|queued|failed|unknown, ...}` for a TransID."""
+        writer = self.writer
+        with writer.lock:
+            writer.transactions.refresh()
+            result = writer.transactions.get(tx_id)
+            if result is not None:
+                return {"tx_id": tx_id, "status": "applied", **result}
+            parked = self.suspense.get(tx_id)
+            if parked is not None:
+                return {"tx_id": tx_id, "status": "suspense", "reason": parked["reason"],
+                        "candidates": parked["candidates"]}
+            item = self.inbox.get(tx_id)
+        if item is None:
+            return {"tx_id": tx_id, "status": "unknown"}
+        if "failed" in item:
+            return {"tx_id": tx_id, "status": "failed", "error": item["failed"]}
+        return {"tx_id": tx_id, "status": "queued", "accepted_at": item["accepted_at"]}
+
+    def _fail_accepted(self, tx_id: str, error: str) -> None:
+        with self.writer.lock:
+            self.inbox.fail(tx_id, error)
+
+    def _compact_inbox(self) -> None:
+        writer = self.writer
+        with writer.lock:
+            writer.transactions.refresh()
+            self.inbox.compact(writer.transactions, self.suspense)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            tx_id, amount, reference_order, payload, trace, queued_at, future = await self._queue.get()
+            try:
+                result = await loop.run_in_executor(
+                    self._executor, self._process, tx_id, amount, reference_order, payload, trace, queued_at
+                )
+            except Exception as e:
+                if future is None:
+                    # Accepted asynchronously: nobody is waiting, so keep the error for `status`
+                    await loop.run_in_executor(self._executor, self._fail_accepted, tx_id, str(e))
+                elif not future.done():
+                    future.set_exception(e)
+            else:
+                if future is not None and not future.done():
+                    future.set_result(result)
+            finally:
+                if self._inbox_dirty and self._queue.empty():
+                    self._inbox_dirty = False
+                    try:
+                        await loop.run_in_executor(self._executor, self._compact_inbox)
+                    except Exception:
+                        # Applied items are skipped on replay; compact next time
+                        self._inbox_dirty = True
+                self._queue.task_done()
+
+    def _process(
+        self,
+        tx_id: str,
+        amount: int,
+        reference_order: List[str],
+        payload: Optional[Dict[str, Any]] = None,
+        trace: Optional[Dict[str, float]] = None,
+        queued_at: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        if queued_at is not None:
+            METRICS.record("queue", time.perf_counter() - queued_at, trace)
+        writer = self.writer
+        with METRICS.stage("lock", trace):
+            writer.lock.acquire()
+        try:
+            with METRICS.stage("sync", trace):
+                ledger = writer.sync()
+            # Re-check under the lock: a retry may have been queued behind the
+            # original, or applied by another process
+            original = writer.transactions.get(tx_id)
+            if original is not None:
+                return {**original, "duplicate": True}
+            parked = self.suspense.get(tx_id)
+            if parked is not None:
+                return {"suspense": True, "candidates": parked["candidates"], "duplicate": True}
+            with METRICS.stage("resolve", trace):
+                resolved, ambiguous = writer.admissions.resolve(reference_order)
+            if ambiguous or not any(r in ledger for r in resolved):
+                reason = "ambiguous reference" if ambiguous else "no matching student"
+                self.suspense.add(tx_id, amount, reference_order, reason, ambiguous, payload)
+                return {"suspense": True, "candidates": ambiguous}
+            reference_order = resolved
+            with METRICS.stage("lookup", trace):
+                students = ledger.students_for(reference_order)
+            with METRICS.stage("allocate", trace):
+                result = allocate_payment(students, amount, reference_order)
+            with METRICS.stage("journal", trace):
+                writer.submit({
+                    "tx_id": tx_id,
+                    "amount": amount,
+                    "reference_order": reference_order,
+                    "allocations": result["allocations"],
+                    "remaining_credit": result["remaining_credit"],
+                    "term": self.term,
+                    "received_at": datetime.now().isoformat(timespec="seconds"),
+                })
+        finally:
+            writer.lock.release()
+        return result
@@ -0,0 +1,50 @@
+import argparse
+import time
+from pathlib import Path
+from typing import Optional
+
+from app.core.archive import iter_history
+from app.core.excel import recompute_students_master
+from app.core.filelock import FileLock
+from app.core.persistence import flush_lock_path_for, lock_path_for
+
+
+def recompute_roster(workbook_path: str, archive_dir: Optional[Path] = None, force: bool = False) -> int:
+    """End-of-term recompute: rebuild every STUDENTS_MASTER row from the full history.
+
+    Reads ALLOCATIONS and CREDITS across the archive shards and the live
+    workbook and applies them in bulk (see `recompute_students_master`).
+    Holds the writer's `flush_lock` and `lock`, taken in that order like
+    `WriteBehindWriter.flush`, from the load to the save, so it is safe
+    while the server runs: a batch being saved is never overwritten. The
+    server's ledger reloads the saved workbook on its next payment.
+    Returns the number of students whose row changed.
+
+    Raises ValueError, unless `force` is set, when roster totals disagree
+    with the history (see `recompute_students_master`).
+    """
+    with FileLock(flush_lock_path_for(workbook_path)), FileLock(lock_path_for(workbook_path)):
+        return recompute_students_master(
+            workbook_path,
+            iter_history(workbook_path, "ALLOCATIONS", archive_dir=archive_dir),
+            iter_history(workbook_path, "CREDITS", archive_dir=archive_dir),
+            force=force,
+        )
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Recompute PaidTotal, Credit, Balance and Status from history.")
+    parser.add_argument("workbook")
+    parser.add_argument("--force", action="store_true",
+                        help="rebuild totals from history even where they disagree with the roster")
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+    try:
+        changed = recompute_roster(args.workbook, force=args.force)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"{changed} students updated in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import argparse
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.core.allocator import allocate_batch
+from app.core.excel import _normalize
+from app.core.persistence import WriteBehindWriter
+from app.mpesa.parser import loose_reference, parse_references
+
+TX_COLUMNS = ["TransID", "Receipt No.", "Receipt", "TransactionID"]
+AMOUNT_COLUMNS = ["TransAmount", "Paid In", "Amount"]
+REF_COLUMNS = ["BillRefNumber", "A/C No.", "Account No", "AccountNumber", "Reference"]
+
+
+def _pick_column(columns, candidates: List[str]) -> Optional[str]:
+    by_key = {_normalize(str(c)): c for c in columns}
+    for cand in candidates:
+        col = by_key.get(_normalize(cand))
+        if col is not None:
+            return col
+    return None
+
+
+def read_statement(path: str) -> List[Dict[str, Any]]:
+    """Read a paybill statement into rows of {row, tx_id, amount, raw_ref}.
+
+    `amount` is an int, or None when the cell is not a whole non-negative
+    number. Amount cleaning is vectorized with pandas.
+    """
+    import pandas as pd
+
+    p = Path(path)
+    if not p.exists():
+        raise FileNotFoundError(f"Statement not found: {path}")
+    if p.suffix.lower() == ".csv":
+        df = pd.read_csv(p, dtype=str, keep_default_na=False)
+    else:
+        df = pd.read_excel(p, dtype=str, keep_default_na=False)
+
+    tx_col = _pick_column(df.columns, TX_COLUMNS)
+    amount_col = _pick_column(df.columns, AMOUNT_COLUMNS)
+    ref_col = _pick_column(df.columns, REF_COLUMNS)
+    if tx_col is None or amount_col is None or ref_col is None:
+        raise ValueError("Statement must have TransID, TransAmount and BillRefNumber columns")
+
+    amounts = pd.to_numeric(df[amount_col].str.replace(",", "", regex=False).str.strip(), errors="coerce")
+    valid = amounts.notna() & (amounts >= 0) & (amounts % 1 == 0)
+    amounts = amounts.where(valid, -1).astype("int64")
+
+    rows = []
+    for i, (tx_id, amount, ok, raw_ref) in enumerate(
+        zip(df[tx_col].str.strip(), amounts, valid, df[ref_col]), start=2
+    ):
+        rows.append({"row": i, "tx_id": tx_id, "amount": int(amount) if ok else None, "raw_ref": raw_ref})
+    return rows
+
+
+def reconcile_statement(
+    statement_path: str,
+    ledger_path: str,
+    term: str,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    """Allocate and persist every new payment in a statement; return a summary.
+
+    Used when callbacks were missed: every BillRefNumber is parsed, all
+    payments are allocated in statement order against one shared balance
+    state, and the results are journalled and persisted in a single pass.
+    TransIDs already applied, or repeated within the statement, are
+    skipped. References are matched to the roster like a callback's (see
+    `PaymentPipeline`): rows whose reference cannot be read, names no
+    student or could belong to several are parked in the suspense queue
+    with the raw row, and listed under `suspense`. Rows with a missing
+    TransID or a bad amount are reported under `rejected` and not applied.
+
+    Throughput target: at least 50,000 rows/s for parsing and allocation on
+    a 3,000-student roster (`rows_per_second` in the summary), excluding the
+    statement read and the final persistence pass.
+    """
+    rows = read_statement(statement_path)
+    writer = WriteBehindWriter(ledger_path)
+    started = time.perf_counter()
+    rejected: List[Dict[str, Any]] = []
+    parked: List[Dict[str, Any]] = []
+    duplicates = 0
+    with writer.lock:
+        ledger = writer.sync()
+        # The throughput figure covers parsing and allocation, not the ledger load
+        allocating = time.perf_counter()
+        parsed, parse_errors = parse_references(r["raw_ref"] for r in rows)
+        seen = set()
+        accepted = []
+        for i, r in enumerate(rows):
+            tx_id = r["tx_id"]
+            if not tx_id:
+                rejected.append({"row": r["row"], "tx_id": tx_id, "error": "TransID is required"})
+                continue
+            if tx_id in seen or tx_id in writer.transactions or tx_id in writer.suspense:
+                duplicates += 1
+                continue
+            if r["amount"] is None:
+                rejected.append({"row": r["row"], "tx_id": tx_id, "error": "TransAmount must be an integer amount"})
+                continue
+            seen.add(tx_id)
+            reference_order = parsed[i]
+            if reference_order is None:
+                # Salvage the numbers from a malformed reference, as for a callback
+                reference_order = loose_reference(r["raw_ref"])
+                if not reference_order:
+                    parked.append({"tx_id": tx_id, "amount": r["amount"], "reference_order": [],
+                                   "reason": f"unreadable reference: {parse_errors[i]}", "payload": r})
+                    continue
+            resolved, ambiguous = writer.admissions.resolve(reference_order)
+            if ambiguous or not any(ref in ledger for ref in resolved):
+                reason = "ambiguous reference" if ambiguous else "no matching student"
+                parked.append({"tx_id": tx_id, "amount": r["amount"], "reference_order": reference_order,
+                               "reason": reason, "candidates": ambiguous, "payload": r})
+                continue
+            accepted.append((tx_id, r["amount"], resolved))
+
+        received_at = datetime.now().isoformat(timespec="seconds")
+        results = allocate_batch(ledger.balances(), [(amount, refs) for _, amount, refs in accepted])
+        allocated_seconds = time.perf_counter() - allocating
+        entries = [
+            {
+                "tx_id": tx_id,
+                "amount": amount,
+                "reference_order": refs,
+                "allocations": res["allocations"],
+                "remaining_credit": res["remaining_credit"],
+                "term": term,
+                "received_at": received_at,
+            }
+            for (tx_id, amount, refs), res in zip(accepted, results)
+        ]
+        if not dry_run:
+            writer.suspense.add_many(parked)
+            if entries:
+                writer.submit_many(entries)
+    if entries and not dry_run:
+        writer.flush()
+    writer.backend.close()
+
+    return {
+        "rows": len(rows),
+        "applied": 0 if dry_run else len(entries),
+        "duplicates": duplicates,
+        "rejected": rejected,
+        "suspense": [{"row": p["payload"]["row"], "tx_id": p["tx_id"], "reason": p["reason"]} for p in parked],
+        "allocated_total": sum(sum(e["allocations"].values()) for e in entries),
+        "credit_total": sum(e["remaining_credit"] for e in entries),
+        "rows_per_second": round(len(rows) / allocated_seconds) if allocated_seconds > 0 else None,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Reconcile an M-Pesa paybill statement against the ledger.")
+    parser.add_argument("statement", help="statement .csv or .xlsx")
+    parser.add_argument("--ledger", required=True, help="ledger workbook (.xlsx) or SQLite database")
+    parser.add_argument("--term", required=True)
+    parser.add_argument("--dry-run", action="store_true", help="allocate and report without persisting")
+    args = parser.parse_args(argv)
+
+    summary = reconcile_statement(args.statement, args.ledger, args.term, dry_run=args.dry_run)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
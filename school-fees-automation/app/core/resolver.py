@@ -0,0 +1,164 @@
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+# A reference shorter than this is too vague for prefix and edit-distance
+# matching: one or two digits are a neighbour of much of the roster
+MIN_FUZZY_LENGTH = 3
+# A prefix shared by more admission numbers than this matches none of them
+MAX_PREFIX_CANDIDATES = 5
+
+
+def _key(admission_no: str) -> str:
+    # "041", "0041" and "41" are the same number
+    if admission_no.isdigit():
+        return admission_no.lstrip("0") or "0"
+    return admission_no.strip().upper()
+
+
+def _deletes(key: str) -> Set[str]:
+    return {key[:i] + key[i + 1:] for i in range(len(key))}
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """True if `a` and `b` differ by one insertion, deletion, substitution or adjacent swap."""
+    if a == b:
+        return True
+    if len(a) > len(b):
+        a, b = b, a
+    if len(b) - len(a) > 1:
+        return False
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) < len(b):
+        return a[i:] == b[i + 1:]
+    if a[i + 1:] == b[i + 1:]:
+        return True
+    return a[i + 1:i + 2] == b[i:i + 1] and a[i:i + 1] == b[i + 1:i + 2] and a[i + 2:] == b[i + 2:]
+
+
+class Resolution:
+    """How one reference matched the roster.
+
+    `match` is "exact", "normalized" (same number up to leading zeros),
+    "fuzzy" (prefix or one typo away) or "none". `admission_no` is set
+    when the reference identifies exactly one student by an exact or
+    normalized match; fuzzy matches only ever produce `candidates`.
+    """
+
+    __slots__ = ("reference", "match", "admission_no", "candidates")
+
+    def __init__(self, reference: str, match: str, admission_no=None, candidates=()):
+        self.reference = reference
+        self.match = match
+        self.admission_no = admission_no
+        self.candidates = list(candidates)
+
+    @property
+    def ambiguous(self) -> bool:
+        return self.admission_no is None and bool(self.candidates)
+
+
+class AdmissionIndex:
+    """Lookup index from typed references to STUDENTS_MASTER admission numbers.
+
+    Built once per roster load: admission numbers are keyed by their
+    normalized form (leading zeros dropped), every key is listed under its
+    one-character deletions, and the keys are kept sorted for prefix
+    scans. `lookup` then costs a handful of dict probes and a bisect
+    however large the roster, well under a millisecond.
+
+    Register with `StudentLedger.add_listener` to be rebuilt on every load.
+    """
+
+    def __init__(self, admission_numbers: Iterable[str] = ()):
+        self.rebuild(admission_numbers)
+
+    def rebuild(self, admission_numbers: Iterable[str]) -> None:
+        exact: Set[str] = set()
+        by_key: Dict[str, List[str]] = defaultdict(list)
+        neighbours: Dict[str, Set[str]] = defaultdict(set)
+        for adm in admission_numbers:
+            if adm in exact:
+                continue
+            exact.add(adm)
+            key = _key(adm)
+            by_key[key].append(adm)
+            for deleted in _deletes(key):
+                neighbours[deleted].add(key)
+        self._exact = exact
+        self._by_key = dict(by_key)
+        self._neighbours = dict(neighbours)
+        self._sorted_keys = sorted(by_key)
+
+    def __len__(self) -> int:
+        return len(self._exact)
+
+    # Ledger listener interface
+
+    def ledger_loaded(self, ledger) -> None:
+        self.rebuild(rec.admission_no for rec in ledger.records())
+
+    def payment_applied(self, ledger, entry, shares, before) -> None:
+        pass
+
+    # Lookups
+
+    def _prefixed(self, key: str) -> List[str]:
+        keys = self._sorted_keys
+        found = []
+        i = bisect_left(keys, key)
+        while i < len(keys) and keys[i].startswith(key):
+            found.append(keys[i])
+            if len(found) > MAX_PREFIX_CANDIDATES:
+                return []
+            i += 1
+        return found
+
+    def _one_edit(self, key: str) -> Set[str]:
+        found: Set[str] = set()
+        neighbours = self._neighbours
+        for probe in _deletes(key) | {key}:
+            found.update(k for k in neighbours.get(probe, ()) if _within_one_edit(key, k))
+        for deleted in _deletes(key):
+            if deleted in self._by_key:
+                found.add(deleted)
+        return found
+
+    def lookup(self, reference: str) -> Resolution:
+        """Resolve one reference to a student, or to candidate students."""
+        if reference in self._exact:
+            return Resolution(reference, "exact", reference)
+        key = _key(reference)
+        same = self._by_key.get(key)
+        if same:
+            if len(same) == 1:
+                return Resolution(reference, "normalized", same[0])
+            return Resolution(reference, "normalized", candidates=sorted(same))
+        if len(key) < MIN_FUZZY_LENGTH:
+            return Resolution(reference, "none")
+        keys = self._one_edit(key) | set(self._prefixed(key))
+        candidates = sorted(adm for k in keys for adm in self._by_key[k])
+        return Resolution(reference, "fuzzy" if candidates else "none", candidates=candidates)
+
+    def resolve(self, reference_order: List[str]) -> Tuple[List[str], Dict[str, List[str]]]:
+        """Map a payment's references onto the roster.
+
+        Returns `(resolved, ambiguous)`. `resolved` is the reference order
+        with exact and normalized matches replaced by the student's
+        admission number (duplicates dropped); references matching nothing
+        are kept as typed, so allocation skips them as before. `ambiguous`
+        maps each reference that only has candidate matches to those
+        candidates; a payment with any is not safe to allocate.
+        """
+        resolved: List[str] = []
+        ambiguous: Dict[str, List[str]] = {}
+        for ref in reference_order:
+            res = self.lookup(ref)
+            if res.ambiguous:
+                ambiguous[ref] = res.candidates
+            adm = res.admission_no or ref
+            if adm not in resolved:
+                resolved.append(adm)
+        return resolved, ambiguous
@@ -0,0 +1,256 @@
+import argparse
+import sqlite3
+import threading
+from typing import Any, Dict, Hashable, Iterator, List, Optional
+
+from app.core.allocator import split_credit, status_for_balance
+from app.core.archive import iter_history
+from app.core.excel import read_students_master, write_school_workbook
+from app.core.storage import LedgerBackend
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (
+    admission_no TEXT PRIMARY KEY,
+    name TEXT NOT NULL DEFAULT '',
+    class_name TEXT NOT NULL DEFAULT '',
+    paid_total INTEGER NOT NULL DEFAULT 0,
+    credit INTEGER NOT NULL DEFAULT 0,
+    balance INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    tx_id TEXT NOT NULL UNIQUE,
+    amount INTEGER NOT NULL,
+    term TEXT NOT NULL,
+    reference_order TEXT NOT NULL,
+    remaining_credit INTEGER NOT NULL,
+    received_at TEXT
+);
+CREATE TABLE IF NOT EXISTS allocations (
+    tx_id TEXT NOT NULL,
+    admission_no TEXT NOT NULL,
+    amount INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS credits (
+    tx_id TEXT NOT NULL,
+    admission_no TEXT NOT NULL,
+    amount INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS allocations_tx ON allocations (tx_id);
+CREATE INDEX IF NOT EXISTS allocations_adm ON allocations (admission_no);
+CREATE INDEX IF NOT EXISTS credits_tx ON credits (tx_id);
+CREATE INDEX IF NOT EXISTS credits_adm ON credits (admission_no);
+CREATE INDEX IF NOT EXISTS transactions_term ON transactions (term);
+"""
+
+
+# Rows in the workbook's history-sheet column order
+HISTORY_QUERIES = {
+    "TRANSACTIONS": "SELECT tx_id, amount, term, reference_order, remaining_credit, received_at FROM transactions ORDER BY seq",
+    "ALLOCATIONS": "SELECT tx_id, admission_no, amount FROM allocations ORDER BY rowid",
+    "CREDITS": "SELECT tx_id, admission_no, amount FROM credits ORDER BY rowid",
+}
+
+
+class SqliteBackend(LedgerBackend):
+    """SQLite ledger with indexed students, transactions, allocations and credits tables.
+
+    Each payment is applied in its own transaction in WAL mode, touching only
+    the referenced students' rows, so write latency does not grow with the
+    size of the history.
+    """
+
+    # Per-payment writes are cheap; don't hold payments back
+    batch_size = 1
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            columns = {r[1] for r in conn.execute("PRAGMA table_info(transactions)")}
+            if "received_at" not in columns:
+                conn.execute("ALTER TABLE transactions ADD COLUMN received_at TEXT")
+            self._conn = conn
+        return self._conn
+
+    def signature(self) -> Optional[Hashable]:
+        if not self.exists():
+            return None
+        with self._lock:
+            # data_version changes when another connection commits
+            return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def load_students(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            cur = self.conn.execute(
+                "SELECT admission_no, name, class_name, paid_total, credit, balance, status FROM students ORDER BY rowid"
+            )
+            return [
+                {"admission_no": r[0], "name": r[1], "class_name": r[2], "paid_total": r[3],
+                 "credit": r[4], "balance": r[5], "status": r[6]}
+                for r in cur
+            ]
+
+    def apply_payments(self, payments: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            for payment in payments:
+                self._apply_payment(payment)
+
+    def _apply_payment(self, p: Dict[str, Any]) -> None:
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM transactions WHERE tx_id = ?", (p["tx_id"],)).fetchone():
+                # Already applied (e.g. replayed after a crash)
+                conn.execute("ROLLBACK")
+                return
+            for adm, amt in p["allocations"].items():
+                row = conn.execute("SELECT balance FROM students WHERE admission_no = ?", (adm,)).fetchone()
+                if row is None:
+                    raise ValueError(f"admission_no '{adm}' not found in STUDENTS_MASTER")
+                balance = row[0] - amt
+                conn.execute(
+                    "UPDATE students SET paid_total = paid_total + ?, balance = ?, status = ? WHERE admission_no = ?",
+                    (amt, balance, status_for_balance(balance), adm),
+                )
+            refs = [r for r in p["reference_order"]
+                    if conn.execute("SELECT 1 FROM students WHERE admission_no = ?", (r,)).fetchone()]
+            shares = split_credit(p["remaining_credit"], refs)
+            for adm, share in shares.items():
+                balance = conn.execute("SELECT balance FROM students WHERE admission_no = ?", (adm,)).fetchone()[0] - share
+                conn.execute(
+                    "UPDATE students SET credit = credit + ?, balance = ?, status = ? WHERE admission_no = ?",
+                    (share, balance, status_for_balance(balance), adm),
+                )
+            conn.execute(
+                "INSERT INTO transactions (tx_id, amount, term, reference_order, remaining_credit, received_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (p["tx_id"], p["amount"], p["term"], "|".join(p["reference_order"]), p["remaining_credit"],
+                 p.get("received_at")),
+            )
+            conn.executemany(
+                "INSERT INTO allocations (tx_id, admission_no, amount) VALUES (?, ?, ?)",
+                [(p["tx_id"], adm, amt) for adm, amt in p["allocations"].items()],
+            )
+            conn.executemany(
+                "INSERT INTO credits (tx_id, admission_no, amount) VALUES (?, ?, ?)",
+                [(p["tx_id"], adm, share) for adm, share in shares.items()],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def transaction_results(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            results = {
+                tx_id: {"allocations": {}, "remaining_credit": credit}
+                for tx_id, credit in self.conn.execute("SELECT tx_id, remaining_credit FROM transactions")
+            }
+            for tx_id, adm, amt in self.conn.execute("SELECT tx_id, admission_no, amount FROM allocations"):
+                if tx_id in results:
+                    results[tx_id]["allocations"][adm] = amt
+            return results
+
+    def committed_count(self, payments: List[Dict[str, Any]]) -> int:
+        # Each payment commits on its own, so a crash leaves a prefix applied
+        count = 0
+        with self._lock:
+            for p in payments:
+                if not self.conn.execute("SELECT 1 FROM transactions WHERE tx_id = ?", (p["tx_id"],)).fetchone():
+                    break
+                count += 1
+        return count
+
+    def history_rows(self, sheet_name: str) -> Iterator[tuple]:
+        if sheet_name not in HISTORY_QUERIES:
+            raise ValueError(f"Unknown history sheet: {sheet_name}")
+        with self._lock:
+            rows = self.conn.execute(HISTORY_QUERIES[sheet_name]).fetchall()
+        return iter(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def import_from_excel(workbook_path: str, db_path: str) -> SqliteBackend:
+    """Bulk-load a workbook's STUDENTS_MASTER and history (archived terms included) into a SQLite ledger.
+
+    Raises ValueError if the database already holds students or payments:
+    importing over a live ledger would overwrite its balances.
+    """
+    backend = SqliteBackend(db_path)
+    students = read_students_master(workbook_path)
+    conn = backend.conn
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT EXISTS (SELECT 1 FROM students) OR EXISTS (SELECT 1 FROM transactions)").fetchone()[0]:
+            raise ValueError(f"{db_path} already holds a ledger; import into a new database")
+        conn.executemany(
+            "INSERT OR REPLACE INTO students (admission_no, name, class_name, paid_total, credit, balance, status) "
+            "VALUES (:admission_no, :name, :class_name, :paid_total, :credit, :balance, :status)",
+            students,
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO transactions (tx_id, amount, term, reference_order, remaining_credit, received_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(str(r[0]), r[1] or 0, r[2] or "", r[3] or "", r[4] or 0, r[5] if len(r) > 5 else None)
+             for r in iter_history(workbook_path, "TRANSACTIONS")],
+        )
+        for sheet, table in (("ALLOCATIONS", "allocations"), ("CREDITS", "credits")):
+            conn.executemany(
+                f"INSERT INTO {table} (tx_id, admission_no, amount) VALUES (?, ?, ?)",
+                [(str(r[0]), str(r[1]), r[2] or 0) for r in iter_history(workbook_path, sheet)],
+            )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        backend.close()
+        raise
+    return backend
+
+
+def export_to_excel(db_path: str, workbook_path: str) -> None:
+    """Write the SQLite ledger out as a workbook in the usual sheet layout."""
+    backend = SqliteBackend(db_path)
+    try:
+        history = {sheet: list(backend.history_rows(sheet)) for sheet in HISTORY_QUERIES}
+        write_school_workbook(workbook_path, backend.load_students(), history)
+    finally:
+        backend.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Move a school ledger between Excel and SQLite.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="load an .xlsx workbook into a SQLite ledger")
+    imp.add_argument("workbook")
+    imp.add_argument("database")
+    exp = sub.add_parser("export", help="write a SQLite ledger out as an .xlsx workbook")
+    exp.add_argument("database")
+    exp.add_argument("workbook")
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        try:
+            import_from_excel(args.workbook, args.database).close()
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        export_to_excel(args.database, args.workbook)
+
+
+if __name__ == "__main__":
+    main()
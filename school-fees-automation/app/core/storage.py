@@ -0,0 +1,121 @@
+import os
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Hashable, Iterator, List, Optional
+
+from app.core.archive import archive_dir_for, history_transaction_results, iter_history, rotate_history
+from app.core.excel import apply_payments_to_excel, read_commit_marker, read_students_master
+
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+
+class LedgerBackend(ABC):
+    """Storage interface behind the ledger, the write-behind writer and the TransID index.
+
+    A backend is the system of record for one school: it returns the
+    STUDENTS_MASTER rows, persists batches of allocation results and can
+    rebuild the TransID -> result map from its history. Subclasses must
+    implement every abstract method.
+    """
+
+    # Payments the write-behind writer lets pile up before flushing
+    batch_size = 50
+
+    def __init__(self, path: str):
+        self.path = str(path)
+
+    def exists(self) -> bool:
+        return Path(self.path).exists()
+
+    @abstractmethod
+    def signature(self) -> Optional[Hashable]:
+        """Return a value that changes whenever the stored data changes, or None if missing."""
+
+    @abstractmethod
+    def load_students(self) -> List[Dict[str, Any]]:
+        """Return STUDENTS_MASTER rows as produced by `excel.read_students_master`."""
+
+    @abstractmethod
+    def apply_payments(self, payments: List[Dict[str, Any]]) -> None:
+        """Persist allocation results, in order, with `apply_payment_to_excel` semantics."""
+
+    @abstractmethod
+    def transaction_results(self) -> Dict[str, Dict[str, Any]]:
+        """Return TxID -> {"allocations", "remaining_credit"} for every stored payment."""
+
+    @abstractmethod
+    def committed_count(self, payments: List[Dict[str, Any]]) -> int:
+        """Return how many leading `payments` (in journal order) are already persisted.
+
+        Non-zero only after a crash between `apply_payments` and the journal
+        being truncated.
+        """
+
+    @abstractmethod
+    def history_rows(self, sheet_name: str) -> Iterator[tuple]:
+        """Yield all TRANSACTIONS, ALLOCATIONS or CREDITS rows in the workbook's column order."""
+
+    def close(self) -> None:
+        pass
+
+
+class ExcelBackend(LedgerBackend):
+    """The SCHOOL_FEES_AUTOMATION.xlsx workbook as the system of record.
+
+    History rows from earlier terms are rotated out of the workbook into
+    per-term CSV shards under `archive_dir` as part of the first save in a
+    new term, so the live workbook only carries STUDENTS_MASTER and the
+    current term's history. Pass `archive_dir=False` to keep everything live.
+    """
+
+    def __init__(self, path: str, archive_dir=None):
+        super().__init__(path)
+        self.archive_dir = archive_dir_for(path) if archive_dir is None else archive_dir
+
+    def signature(self) -> Optional[Hashable]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def load_students(self) -> List[Dict[str, Any]]:
+        return read_students_master(self.path)
+
+    def apply_payments(self, payments: List[Dict[str, Any]]) -> None:
+        # Every term in the batch stays live: a late payment for the previous
+        # term replayed with new ones must not rotate either of them out
+        terms = {p["term"] for p in payments}
+
+        def rotate(wb):
+            rotate_history(wb, terms, Path(self.archive_dir))
+
+        apply_payments_to_excel(self.path, payments, before_save=rotate if self.archive_dir and terms else None)
+
+    def transaction_results(self) -> Dict[str, Dict[str, Any]]:
+        return history_transaction_results(self.path, self._archive_path())
+
+    def committed_count(self, payments: List[Dict[str, Any]]) -> int:
+        # Batches are saved whole, marked with their last TxID
+        marker = read_commit_marker(self.path)
+        if marker is None:
+            return 0
+        for i, p in enumerate(payments):
+            if str(p["tx_id"]) == marker:
+                return i + 1
+        return 0
+
+    def history_rows(self, sheet_name: str) -> Iterator[tuple]:
+        return iter_history(self.path, sheet_name, archive_dir=self._archive_path())
+
+    def _archive_path(self) -> Optional[Path]:
+        return Path(self.archive_dir) if self.archive_dir else None
+
+
+def open_backend(path: str) -> LedgerBackend:
+    """Return the backend for `path`: SQLite for .db/.sqlite/.sqlite3, Excel otherwise."""
+    if str(path).lower().endswith(SQLITE_SUFFIXES):
+        from app.core.sqlite_store import SqliteBackend
+
+        return SqliteBackend(path)
+    return ExcelBackend(path)
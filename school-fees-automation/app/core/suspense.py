@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.core.journal import PaymentJournal
+
+
+def suspense_path_for(workbook_path: str) -> str:
+    return str(workbook_path) + ".suspense"
+
+
+class SuspenseQueue:
+    """Durable queue of payments received but not allocated to anyone.
+
+    A payment whose reference could belong to more than one student, names
+    no student on the roster, or cannot be read at all is parked here, with
+    the candidates and the raw callback payload, instead of being allocated
+    or failing the callback. `PaymentPipeline.reprocess_suspense` re-runs
+    the queue in one batch once the roster has been corrected.
+
+    Items are kept in a JSON-lines journal next to the ledger and cached in
+    memory; the cache follows the file by offset, so items added by other
+    processes are seen too.
+
+    Callers serialize writes across processes with the ledger writer's lock.
+    """
+
+    def __init__(self, path: str):
+        self.journal = PaymentJournal(path)
+        self._items: Dict[str, Dict[str, Any]] = {}
+        self._offset = 0
+        self._inode: Optional[int] = None
+
+    def _refresh(self) -> None:
+        try:
+            st = os.stat(self.journal.path)
+        except FileNotFoundError:
+            self._items, self._offset, self._inode = {}, 0, None
+            return
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            # Rewritten since we last read it: start over
+            self._items, self._offset, self._inode = {}, 0, st.st_ino
+        entries, self._offset = self.journal.read_from(self._offset)
+        for entry in entries:
+            self._items.setdefault(entry["tx_id"], entry)
+
+    def add(
+        self,
+        tx_id: str,
+        amount: int,
+        reference_order: List[str],
+        reason: str,
+        candidates: Optional[Dict[str, List[str]]] = None,
+        payload: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Park a payment. A TransID already in the queue keeps its first item."""
+        self.add_many([{"tx_id": tx_id, "amount": amount, "reference_order": reference_order,
+                        "reason": reason, "candidates": candidates, "payload": payload}])
+        return self._items[tx_id]
+
+    def add_many(self, parked: List[Dict[str, Any]]) -> int:
+        """Park several payments (dicts of `add`'s arguments) with a single fsync.
+
+        Returns how many were new to the queue.
+        """
+        self._refresh()
+        received_at = datetime.now().isoformat(timespec="seconds")
+        new = []
+        for p in parked:
+            if p["tx_id"] in self._items:
+                continue
+            item = {
+                "tx_id": p["tx_id"],
+                "amount": p["amount"],
+                "reference_order": p["reference_order"],
+                "reason": p["reason"],
+                "candidates": p.get("candidates") or {},
+                "payload": p.get("payload"),
+                "received_at": received_at,
+            }
+            self._items[item["tx_id"]] = item
+            new.append(item)
+        if new:
+            self._offset = self.journal.extend(new)
+        return len(new)
+
+    def get(self, tx_id: str) -> Optional[Dict[str, Any]]:
+        self._refresh()
+        return self._items.get(tx_id)
+
+    def __contains__(self, tx_id: str) -> bool:
+        return self.get(tx_id) is not None
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self._items)
+
+    def items(self) -> List[Dict[str, Any]]:
+        """Return the parked payments in arrival order."""
+        self._refresh()
+        return list(self._items.values())
+
+    def remove(self, tx_ids) -> int:
+        """Drop the items for `tx_ids` (atomic rewrite). Returns how many remain."""
+        drop = set(tx_ids)
+        if not drop:
+            return len(self)
+        remaining = [i for i in self.items() if i["tx_id"] not in drop]
+        if remaining:
+            self.journal.rewrite(remaining)
+        else:
+            self.journal.truncate()
+        self._inode = None
+        return len(remaining)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="List or re-process payments parked in suspense.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("list", help="print the parked payments")
+    show.add_argument("ledger")
+    run = sub.add_parser("reprocess", help="allocate every parked payment that now matches the roster")
+    run.add_argument("ledger")
+    run.add_argument("--term", required=True)
+    run.add_argument("--assign", nargs="*", default=[], metavar="TXID=REFS",
+                     help="pay a parked TransID to these admission numbers, e.g. QK12=041|1043")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        print(json.dumps(SuspenseQueue(suspense_path_for(args.ledger)).items(), indent=2))
+        return
+
+    from app.core.persistence import close_writers
+    from app.core.pipeline import PaymentPipeline
+    from app.mpesa.parser import parse_reference
+
+    assign = {}
+    for item in args.assign:
+        tx_id, sep, refs = item.partition("=")
+        if not sep:
+            parser.error(f"--assign takes TXID=REFS, got '{item}'")
+        assign[tx_id] = parse_reference(refs)
+    try:
+        print(json.dumps(PaymentPipeline(args.ledger, args.term).reprocess_suspense(assign), indent=2))
+    finally:
+        close_writers()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.pipeline import PaymentPipeline
+
+# Open school pipelines (ledger, journal, TransID index) kept per process
+DEFAULT_POOL_SIZE = 16
+# Characters allowed between an account prefix and the admission numbers
+PREFIX_SEPARATORS = "-#/: "
+
+
+class Tenant:
+    """One school: where its payments come from and which ledger they go to."""
+
+    __slots__ = ("name", "ledger_path", "term", "shortcode", "prefix")
+
+    def __init__(self, name: str, ledger_path: str, term: str, shortcode: Optional[str] = None, prefix: Optional[str] = None):
+        if not name or not ledger_path or not term:
+            raise ValueError("Each school needs a name, a ledger path and a term")
+        if shortcode is None and prefix is None:
+            raise ValueError(f"School '{name}' needs a shortcode, an account prefix or both")
+        self.name = name
+        self.ledger_path = str(ledger_path)
+        self.term = term
+        self.shortcode = str(shortcode) if shortcode is not None else None
+        self.prefix = prefix.upper() if prefix else None
+
+    def strip_prefix(self, bill_ref: str) -> Optional[str]:
+        """Return `bill_ref` without this school's prefix, or None if it lacks it."""
+        if self.prefix is None:
+            return bill_ref
+        head = bill_ref.lstrip()
+        if not head.upper().startswith(self.prefix):
+            return None
+        return head[len(self.prefix):].lstrip(PREFIX_SEPARATORS)
+
+
+def load_tenants(path: str) -> Tuple[List[Tenant], int]:
+    """Read a schools config file. Returns the schools and the pool size.
+
+    The file is JSON: {"pool_size": 16, "schools": [{"name", "ledger",
+    "term", "shortcode", "prefix"}, ...]}. Ledger paths are relative to
+    the config file. Raises ValueError for an invalid config.
+    """
+    config_path = Path(path)
+    config = json.loads(config_path.read_text())
+    tenants = []
+    for school in config.get("schools", []):
+        ledger = Path(school.get("ledger", ""))
+        if school.get("ledger") and not ledger.is_absolute():
+            ledger = config_path.parent / ledger
+        tenants.append(Tenant(
+            school.get("name"), str(ledger) if school.get("ledger") else "", school.get("term"),
+            shortcode=school.get("shortcode"), prefix=school.get("prefix"),
+        ))
+    return tenants, int(config.get("pool_size", DEFAULT_POOL_SIZE))
+
+
+class TenantRouter:
+    """Routes payments to schools and keeps a bounded pool of their pipelines.
+
+    A callback is matched by BusinessShortCode first; when several schools
+    share a paybill the account prefix in BillRefNumber decides (longest
+    prefix wins), and the only school on a paybill takes its payments even
+    without its prefix. A prefix alone routes only to schools with no
+    shortcode configured. At most `pool_size` school pipelines are open at once: the
+    least recently used one is drained, flushed and closed to make room,
+    and reopened on its next payment.
+    """
+
+    def __init__(self, tenants: List[Tenant], pool_size: int = DEFAULT_POOL_SIZE):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        self.pool_size = pool_size
+        self._by_name: Dict[str, Tenant] = {}
+        self._by_shortcode: Dict[str, List[Tenant]] = {}
+        for tenant in tenants:
+            if tenant.name in self._by_name:
+                raise ValueError(f"Duplicate school name: {tenant.name}")
+            self._by_name[tenant.name] = tenant
+            if tenant.shortcode is not None:
+                self._by_shortcode.setdefault(tenant.shortcode, []).append(tenant)
+        # Longest prefixes first so "SM2" is tried before "SM"
+        self._prefixed = sorted((t for t in tenants if t.prefix), key=lambda t: -len(t.prefix))
+        self._pool: "OrderedDict[str, PaymentPipeline]" = OrderedDict()
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_file(cls, path: str) -> "TenantRouter":
+        tenants, pool_size = load_tenants(path)
+        return cls(tenants, pool_size)
+
+    def get(self, name: str) -> Optional[Tenant]:
+        return self._by_name.get(name)
+
+    def route(self, shortcode: Any, bill_ref: str) -> Tuple[Optional[Tenant], str]:
+        """Return the school a payment belongs to and its BillRefNumber without the prefix.
+
+        The school is None when nothing matches.
+        """
+        candidates = self._by_shortcode.get(str(shortcode)) if shortcode is not None else None
+        for tenant in self._prefixed:
+            if candidates is None and tenant.shortcode is not None:
+                # A school with a paybill of its own is only reached through it
+                continue
+            if candidates is not None and tenant not in candidates:
+                continue
+            rest = tenant.strip_prefix(bill_ref)
+            if rest is not None:
+                return tenant, rest
+        if candidates:
+            if len(candidates) == 1:
+                return candidates[0], bill_ref
+            unprefixed = [t for t in candidates if t.prefix is None]
+            if len(unprefixed) == 1:
+                return unprefixed[0], bill_ref
+        return None, bill_ref
+
+    async def pipeline(self, tenant: Tenant) -> PaymentPipeline:
+        """Return the started pipeline for `tenant`, opening it (and evicting) if needed."""
+        evicted = []
+        async with self._lock:
+            pipeline = self._pool.get(tenant.name)
+            if pipeline is not None:
+                self._pool.move_to_end(tenant.name)
+                return pipeline
+            pipeline = PaymentPipeline(tenant.ledger_path, tenant.term)
+            self._pool[tenant.name] = pipeline
+            while len(self._pool) > self.pool_size:
+                evicted.append(self._pool.popitem(last=False)[1])
+        for old in evicted:
+            await old.close()
+        await pipeline.start()
+        return pipeline
+
+    def schools(self) -> List[Tenant]:
+        return list(self._by_name.values())
+
+    def open_schools(self) -> List[str]:
+        """Names of schools with an open pipeline, least recently used first."""
+        return list(self._pool)
+
+    async def close(self) -> None:
+        async with self._lock:
+            pipelines = list(self._pool.values())
+            self._pool.clear()
+        for pipeline in pipelines:
+            await pipeline.close()
+
+
+def router_from_env() -> Optional[TenantRouter]:
+    """Build the router from the FEES_TENANTS config file, if one is configured."""
+    path = os.environ.get("FEES_TENANTS")
+    return TenantRouter.from_file(path) if path else None
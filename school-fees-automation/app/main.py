@@ -1,9 +1,82 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from pathlib import Path
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from app.core.metrics import METRICS
+from app.core.persistence import close_writers, get_writer
+from app.core.pipeline import PaymentPipeline
+from app.core.tenants import router_from_env
+from app.mpesa import webhook
 from app.mpesa.webhook import router as mpesa_router
+from app.reports.routes import router as reports_router
+from app.reports.snapshot import exporter_from_env
+
+
+def warm_up(ledger_path=None) -> None:
+    """Import the workbook library, run crash recovery and load the ledger and TransID index.
+
+    Runs in the background once the server is accepting connections, so a
+    cold start does not wait for it; a callback that arrives first simply
+    does the same work itself.
+    """
+    import openpyxl  # noqa: F401
+
+    if ledger_path is not None and Path(ledger_path).exists():
+        get_writer(ledger_path).recover()
+
 
-app = FastAPI(title="School Fees Automation")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Several schools: route by shortcode / account prefix (FEES_TENANTS config);
+    # their ledgers are opened on first payment
+    tenants = router_from_env()
+    loop = asyncio.get_running_loop()
+    if tenants is not None:
+        app.state.tenants = tenants
+        warmup = loop.run_in_executor(None, warm_up)
+        snapshots = exporter_from_env(t.ledger_path for t in tenants.schools())
+        if snapshots is not None:
+            snapshots.start()
+        yield
+        with suppress(Exception):
+            await warmup
+        if snapshots is not None:
+            snapshots.stop()
+        await tenants.close()
+        close_writers()
+        return
+
+    # Load the student ledger in the background so the first callback does not pay for it
+    warmup = loop.run_in_executor(None, warm_up, webhook.EXCEL_PATH)
+    app.state.pipeline = PaymentPipeline(webhook.EXCEL_PATH, webhook.CURRENT_TERM)
+    await app.state.pipeline.start()
+    # Columnar snapshots for reporting queries (FEES_SNAPSHOT_INTERVAL)
+    snapshots = exporter_from_env([webhook.EXCEL_PATH])
+    if snapshots is not None:
+        snapshots.start()
+    yield
+    with suppress(Exception):
+        # A failed warm-up resurfaces on the first callback instead
+        await warmup
+    if snapshots is not None:
+        snapshots.stop()
+    await app.state.pipeline.stop()
+    # Push every journalled payment into the workbook before exiting
+    close_writers()
+
+
+app = FastAPI(title="School Fees Automation", lifespan=lifespan)
 app.include_router(mpesa_router, prefix="/mpesa")
+app.include_router(reports_router, prefix="/reports")
 
 @app.get("/")
 def root():
     return {"status": "ok", "service": "school-fees-automation"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Per-stage callback latencies and outcome counters, Prometheus text format."""
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
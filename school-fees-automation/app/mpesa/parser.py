@@ -1,4 +1,9 @@
 import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_INVALID_CHARS = re.compile(r"[^0-9\|,\s]")
+_SEPARATORS = re.compile(r"[|,]")
+_DIGIT_RUNS = re.compile(r"[0-9]+")
 
 
 def parse_reference(raw: str) -> list[str]:
@@ -11,39 +16,84 @@ def parse_reference(raw: str) -> list[str]:
     - Reject empty input or empty parts.
     - Reject duplicates.
     - Raise ValueError with a clear message on invalid input.
+
+    When a reference breaks several rules, the error reported is the first
+    of: invalid characters, empty part, non-numeric part, duplicates.
     """
     if raw is None:
         raise ValueError("Reference string is None")
 
+    # Fast path: a single admission number with nothing around it
+    if raw.isdigit() and raw.isascii():
+        return [raw]
+
     s = raw.strip()
     if not s:
         raise ValueError("Empty reference string")
 
     # Disallow any characters other than digits, whitespace, '|' and ','
-    invalid_chars = sorted(set(re.findall(r"[^0-9\|,\s]", s)))
-    if invalid_chars:
-        chars = "".join(invalid_chars)
+    if _INVALID_CHARS.search(s) is not None:
+        chars = "".join(sorted(set(_INVALID_CHARS.findall(s))))
         raise ValueError(f"Invalid character(s) in reference string: {chars}")
 
-    parts = [p.strip() for p in re.split(r"[|,]", s)]
-
-    if any(p == "" for p in parts):
-        raise ValueError("Empty reference part found")
-
-    for p in parts:
-        if not p.isdigit():
-            raise ValueError(f"Non-numeric reference part: '{p}'")
-
-    # Detect duplicates
+    parts = []
     seen = set()
     dupes = []
-    for p in parts:
-        if p in seen:
+    empty = False
+    non_numeric = None
+    for p in _SEPARATORS.split(s):
+        p = p.strip()
+        if not p:
+            empty = True
+        elif non_numeric is None and not p.isdigit():
+            non_numeric = p
+        elif p in seen:
             if p not in dupes:
                 dupes.append(p)
         else:
             seen.add(p)
+        parts.append(p)
+
+    if empty:
+        raise ValueError("Empty reference part found")
+    if non_numeric is not None:
+        raise ValueError(f"Non-numeric reference part: '{non_numeric}'")
     if dupes:
         raise ValueError(f"Duplicate references found: {', '.join(dupes)}")
 
     return parts
+
+
+def parse_references(raws: Iterable[str]) -> Tuple[List[Optional[List[str]]], Dict[int, str]]:
+    """Parse many references without raising.
+
+    Returns `(results, errors)`: `results[i]` is the parsed list for the
+    i-th reference, or None if it was rejected, in which case `errors[i]`
+    holds the message `parse_reference` would have raised.
+    """
+    results: List[Optional[List[str]]] = []
+    errors: Dict[int, str] = {}
+    for i, raw in enumerate(raws):
+        if raw is not None and raw.isdigit() and raw.isascii():
+            results.append([raw])
+            continue
+        try:
+            results.append(parse_reference(raw))
+        except ValueError as e:
+            results.append(None)
+            errors[i] = str(e)
+    return results, errors
+
+
+def loose_reference(raw: str) -> List[str]:
+    """Salvage the admission numbers from a reference `parse_reference` rejected.
+
+    Returns every run of digits, in order and without repeats, whatever
+    separates them ("041 1043", "041/1043", "ADM 041"). The results still
+    have to be matched against the roster (see `app.core.resolver`).
+    """
+    parts: List[str] = []
+    for p in _DIGIT_RUNS.findall(raw or ""):
+        if p not in parts:
+            parts.append(p)
+    return parts
@@ -1,102 +1,197 @@
+import os
+import time
+
 from fastapi import APIRouter, Request, HTTPException
-from typing import Any, Dict
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Dict, Optional
 
-from app.mpesa.parser import parse_reference
-from app.core.allocator import allocate_payment
-from app.core.excel import _find_header_map, _normalize, apply_payment_to_excel
-from openpyxl import load_workbook
+from app.mpesa.parser import loose_reference, parse_reference
+from app.core.excel import iter_students_master
+from app.core.metrics import METRICS
+from app.core.pipeline import PaymentPipeline
+from app.core.tenants import TenantRouter
 
 router = APIRouter()
 
 # Default locations; can be changed if you wire config
-EXCEL_PATH = "data/SCHOOL_FEES_AUTOMATION.xlsx"
-CURRENT_TERM = "2026-T1"
+EXCEL_PATH = os.environ.get("FEES_WORKBOOK", "data/SCHOOL_FEES_AUTOMATION.xlsx")
+CURRENT_TERM = os.environ.get("FEES_TERM", "2026-T1")
+
+# Send this header with a truthy value to get per-stage timings back
+TRACE_HEADER = "X-Fees-Trace"
+
+# "sync": reply once the payment is allocated and journalled.
+# "async": reply {"ResultCode": 0} as soon as the validated callback is in the
+# durable inbox, and allocate in the background (see GET /status/{tx_id}).
+ACK_MODE = os.environ.get("MPESA_ACK_MODE", "sync")
+
+ACCEPTED = {"ResultCode": 0, "ResultDesc": "Accepted"}
 
 
 def _find_students_from_workbook(path: str):
-    wb = load_workbook(path, data_only=True)
-    if "STUDENTS_MASTER" not in wb.sheetnames:
-        raise ValueError("STUDENTS_MASTER sheet not found in workbook")
-    ws = wb["STUDENTS_MASTER"]
-    header_map = _find_header_map(ws)
-    adm_col = None
-    bal_col = None
-    # Find admission and balance columns (reuse normalization)
-    for cand in ["admission_no", "admissionno", "admission", "admissionnumber"]:
-        idx = _normalize(cand)
-        if idx and idx in header_map:
-            adm_col = header_map[idx]
-            break
-    for cand in ["balance"]:
-        idx = _normalize(cand)
-        if idx and idx in header_map:
-            bal_col = header_map[idx]
-            break
-    if adm_col is None or bal_col is None:
-        raise ValueError("Required columns (admission_no, Balance) not found in STUDENTS_MASTER")
-
-    students = []
-    for row in range(2, ws.max_row + 1):
-        adm_cell = ws.cell(row=row, column=adm_col).value
-        if adm_cell is None:
-            continue
-        adm = str(adm_cell).strip()
-        bal_cell = ws.cell(row=row, column=bal_col).value or 0
-        try:
-            bal = int(bal_cell)
-        except Exception:
-            bal = 0
-        students.append({"admission_no": adm, "balance": bal})
-    wb.close()
-    return students
+    # Streams STUDENTS_MASTER only; history sheets are never parsed
+    return [
+        {"admission_no": row["admission_no"], "balance": row["balance"]}
+        for row in iter_students_master(path)
+    ]
+
+
+def get_pipeline(request: Request) -> PaymentPipeline:
+    """Return the app's payment pipeline, creating one on first use."""
+    pipeline = getattr(request.app.state, "pipeline", None)
+    if pipeline is None:
+        pipeline = PaymentPipeline(EXCEL_PATH, CURRENT_TERM)
+        request.app.state.pipeline = pipeline
+    return pipeline
+
+
+def get_tenants(request: Request) -> Optional[TenantRouter]:
+    """Return the app's school router, or None when serving the single EXCEL_PATH school."""
+    return getattr(request.app.state, "tenants", None)
+
+
+async def get_school_pipeline(request: Request, school: Optional[str] = None) -> PaymentPipeline:
+    """Return the pipeline for school `school` (by name), or the single-school pipeline."""
+    tenants = get_tenants(request)
+    if tenants is None:
+        return get_pipeline(request)
+    tenant = tenants.get(school) if school else None
+    if tenant is None:
+        raise HTTPException(status_code=404, detail=f"Unknown school: {school}")
+    return await tenants.pipeline(tenant)
+
+
+def _reject(detail: str) -> HTTPException:
+    METRICS.inc("rejected")
+    return HTTPException(status_code=400, detail=detail)
 
 
 @router.post("/callback")
 async def mpesa_callback(request: Request) -> Dict[str, Any]:
-    payload = await request.json()
-
-    # Validate required fields
-    tx_id = payload.get("TransID")
-    if not isinstance(tx_id, str) or not tx_id:
-        raise HTTPException(status_code=400, detail="TransID is required and must be a string")
-
-    trans_amount = payload.get("TransAmount")
-    if not isinstance(trans_amount, int):
-        # Accept numeric but enforce int
-        if isinstance(trans_amount, float) and trans_amount.is_integer():
-            trans_amount = int(trans_amount)
-        else:
-            raise HTTPException(status_code=400, detail="TransAmount is required and must be an integer amount")
-
-    raw_ref = payload.get("BillRefNumber")
-    if not isinstance(raw_ref, str) or not raw_ref:
-        raise HTTPException(status_code=400, detail="BillRefNumber is required and must be a string")
-
-    # Parse reference order
-    try:
-        reference_order = parse_reference(raw_ref)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-    # Load students read-only from Excel
+    started = time.perf_counter()
+    trace = {} if request.headers.get(TRACE_HEADER, "").lower() in ("1", "true", "yes") else None
     try:
-        students = _find_students_from_workbook(EXCEL_PATH)
+        response = await _handle_callback(request, trace)
+    except HTTPException:
+        raise
     except Exception:
-        # Let FastAPI convert to 500 for unexpected errors
+        METRICS.inc("error")
         raise
-
-    # Allocate
-    result = allocate_payment(students, trans_amount, reference_order)
-
-    # Persist to Excel (may raise on failure)
-    apply_payment_to_excel(
-        workbook_path=EXCEL_PATH,
-        tx_id=tx_id,
-        amount=trans_amount,
-        reference_order=reference_order,
-        allocations=result.get("allocations", {}),
-        remaining_credit=result.get("remaining_credit", 0),
-        term=CURRENT_TERM,
-    )
-
-    return {"status": "ok"}
+    METRICS.record("total", time.perf_counter() - started, trace)
+    if trace is not None:
+        response["trace"] = trace
+    return response
+
+
+async def _handle_callback(request: Request, trace) -> Dict[str, Any]:
+    with METRICS.stage("validate", trace):
+        payload = await request.json()
+
+        # Validate required fields
+        tx_id = payload.get("TransID")
+        if not isinstance(tx_id, str) or not tx_id:
+            raise _reject("TransID is required and must be a string")
+
+        trans_amount = payload.get("TransAmount")
+        if not isinstance(trans_amount, int):
+            # Accept numeric but enforce int
+            if isinstance(trans_amount, float) and trans_amount.is_integer():
+                trans_amount = int(trans_amount)
+            else:
+                raise _reject("TransAmount is required and must be an integer amount")
+
+        raw_ref = payload.get("BillRefNumber")
+        if not isinstance(raw_ref, str) or not raw_ref:
+            raise _reject("BillRefNumber is required and must be a string")
+
+    # Pick the school by shortcode / account prefix when serving several
+    tenants = get_tenants(request)
+    if tenants is not None:
+        tenant, raw_ref = tenants.route(payload.get("BusinessShortCode"), raw_ref)
+        if tenant is None:
+            raise _reject("No school is configured for this BusinessShortCode / BillRefNumber")
+        pipeline = await tenants.pipeline(tenant)
+    else:
+        pipeline = get_pipeline(request)
+
+    # Parse reference order. A malformed one ("41 1043", "041/1043") is
+    # salvaged and left to the roster lookup, which parks it in suspense
+    # unless every number identifies one student; one without any number
+    # is parked straight away, so the money is not lost to a 400.
+    with METRICS.stage("parse", trace):
+        try:
+            reference_order = parse_reference(raw_ref)
+        except ValueError as e:
+            reference_order = loose_reference(raw_ref)
+            parse_error = str(e)
+    if not reference_order:
+        result = await pipeline.park(tx_id, trans_amount, f"unreadable reference: {parse_error}", payload)
+        return _acknowledge(result, "suspense")
+
+    if ACK_MODE == "async":
+        with METRICS.stage("inbox", trace):
+            result = await pipeline.accept(tx_id, trans_amount, reference_order, payload)
+        return _acknowledge(result, "accepted")
+
+    # Allocation and persistence run one payment at a time on the pipeline's
+    # worker thread, against the in-memory ledger
+    result = await pipeline.submit(tx_id, trans_amount, reference_order, trace=trace, payload=payload)
+    return _acknowledge(result, "suspense" if result.get("suspense") else "ok")
+
+
+def _acknowledge(result: Dict[str, Any], outcome: str) -> Dict[str, Any]:
+    # Safaricom retries callbacks; a repeated TransID is acknowledged again
+    # without being re-applied (or parked twice)
+    if result.get("duplicate"):
+        outcome = "duplicate"
+    METRICS.inc(outcome)
+    if ACK_MODE == "async":
+        return dict(ACCEPTED)
+    response: Dict[str, Any] = {"status": "ok"}
+    if result.get("suspense"):
+        response["suspense"] = True
+    if result.get("duplicate"):
+        response["duplicate"] = True
+    return response
+
+
+@router.get("/status/{tx_id}")
+async def payment_status(tx_id: str, request: Request, school: Optional[str] = None) -> Dict[str, Any]:
+    """Report whether a TransID has been applied, is still queued, or failed."""
+    pipeline = await get_school_pipeline(request, school)
+    status = await run_in_threadpool(pipeline.status, tx_id)
+    if status["status"] == "unknown":
+        raise HTTPException(status_code=404, detail=f"Unknown TransID: {tx_id}")
+    return status
+
+
+@router.get("/suspense")
+async def suspense_items(request: Request, school: Optional[str] = None) -> Dict[str, Any]:
+    """List payments parked in suspense, with their candidates and raw callbacks."""
+    pipeline = await get_school_pipeline(request, school)
+    items = await run_in_threadpool(pipeline.suspended)
+    return {"count": len(items), "items": items}
+
+
+@router.post("/suspense/reprocess")
+async def reprocess_suspense(request: Request, school: Optional[str] = None) -> Dict[str, Any]:
+    """Re-run every parked payment against the current roster in one batch.
+
+    The optional JSON body {"assign": {"<TransID>": "041|1043"}} tells
+    which students a parked payment should pay.
+    """
+    pipeline = await get_school_pipeline(request, school)
+    try:
+        body = await request.json() if await request.body() else {}
+    except ValueError:
+        body = None
+    raw_assign = body.get("assign") or {} if isinstance(body, dict) else None
+    if not isinstance(raw_assign, dict) or not all(isinstance(v, str) for v in raw_assign.values()):
+        raise HTTPException(status_code=400, detail='Body must be {"assign": {"<TransID>": "<references>"}}')
+    assign = {}
+    try:
+        for tx_id, raw in raw_assign.items():
+            assign[tx_id] = parse_reference(raw)
+        return await pipeline.reprocess(assign)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,147 @@
+import threading
+from collections import defaultdict
+from datetime import date
+from typing import Any, Dict, Iterable, Optional
+
+from app.core.allocator import split_credit, status_for_balance
+
+
+def _bucket() -> Dict[str, int]:
+    return {"total": 0, "count": 0}
+
+
+def _day(received_at: Any) -> str:
+    if received_at is None or received_at == "":
+        return "unknown"
+    if hasattr(received_at, "date"):
+        return received_at.date().isoformat()
+    return str(received_at)[:10]
+
+
+class ReportAggregates:
+    """Running report totals, updated as payments are committed to the ledger.
+
+    Payment aggregates (per day, per term, per class) grow by one payment
+    at a time and are keyed by TxID, so a payment seen twice (journal
+    replay, another process, history) is only counted once. Student
+    aggregates (per status, outstanding balance, overpaid credit) are
+    adjusted by the before/after balances of the students a payment
+    touched, and recomputed from the roster whenever the ledger reloads.
+    Every summary is a dict lookup.
+
+    Register with `StudentLedger.add_listener`; `add_history` seeds the
+    payment aggregates from stored history.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seen = set()
+        self.by_day: Dict[str, Dict[str, int]] = defaultdict(_bucket)
+        self.by_term: Dict[str, Dict[str, int]] = defaultdict(_bucket)
+        self.by_class: Dict[str, Dict[str, int]] = defaultdict(_bucket)
+        self.by_status: Dict[str, Dict[str, int]] = defaultdict(lambda: {"students": 0, "balance": 0})
+        self.outstanding = 0
+        self.overpaid_credit = 0
+
+    def _add_student(self, balance: int, status: str, sign: int) -> None:
+        self.by_status[status]["students"] += sign
+        self.by_status[status]["balance"] += sign * balance
+        if balance > 0:
+            self.outstanding += sign * balance
+        else:
+            self.overpaid_credit -= sign * balance
+
+    def _add_payment(self, ledger, tx_id: str, amount: int, term: str, day: str, per_student: Dict[str, int]) -> None:
+        if tx_id in self._seen:
+            return
+        self._seen.add(tx_id)
+        for bucket in (self.by_day[day], self.by_term[term]):
+            bucket["total"] += amount
+            bucket["count"] += 1
+        for adm, amt in per_student.items():
+            rec = ledger.get(adm)
+            bucket = self.by_class[rec.class_name if rec is not None else ""]
+            bucket["total"] += amt
+            bucket["count"] += 1
+
+    # Ledger listener interface
+
+    def ledger_loaded(self, ledger) -> None:
+        with self._lock:
+            self.by_status.clear()
+            self.outstanding = 0
+            self.overpaid_credit = 0
+            for rec in ledger.records():
+                self._add_student(rec.balance, rec.status or status_for_balance(rec.balance), 1)
+
+    def payment_applied(self, ledger, entry: Dict[str, Any], shares: Dict[str, int], before: Dict[str, tuple]) -> None:
+        with self._lock:
+            for adm, (old_balance, old_status) in before.items():
+                rec = ledger.get(adm)
+                self._add_student(old_balance, old_status or status_for_balance(old_balance), -1)
+                self._add_student(rec.balance, rec.status, 1)
+            per_student = dict(entry["allocations"])
+            for adm, share in shares.items():
+                per_student[adm] = per_student.get(adm, 0) + share
+            self._add_payment(ledger, entry["tx_id"], entry["amount"], entry["term"],
+                              _day(entry.get("received_at")), per_student)
+
+    # Seeding and rebuilding
+
+    def reset_payments(self) -> None:
+        """Forget every counted payment; see `WriteBehindWriter.rebuild_reports`."""
+        with self._lock:
+            self._seen.clear()
+            self.by_day.clear()
+            self.by_term.clear()
+            self.by_class.clear()
+
+    def add_entries(self, ledger, entries: Iterable[Dict[str, Any]]) -> None:
+        """Count journal entries that are already reflected in `ledger`."""
+        with self._lock:
+            for entry in entries:
+                refs = [r for r in entry["reference_order"] if r in ledger]
+                per_student = dict(entry["allocations"])
+                for adm, share in split_credit(entry["remaining_credit"], refs).items():
+                    per_student[adm] = per_student.get(adm, 0) + share
+                self._add_payment(ledger, entry["tx_id"], entry["amount"], entry["term"],
+                                  _day(entry.get("received_at")), per_student)
+
+    def add_history(
+        self,
+        ledger,
+        transactions: Iterable[tuple],
+        allocations: Iterable[tuple],
+        credits: Iterable[tuple],
+    ) -> None:
+        """Count stored history rows (workbook column order) not counted yet."""
+        per_tx: Dict[str, Dict[str, int]] = defaultdict(dict)
+        for rows in (allocations, credits):
+            for tx_id, adm, amt in rows:
+                per_tx[str(tx_id)][str(adm)] = per_tx[str(tx_id)].get(str(adm), 0) + (amt or 0)
+        with self._lock:
+            for row in transactions:
+                received_at = row[5] if len(row) > 5 else None
+                self._add_payment(ledger, str(row[0]), row[1] or 0, row[2] or "", _day(received_at),
+                                  per_tx.get(str(row[0]), {}))
+
+    # Queries
+
+    def daily(self, day: Optional[str] = None, term: Optional[str] = None) -> Dict[str, Any]:
+        """Return the summary for `day` (default today), plus term and roster totals."""
+        day = day or date.today().isoformat()
+        with self._lock:
+            summary = {
+                "date": day,
+                **self.by_day.get(day, _bucket()),
+                "outstanding_balance": self.outstanding,
+                "overpaid_credit": self.overpaid_credit,
+                "by_status": {k: dict(v) for k, v in self.by_status.items() if v["students"]},
+            }
+            if term is not None:
+                summary["term"] = {"term": term, **self.by_term.get(term, _bucket())}
+            return summary
+
+    def by_class_totals(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {k: dict(v) for k, v in self.by_class.items()}
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import time
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.mpesa.webhook import get_school_pipeline
+
+router = APIRouter()
+
+
+@router.get("/daily")
+async def daily(
+    request: Request,
+    date: Optional[str] = None,
+    term: Optional[str] = None,
+    school: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Collections for `date` (YYYY-MM-DD, default today) and `term`, plus roster totals.
+
+    Served from the writer's running aggregates, so it costs the same
+    whatever the size of the history. `school` is required when serving
+    several schools.
+    """
+    pipeline = await get_school_pipeline(request, school)
+    reports = await run_in_threadpool(pipeline.writer.report_aggregates)
+    summary = reports.daily(date, term or pipeline.term)
+    summary["by_class"] = reports.by_class_totals()
+    return summary
+
+
+@router.post("/rebuild")
+async def rebuild(request: Request, school: Optional[str] = None) -> Dict[str, Any]:
+    """Recount the payment totals from the stored history and the journal.
+
+    Returns today's summary for the current term, as `/daily` does.
+    """
+    pipeline = await get_school_pipeline(request, school)
+    reports = await run_in_threadpool(pipeline.writer.rebuild_reports)
+    summary = reports.daily(None, pipeline.term)
+    summary["by_class"] = reports.by_class_totals()
+    return summary
+
+
+# Long polls and streams check the feed this often for new events; the
+# checks read the feed file, so they run in the threadpool like the reads
+FEED_POLL_INTERVAL = 0.2
+FEED_MAX_WAIT = 60.0
+
+
+@router.get("/feed")
+async def feed(
+    request: Request,
+    after: int = 0,
+    limit: int = 500,
+    wait: float = 0.0,
+    school: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Change-feed events with seq > `after`, oldest first (long poll).
+
+    With `wait` (seconds, at most 60) the request is held until an event
+    arrives or the wait runs out. Resume with `after` set to the returned
+    `last_seq`.
+    """
+    if after < 0 or limit < 1:
+        raise HTTPException(status_code=400, detail="after must be >= 0 and limit >= 1")
+    pipeline = await get_school_pipeline(request, school)
+    changes = pipeline.writer.feed
+    deadline = time.monotonic() + min(max(wait, 0.0), FEED_MAX_WAIT)
+    while (await run_in_threadpool(changes.last_seq)) <= after and time.monotonic() < deadline:
+        await asyncio.sleep(FEED_POLL_INTERVAL)
+    events = await run_in_threadpool(changes.read, after, limit)
+    return {"events": events, "last_seq": events[-1]["seq"] if events else after}
+
+
+@router.get("/feed/stream")
+async def feed_stream(
+    request: Request,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+    school: Optional[str] = None,
+) -> StreamingResponse:
+    """Server-sent events, one per change-feed event, from seq > `after`.
+
+    Payments are `payment` events and retractions `retraction` events
+    (see `ChangeFeed`). Each event's `id` is its seq, so a reconnecting client resumes from
+    the `Last-Event-ID` header when `after` is not given. With `limit`
+    the stream ends after that many events (the client reconnects).
+    """
+    if after is None:
+        last_id = request.headers.get("last-event-id", "0")
+        after = int(last_id) if last_id.isdigit() else 0
+    if after < 0 or (limit is not None and limit < 1):
+        raise HTTPException(status_code=400, detail="after must be >= 0 and limit >= 1")
+    pipeline = await get_school_pipeline(request, school)
+    changes = pipeline.writer.feed
+
+    async def stream():
+        cursor = after
+        remaining = limit
+        while remaining is None or remaining > 0:
+            if await request.is_disconnected():
+                return
+            if (await run_in_threadpool(changes.last_seq)) <= cursor:
+                await asyncio.sleep(FEED_POLL_INTERVAL)
+                continue
+            batch = 500 if remaining is None else min(remaining, 500)
+            for event in await run_in_threadpool(changes.read, cursor, batch):
+                cursor = event["seq"]
+                kind = "retraction" if event.get("retracted") else "payment"
+                yield f"id: {cursor}\nevent: {kind}\ndata: {json.dumps(event)}\n\n"
+            if remaining is not None:
+                remaining = limit - (cursor - after)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
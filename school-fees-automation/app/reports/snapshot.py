@@ -0,0 +1,372 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.core.excel import _to_int
+from app.core.storage import LedgerBackend, open_backend
+
+# numpy is imported where it is used, like openpyxl in app.core.excel
+
+# Table -> (column, type) in snapshot column order. Allocation and credit
+# rows carry the term of their transaction so they can be filtered by it.
+SNAPSHOT_TABLES = {
+    "students": (("admission_no", str), ("name", str), ("class_name", str), ("paid_total", int),
+                 ("credit", int), ("balance", int), ("status", str)),
+    "transactions": (("tx_id", str), ("amount", int), ("term", str), ("reference_order", str),
+                     ("remaining_credit", int), ("received_at", str)),
+    "allocations": (("tx_id", str), ("admission_no", str), ("amount", int), ("term", str)),
+    "credits": (("tx_id", str), ("admission_no", str), ("amount", int), ("term", str)),
+}
+HISTORY_TABLES = {"transactions": "TRANSACTIONS", "allocations": "ALLOCATIONS", "credits": "CREDITS"}
+# Filter operators, written as `column__op` keys in `where`
+OPERATORS = ("eq", "ne", "lt", "le", "gt", "ge", "in")
+CURRENT = "CURRENT"
+MANIFEST = "manifest.json"
+
+
+def snapshot_dir_for(ledger_path: str) -> Path:
+    """Default snapshot location: `<ledger stem>_snapshot/` next to the ledger."""
+    p = Path(ledger_path)
+    return p.with_name(p.stem + "_snapshot")
+
+
+def ledger_signature(ledger_path: str) -> Optional[List[int]]:
+    """Return the size and mtime of the ledger file (and its SQLite WAL), or None if missing."""
+    signature: List[int] = []
+    for path in (str(ledger_path), str(ledger_path) + "-wal"):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            if not signature:
+                return None
+            continue
+        signature += [st.st_mtime_ns, st.st_size]
+    return signature
+
+
+def _text(value: Any) -> str:
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def _read_tables(backend: LedgerBackend) -> Dict[str, Dict[str, list]]:
+    columns = {name: {col: [] for col, _ in spec} for name, spec in SNAPSHOT_TABLES.items()}
+    for s in backend.load_students():
+        for col, kind in SNAPSHOT_TABLES["students"]:
+            columns["students"][col].append(_to_int(s.get(col)) if kind is int else _text(s.get(col)))
+    tx_terms: Dict[str, str] = {}
+    for table, sheet_name in HISTORY_TABLES.items():
+        spec = SNAPSHOT_TABLES[table]
+        for row in backend.history_rows(sheet_name):
+            if table == "transactions":
+                tx_terms[_text(row[0])] = _text(row[2])
+            else:
+                row = tuple(row[:3]) + (tx_terms.get(_text(row[0]), ""),)
+            for (col, kind), value in zip(spec, row):
+                columns[table][col].append(_to_int(value) if kind is int else _text(value))
+            # Rows from older sheets may be short
+            for col, kind in spec[len(row):]:
+                columns[table][col].append(0 if kind is int else "")
+    return columns
+
+
+def export_snapshot(ledger, dest: Optional[str] = None) -> Path:
+    """Write STUDENTS_MASTER and the history of a ledger as a columnar snapshot.
+
+    `ledger` is a ledger path or an open `LedgerBackend`. Each column is
+    stored as a .npy array (int64, or fixed-width unicode for text) that
+    `open_snapshot` memory-maps. Snapshots are written into a new
+    generation directory under `dest` (default `snapshot_dir_for`) and
+    published by swapping the CURRENT pointer, so readers never see a
+    half-written one. Returns the generation directory.
+    """
+    import numpy as np
+
+    backend = open_backend(ledger) if isinstance(ledger, (str, Path)) else ledger
+    try:
+        # Re-read if the ledger was saved while it was being read
+        for _ in range(3):
+            signature = ledger_signature(backend.path)
+            if signature is None:
+                raise FileNotFoundError(f"Ledger not found: {backend.path}")
+            columns = _read_tables(backend)
+            if ledger_signature(backend.path) == signature:
+                break
+    finally:
+        if backend is not ledger:
+            backend.close()
+
+    root = Path(dest) if dest is not None else snapshot_dir_for(backend.path)
+    generation = root / str(time.time_ns())
+    generation.mkdir(parents=True)
+    manifest: Dict[str, Any] = {
+        "ledger": os.path.abspath(backend.path),
+        "signature": signature,
+        "created_at": time.time(),
+        "tables": {},
+    }
+    for table, spec in SNAPSHOT_TABLES.items():
+        manifest["tables"][table] = {"rows": len(columns[table][spec[0][0]]), "columns": [c for c, _ in spec]}
+        for col, kind in spec:
+            values = columns[table][col]
+            array = np.array(values, dtype=np.int64 if kind is int else str)
+            np.save(generation / f"{table}.{col}.npy", array)
+    (generation / MANIFEST).write_text(json.dumps(manifest))
+
+    pointer = root / f".{CURRENT}.tmp"
+    pointer.write_text(generation.name)
+    os.replace(pointer, root / CURRENT)
+    # Keep the previous generation for readers that opened it a moment ago
+    generations = sorted((d for d in root.iterdir() if d.is_dir()), key=lambda d: int(d.name))
+    for old in generations[:-2]:
+        shutil.rmtree(old, ignore_errors=True)
+    return generation
+
+
+class Snapshot:
+    """A published snapshot, with filtered and grouped queries over its tables.
+
+    Columns are memory-mapped on first use, so opening a snapshot and
+    answering a query touches only the columns involved. `where` filters
+    are a mapping of `column` or `column__op` (op one of OPERATORS, `eq`
+    when omitted) to a value; all of them must hold:
+
+        snap.select("students", where={"status": "OVERPAID"})
+        snap.aggregate("students", "balance", by="class_name", where={"balance__gt": 0})
+        snap.aggregate("credits", "amount", where={"term": "2026-T1"})
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.manifest = json.loads((self.path / MANIFEST).read_text())
+        self._columns: Dict[Tuple[str, str], Any] = {}
+
+    @property
+    def created_at(self) -> float:
+        return self.manifest["created_at"]
+
+    def rows(self, table: str) -> int:
+        return self._table(table)["rows"]
+
+    def _table(self, table: str) -> Dict[str, Any]:
+        spec = self.manifest["tables"].get(table)
+        if spec is None:
+            raise ValueError(f"Unknown snapshot table: {table}")
+        return spec
+
+    def column(self, table: str, column: str):
+        """Return one column as a read-only numpy array."""
+        import numpy as np
+
+        if column not in self._table(table)["columns"]:
+            raise ValueError(f"Unknown column '{column}' in snapshot table {table}")
+        key = (table, column)
+        array = self._columns.get(key)
+        if array is None:
+            array = self._columns[key] = np.load(self.path / f"{table}.{column}.npy", mmap_mode="r")
+        return array
+
+    def mask(self, table: str, where: Optional[Dict[str, Any]] = None):
+        """Return the boolean row mask selecting the rows that match `where`."""
+        import numpy as np
+
+        keep = np.ones(self.rows(table), dtype=bool)
+        for key, value in (where or {}).items():
+            column, _, op = key.partition("__")
+            op = op or "eq"
+            if op not in OPERATORS:
+                raise ValueError(f"Unknown filter operator '{op}' in '{key}'")
+            values = self.column(table, column)
+            if op == "in":
+                wanted = np.asarray([_cast(values, v) for v in value])
+                keep &= np.isin(values, wanted)
+                continue
+            value = _cast(values, value)
+            if op == "eq":
+                keep &= values == value
+            elif op == "ne":
+                keep &= values != value
+            elif op == "lt":
+                keep &= values < value
+            elif op == "le":
+                keep &= values <= value
+            elif op == "gt":
+                keep &= values > value
+            else:
+                keep &= values >= value
+        return keep
+
+    def select(
+        self,
+        table: str,
+        columns: Optional[Sequence[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        order_by: Optional[str] = None,
+        descending: bool = False,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Return matching rows as dicts, optionally sorted and truncated."""
+        import numpy as np
+
+        columns = list(columns or self._table(table)["columns"])
+        index = np.flatnonzero(self.mask(table, where))
+        if order_by is not None:
+            index = index[np.argsort(self.column(table, order_by)[index], kind="stable")]
+            if descending:
+                index = index[::-1]
+        if limit is not None:
+            index = index[:limit]
+        data = {c: self.column(table, c)[index].tolist() for c in columns}
+        return [{c: data[c][i] for c in columns} for i in range(len(index))]
+
+    def aggregate(
+        self,
+        table: str,
+        value: str,
+        by: Optional[str] = None,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Sum and count `value` over matching rows, overall or per `by` group.
+
+        Returns {"total", "count"}, or {group: {"total", "count"}} with `by`.
+        """
+        import numpy as np
+
+        keep = self.mask(table, where)
+        values = np.asarray(self.column(table, value)[keep], dtype=np.int64)
+        if by is None:
+            return {"total": int(values.sum()), "count": int(values.size)}
+        keys, groups = np.unique(self.column(table, by)[keep], return_inverse=True)
+        totals = np.zeros(len(keys), dtype=np.int64)
+        np.add.at(totals, groups, values)
+        counts = np.bincount(groups, minlength=len(keys))
+        return {
+            str(k): {"total": int(t), "count": int(c)}
+            for k, t, c in zip(keys.tolist(), totals.tolist(), counts.tolist())
+        }
+
+
+def _cast(column, value: Any) -> Any:
+    # Filters typed on the command line arrive as strings
+    if column.dtype.kind in "iu":
+        return int(value)
+    return _text(value)
+
+
+def open_snapshot(path: str) -> Snapshot:
+    """Open the current snapshot under `path` (a snapshot directory or a ledger path)."""
+    root = Path(path)
+    if not (root / CURRENT).exists():
+        root = snapshot_dir_for(path)
+    try:
+        generation = (root / CURRENT).read_text().strip()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"No snapshot found for {path}") from None
+    return Snapshot(str(root / generation))
+
+
+class SnapshotExporter:
+    """Background thread that re-exports each ledger's snapshot after it changes.
+
+    Every `interval` seconds the ledgers are checked, and a ledger whose
+    `ledger_signature` differs from its current snapshot's is exported
+    again. Exports read the saved ledger, never the payment path's state.
+    """
+
+    def __init__(self, ledger_paths: Iterable[str], interval: float):
+        self.ledger_paths = [str(p) for p in ledger_paths]
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def export_changed(self) -> List[str]:
+        """Export every ledger whose snapshot is out of date. Returns their paths."""
+        exported = []
+        for path in self.ledger_paths:
+            signature = ledger_signature(path)
+            if signature is None:
+                continue
+            try:
+                stored = open_snapshot(path).manifest["signature"]
+            except FileNotFoundError:
+                stored = None
+            if stored != signature:
+                export_snapshot(path)
+                exported.append(path)
+        return exported
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="snapshot-exporter", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.interval):
+            try:
+                self.export_changed()
+            except Exception:
+                # Reporting can lag; try again on the next tick
+                pass
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def exporter_from_env(ledger_paths: Iterable[str]) -> Optional[SnapshotExporter]:
+    """Build the exporter if FEES_SNAPSHOT_INTERVAL (seconds) is set and positive."""
+    interval = float(os.environ.get("FEES_SNAPSHOT_INTERVAL", "0") or 0)
+    return SnapshotExporter(ledger_paths, interval) if interval > 0 else None
+
+
+def _parse_where(items: Optional[List[str]]) -> Dict[str, Any]:
+    where: Dict[str, Any] = {}
+    for item in items or []:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"Filters look like column=value or column__op=value, got '{item}'")
+        where[key] = value.split(",") if key.endswith("__in") else value
+    return where
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Export and query columnar ledger snapshots.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="write a snapshot of a ledger")
+    exp.add_argument("ledger")
+    exp.add_argument("--dest", help="snapshot directory (default: <ledger>_snapshot)")
+    query = sub.add_parser("query", help="filter, group and sum a snapshot table")
+    query.add_argument("snapshot", help="snapshot directory or ledger path")
+    query.add_argument("table", choices=sorted(SNAPSHOT_TABLES))
+    query.add_argument("--where", nargs="*", help="column=value or column__op=value filters")
+    query.add_argument("--sum", dest="value", help="sum this column instead of listing rows")
+    query.add_argument("--by", help="group the sum by this column")
+    query.add_argument("--columns", nargs="*")
+    query.add_argument("--limit", type=int)
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        print(export_snapshot(args.ledger, args.dest))
+        return
+    snap = open_snapshot(args.snapshot)
+    where = _parse_where(args.where)
+    if args.value:
+        result: Any = snap.aggregate(args.table, args.value, by=args.by, where=where)
+    else:
+        result = snap.select(args.table, columns=args.columns, where=where, limit=args.limit)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.synthetic import generate_workbook
+
+# `uvicorn app.main:app` must answer GET / within this many seconds of being
+# spawned, and its import of app.main must not pull these modules in
+COLD_START_TARGET_SECONDS = 1.5
+DEFERRED_MODULES = ("openpyxl", "pandas", "numpy")
+
+APP_DIR = Path(__file__).resolve().parent.parent
+
+
+def import_profile(top: int = 10) -> Dict[str, Any]:
+    """Import app.main in a fresh interpreter and report where the time goes.
+
+    Returns the total import time, the `top` slowest modules by cumulative
+    time, and which of DEFERRED_MODULES got imported.
+    """
+    code = "import sys, app.main; print(','.join(m for m in %r if m in sys.modules))" % (DEFERRED_MODULES,)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=APP_DIR, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    app_main = next((r for r in rows if r[2] == "app.main"), (0, 0, "app.main"))
+    slowest = sorted(rows, reverse=True)[:top]
+    loaded = proc.stdout.strip()
+    return {
+        "import_seconds": round(app_main[0] / 1e6, 3),
+        "slowest": [{"module": name, "cumulative_ms": round(cum / 1000, 1)} for cum, _, name in slowest],
+        "deferred_modules_loaded": loaded.split(",") if loaded else [],
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get(url: str, data: Optional[bytes] = None) -> int:
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=5) as resp:
+        return resp.status
+
+
+def measure_cold_start(workbook: Optional[str] = None, timeout: float = 30.0) -> Dict[str, Any]:
+    """Spawn `uvicorn app.main:app` and time it until it answers GET /, then a callback."""
+    port = _free_port()
+    env = dict(os.environ)
+    if workbook:
+        env["FEES_WORKBOOK"] = workbook
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        ready = None
+        while time.perf_counter() - started < timeout:
+            try:
+                if _get(base + "/") == 200:
+                    ready = time.perf_counter() - started
+                    break
+            except OSError:
+                time.sleep(0.01)
+        if ready is None:
+            raise RuntimeError(f"server did not answer within {timeout}s")
+        first_callback = None
+        if workbook:
+            body = json.dumps({"TransID": "COLD-1", "TransAmount": 100, "BillRefNumber": "00001"}).encode()
+            if _get(base + "/mpesa/callback", body) == 200:
+                first_callback = time.perf_counter() - started
+        return {
+            "ready_seconds": round(ready, 3),
+            "first_callback_seconds": round(first_callback, 3) if first_callback is not None else None,
+        }
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Profile app startup and measure uvicorn cold start.")
+    parser.add_argument("--students", type=int, default=3000, help="roster size of the synthetic workbook")
+    parser.add_argument("--history", type=int, default=10000, help="TRANSACTIONS rows of the synthetic workbook")
+    parser.add_argument("--target", type=float, default=COLD_START_TARGET_SECONDS)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="fees-cold-") as workdir:
+        workbook = str(Path(workdir) / "SCHOOL_FEES_AUTOMATION.xlsx")
+        generate_workbook(workbook, students=args.students, history=args.history)
+        result = {"profile": import_profile(), "cold_start": measure_cold_start(workbook), "target_seconds": args.target}
+    print(json.dumps(result, indent=2))
+
+    failures = []
+    if result["cold_start"]["ready_seconds"] > args.target:
+        failures.append(f"ready in {result['cold_start']['ready_seconds']}s, target {args.target}s")
+    if result["profile"]["deferred_modules_loaded"]:
+        failures.append(f"app.main imports {result['profile']['deferred_modules_loaded']} at startup")
+    for message in failures:
+        print(f"COLD START {message}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
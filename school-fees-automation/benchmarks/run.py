@@ -0,0 +1,221 @@
+import argparse
+import json
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.allocator import AllocationEngine, allocate_payment
+from app.core.excel import apply_payment_to_excel
+from app.mpesa.parser import parse_reference
+
+from benchmarks.synthetic import generate_workbook, random_reference
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+# A benchmark regresses when its p95 latency grows, or its throughput
+# drops, by more than this fraction against the baseline
+DEFAULT_TOLERANCE = 0.25
+# With fewer samples than this the p95 is just the slowest run or two, so
+# the workbook read/save benchmarks are gated on their median instead
+MIN_P95_SAMPLES = 100
+DEFAULT_IO_ITERATIONS = 20
+
+
+def _stats(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    n = len(samples)
+    total = sum(samples)
+
+    def pct(q: float) -> float:
+        return samples[min(n - 1, int(q * n))] * 1000
+
+    return {
+        "iterations": n,
+        "ops_per_sec": round(n / total, 1) if total > 0 else None,
+        "mean_ms": round(total / n * 1000, 4),
+        "p50_ms": round(pct(0.5), 4),
+        "p95_ms": round(pct(0.95), 4),
+        "p99_ms": round(pct(0.99), 4),
+        "max_ms": round(samples[-1] * 1000, 4),
+    }
+
+
+def measure(fn: Callable[[int], Any], iterations: int, warmup: int = 1) -> Dict[str, float]:
+    """Call `fn(i)` `iterations` times and return latency and throughput stats."""
+    for i in range(warmup):
+        fn(-1 - i)
+    samples = []
+    clock = time.perf_counter
+    for i in range(iterations):
+        started = clock()
+        fn(i)
+        samples.append(clock() - started)
+    return _stats(samples)
+
+
+def bench_parse_reference(refs: List[str]) -> Dict[str, float]:
+    return measure(lambda i: parse_reference(refs[i % len(refs)]), len(refs))
+
+
+def bench_allocate_payment(students: List[Dict[str, Any]], refs: List[List[str]]) -> Dict[str, float]:
+    by_adm = {s["admission_no"]: s for s in students}
+
+    def run(i):
+        order = refs[i % len(refs)]
+        allocate_payment([by_adm[a] for a in order], 7500, order)
+
+    return measure(run, len(refs))
+
+
+def bench_allocation_engine(students: List[Dict[str, Any]], refs: List[List[str]]) -> Dict[str, float]:
+    engine = AllocationEngine(students)
+    return measure(lambda i: engine.process(7500, refs[i % len(refs)]), len(refs))
+
+
+def bench_find_students(path: str, iterations: int) -> Dict[str, float]:
+    from app.mpesa.webhook import _find_students_from_workbook
+
+    return measure(lambda i: _find_students_from_workbook(path), iterations)
+
+
+def bench_apply_payment(path: str, adms: List[str], iterations: int, term: str) -> Dict[str, float]:
+    def run(i):
+        adm = adms[i % len(adms)]
+        apply_payment_to_excel(path, f"BENCH-APPLY-{i}", 500, [adm], {adm: 500}, 0, term)
+
+    return measure(run, iterations)
+
+
+def bench_callback(path: str, raw_refs: List[str], term: str) -> Dict[str, float]:
+    from fastapi.testclient import TestClient
+
+    from app.mpesa import webhook
+
+    webhook.EXCEL_PATH = path
+    webhook.CURRENT_TERM = term
+    from app.main import app
+
+    with TestClient(app) as client:
+        def run(i):
+            response = client.post("/mpesa/callback", json={
+                "TransID": f"BENCH-CB-{i}",
+                "TransAmount": 500,
+                "BillRefNumber": raw_refs[i % len(raw_refs)],
+            })
+            response.raise_for_status()
+
+        return measure(run, len(raw_refs))
+
+
+def run_benchmarks(
+    students: int = 3000,
+    history: int = 10000,
+    iterations: int = 2000,
+    io_iterations: int = DEFAULT_IO_ITERATIONS,
+    seed: int = 0,
+    only: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Run the suite against a fresh synthetic workbook and return the results document."""
+    term = "2026-T1"
+    rng = random.Random(seed)
+    workdir = Path(tempfile.mkdtemp(prefix="fees-bench-"))
+    try:
+        source = workdir / "source.xlsx"
+        adms = generate_workbook(str(source), students=students, history=history, term=term, seed=seed)
+        raw_refs = [random_reference(rng, adms) for _ in range(iterations)]
+        parsed = [parse_reference(r) for r in raw_refs]
+        roster = [{"admission_no": a, "balance": 40000} for a in adms]
+
+        def fresh_copy(name: str) -> str:
+            dest = workdir / name
+            shutil.copyfile(source, dest)
+            return str(dest)
+
+        suite = {
+            "parse_reference": lambda: bench_parse_reference(raw_refs),
+            "allocate_payment": lambda: bench_allocate_payment(roster, parsed),
+            "allocation_engine": lambda: bench_allocation_engine(roster, parsed),
+            "find_students_from_workbook": lambda: bench_find_students(str(source), io_iterations),
+            "apply_payment_to_excel": lambda: bench_apply_payment(fresh_copy("apply.xlsx"), adms, io_iterations, term),
+            "callback": lambda: bench_callback(fresh_copy("callback.xlsx"), raw_refs[: max(1, iterations // 10)], term),
+        }
+        results = {}
+        for name, bench in suite.items():
+            if only and name not in only:
+                continue
+            results[name] = bench()
+    finally:
+        from app.core.persistence import close_writers
+
+        close_writers()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "params": {"students": students, "history": history, "iterations": iterations,
+                   "io_iterations": io_iterations, "seed": seed},
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Return a message for every benchmark that regressed against `baseline`.
+
+    Latency is compared at p95, or at the median for benchmarks the
+    baseline ran fewer than `MIN_P95_SAMPLES` times.
+    """
+    regressions = []
+    if current.get("params") != baseline.get("params"):
+        regressions.append(f"parameters differ from baseline: {current.get('params')} vs {baseline.get('params')}")
+    for name, base in baseline.get("results", {}).items():
+        cur = current.get("results", {}).get(name)
+        if cur is None:
+            continue
+        key = "p95_ms" if base.get("iterations", MIN_P95_SAMPLES) >= MIN_P95_SAMPLES else "p50_ms"
+        if cur[key] > base[key] * (1 + tolerance):
+            regressions.append(f"{name}: {key[:3]} {cur[key]}ms vs baseline {base[key]}ms")
+        if base.get("ops_per_sec") and cur["ops_per_sec"] < base["ops_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: {cur['ops_per_sec']} ops/s vs baseline {base['ops_per_sec']} ops/s")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the payment hot path on a synthetic workbook.")
+    parser.add_argument("--students", type=int, default=3000)
+    parser.add_argument("--history", type=int, default=10000, help="TRANSACTIONS rows in the workbook")
+    parser.add_argument("--iterations", type=int, default=2000, help="calls for the in-memory benchmarks")
+    parser.add_argument("--io-iterations", type=int, default=DEFAULT_IO_ITERATIONS,
+                        help="calls for the workbook read/save benchmarks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", help="benchmark names to run")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH), help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args(argv)
+
+    current = run_benchmarks(args.students, args.history, args.iterations, args.io_iterations, args.seed, args.only)
+    text = json.dumps(current, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    if args.save_baseline:
+        Path(args.baseline).write_text(text + "\n")
+        return 0
+
+    baseline_path = Path(args.baseline)
+    if not baseline_path.exists():
+        print(f"No baseline at {baseline_path}; run with --save-baseline to create one", file=sys.stderr)
+        return 0
+    regressions = compare(current, json.loads(baseline_path.read_text()), args.tolerance)
+    for message in regressions:
+        print(f"REGRESSION {message}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
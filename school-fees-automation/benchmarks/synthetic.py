@@ -0,0 +1,54 @@
+import random
+from typing import Any, Dict, List
+
+from app.core.allocator import status_for_balance
+from app.core.excel import write_school_workbook
+
+CLASSES = ["F1", "F2", "F3", "F4"]
+
+
+def admission_numbers(count: int) -> List[str]:
+    return [f"{i:05d}" for i in range(1, count + 1)]
+
+
+def random_reference(rng: random.Random, adms: List[str]) -> str:
+    """A BillRefNumber naming 1-3 distinct students, mostly just one."""
+    k = rng.choices((1, 2, 3), weights=(80, 15, 5))[0]
+    sep = rng.choice(("|", ","))
+    return sep.join(rng.sample(adms, k))
+
+
+def generate_workbook(
+    path: str,
+    students: int = 3000,
+    history: int = 10000,
+    term: str = "2026-T1",
+    seed: int = 0,
+) -> List[str]:
+    """Write a synthetic SCHOOL_FEES_AUTOMATION.xlsx and return its admission numbers.
+
+    `history` is the number of TRANSACTIONS rows; each gets one ALLOCATIONS
+    row. The same `seed` always produces the same workbook.
+    """
+    rng = random.Random(seed)
+    adms = admission_numbers(students)
+    rows: List[Dict[str, Any]] = []
+    for adm in adms:
+        balance = rng.randrange(0, 60000, 500)
+        rows.append({
+            "admission_no": adm,
+            "name": f"Student {adm}",
+            "class_name": rng.choice(CLASSES),
+            "paid_total": 0,
+            "credit": 0,
+            "balance": balance,
+            "status": status_for_balance(balance),
+        })
+    transactions, allocations = [], []
+    for i in range(history):
+        adm = rng.choice(adms)
+        amount = rng.randrange(500, 20000, 500)
+        transactions.append((f"H{i:08d}", amount, term, adm, 0, f"2026-01-{1 + i % 28:02d}T08:00:00"))
+        allocations.append((f"H{i:08d}", adm, amount))
+    write_school_workbook(path, rows, {"TRANSACTIONS": transactions, "ALLOCATIONS": allocations, "CREDITS": []})
+    return adms
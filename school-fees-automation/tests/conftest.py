@@ -0,0 +1,79 @@
+import pytest
+from openpyxl import Workbook
+
+
+STUDENT_HEADERS = ["Admission_No", "Name", "Class", "PaidTotal", "Credit", "Balance", "Status"]
+
+
+def write_workbook(path, students):
+    """Write a minimal SCHOOL_FEES_AUTOMATION workbook with the given students.
+
+    `students` is a list of (admission_no, balance) or
+    (admission_no, balance, class) tuples.
+    """
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "STUDENTS_MASTER"
+    ws.append(STUDENT_HEADERS)
+    for s in students:
+        adm, bal = s[0], s[1]
+        cls = s[2] if len(s) > 2 else "F1"
+        ws.append([adm, f"Student {adm}", cls, 0, 0, bal, "PARTIAL" if bal > 0 else "PAID"])
+    wb.save(path)
+    return path
+
+
+def payment_entry(tx_id, allocations, remaining_credit=0, refs=None, term="2026-T1",
+                  received_at="2026-02-03T10:00:00"):
+    """Build an allocation result as the pipeline journals it.
+
+    The amount is what was allocated plus `remaining_credit`; `refs`
+    defaults to the allocated admission numbers.
+    """
+    return {
+        "tx_id": tx_id,
+        "amount": sum(allocations.values()) + remaining_credit,
+        "reference_order": refs or list(allocations),
+        "allocations": allocations,
+        "remaining_credit": remaining_credit,
+        "term": term,
+        "received_at": received_at,
+    }
+
+
+@pytest.fixture
+def payment():
+    """The `payment_entry` factory."""
+    return payment_entry
+
+
+@pytest.fixture
+def make_workbook(tmp_path):
+    """Factory writing a workbook `name` in tmp_path (see `write_workbook`); returns its path."""
+    def make(name, students):
+        return str(write_workbook(tmp_path / name, students))
+    return make
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    return str(write_workbook(tmp_path / "SCHOOL_FEES_AUTOMATION.xlsx", [
+        ("041", 10000),
+        ("1043", 5000),
+        ("2001", 0),
+    ]))
+
+
+@pytest.fixture
+def client(workbook, monkeypatch):
+    """A TestClient for the app, serving the `workbook` school."""
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+    from app.mpesa import webhook
+
+    monkeypatch.setattr(webhook, "EXCEL_PATH", workbook)
+    monkeypatch.setattr(webhook, "CURRENT_TERM", "2026-T1")
+    monkeypatch.delenv("FEES_TENANTS", raising=False)
+    with TestClient(app) as c:
+        yield c
@@ -0,0 +1,85 @@
+from app.core.persistence import WriteBehindWriter
+from app.core.sqlite_store import import_from_excel
+
+
+def test_aggregates_follow_submitted_payments(workbook, payment):
+    writer = WriteBehindWriter(workbook, batch_size=1000)
+    reports = writer.report_aggregates()
+    assert reports.outstanding == 15000
+
+    writer.submit(payment("T1", {"041": 4000}))
+    writer.submit(payment("T2", {"1043": 5000}, 1000, received_at="2026-02-04T10:00:00"))
+    # Replaying the same TransID is not counted twice
+    writer.reports.add_entries(writer.ledger, [payment("T1", {"041": 4000})])
+
+    summary = reports.daily("2026-02-03", "2026-T1")
+    assert (summary["total"], summary["count"]) == (4000, 1)
+    assert summary["term"] == {"term": "2026-T1", "total": 10000, "count": 2}
+    assert summary["outstanding_balance"] == 6000
+    assert summary["overpaid_credit"] == 1000
+    assert summary["by_status"]["OVERPAID"] == {"students": 1, "balance": -1000}
+    assert reports.by_class_totals() == {"F1": {"total": 10000, "count": 2}}
+    writer.close()
+
+
+def test_aggregates_are_rebuilt_from_history(tmp_path, workbook, payment):
+    writer = WriteBehindWriter(workbook, batch_size=1000)
+    writer.submit(payment("T1", {"041": 4000}))
+    writer.submit(payment("T2", {"1043": 3000}, refs=["1043", "2001"]))
+    writer.close()
+
+    db = str(tmp_path / "fees.db")
+    import_from_excel(workbook, db).close()
+    for path in (workbook, db):
+        fresh = WriteBehindWriter(path)
+        summary = fresh.report_aggregates().daily("2026-02-03", "2026-T1")
+        assert (summary["total"], summary["count"]) == (7000, 2)
+        assert summary["outstanding_balance"] == 8000
+        fresh.close()
+
+
+def test_aggregates_pick_up_payments_from_other_writers(make_workbook, payment):
+    path = make_workbook("fees.xlsx", [("041", 10000, "F1"), ("052", 8000, "F2")])
+    ours = WriteBehindWriter(path, batch_size=1000)
+    other = WriteBehindWriter(path, batch_size=1000)
+    ours.report_aggregates()
+
+    other.submit(payment("T1", {"052": 2000}))
+    other.flush()
+
+    reports = ours.report_aggregates()
+    assert reports.daily("2026-02-03")["count"] == 1
+    assert reports.by_class_totals() == {"F2": {"total": 2000, "count": 1}}
+    assert reports.outstanding == 16000
+    ours.close()
+    other.close()
+
+
+def test_rebuild_recounts_history_and_journal(workbook, payment):
+    writer = WriteBehindWriter(workbook, batch_size=1000)
+    writer.submit(payment("T1", {"041": 4000}))
+    writer.flush()
+    writer.submit(payment("T2", {"1043": 3000}))
+    reports = writer.report_aggregates()
+    reports.by_day["2026-02-03"]["total"] += 999
+
+    reports = writer.rebuild_reports()
+    summary = reports.daily("2026-02-03", "2026-T1")
+    assert (summary["total"], summary["count"]) == (7000, 2)
+    assert summary["term"]["total"] == 7000
+    writer.close()
+
+
+def test_daily_and_rebuild_endpoints(client):
+    callback = {"TransID": "TX1", "TransAmount": 3000, "BillRefNumber": "041", "BusinessShortCode": "600100"}
+    assert client.post("/mpesa/callback", json=callback).json() == {"status": "ok"}
+
+    summary = client.get("/reports/daily", params={"term": "2026-T1"}).json()
+    assert (summary["count"], summary["total"]) == (1, 3000)
+    assert summary["term"] == {"term": "2026-T1", "total": 3000, "count": 1}
+    assert summary["outstanding_balance"] == 12000
+    assert summary["by_class"] == {"F1": {"total": 3000, "count": 1}}
+
+    rebuilt = client.post("/reports/rebuild").json()
+    assert rebuilt["term"] == summary["term"]
+    assert rebuilt["outstanding_balance"] == 12000
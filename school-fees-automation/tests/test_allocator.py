@@ -1,6 +1,6 @@
 import pytest
 
-from app.core.allocator import allocate_payment
+from app.core.allocator import AllocationEngine, allocate_batch, allocate_payment, split_credit
 
 
 def test_balance_first_ordering():
@@ -68,4 +68,49 @@ def test_invalid_inputs_raise_value_error():
     # student balance not int/non-negative
     bad_students = [{"admission_no": "S1", "balance": "100"}]
     with pytest.raises(ValueError):
-        allocate_payment(bad_students, 50, ["S1"])
\ No newline at end of file
+        allocate_payment(bad_students, 50, ["S1"])
+
+
+def test_allocate_batch_matches_sequential_allocation():
+    balances = {"A": 100, "B": 300, "C": 200}
+    payments = [(400, ["A", "B", "C"]), (50, ["A"]), (500, ["C", "A", "Z"]), (10, ["B"])]
+
+    expected = []
+    state = dict(balances)
+    for amount, refs in payments:
+        students = [{"admission_no": k, "balance": v} for k, v in state.items()]
+        res = allocate_payment(students, amount, refs)
+        for adm, alloc in res["allocations"].items():
+            state[adm] -= alloc
+        for adm, share in split_credit(res["remaining_credit"], [r for r in refs if r in state]).items():
+            state[adm] -= share
+        expected.append(res)
+
+    assert allocate_batch(balances, payments) == expected
+    assert balances == state
+
+
+def test_allocation_engine_matches_allocate_payment():
+    students = [
+        {"admission_no": "A", "balance": 100},
+        {"admission_no": "B", "balance": 300},
+        {"admission_no": "C", "balance": 300},
+        {"admission_no": "A", "balance": 999},
+    ]
+    engine = AllocationEngine(students)
+    for amount, refs in [(400, ["A", "C", "B"]), (50, ["A"]), (0, ["B"]), (900, ["Z", "B", "B"])]:
+        assert engine.allocate(amount, refs) == allocate_payment(students, amount, refs)
+
+    res = engine.process(1000, ["C", "A"])
+    assert res == {"allocations": {"C": 300, "A": 100}, "remaining_credit": 600}
+    assert engine.balances() == {"A": -300, "B": 300, "C": -300}
+
+
+def test_allocation_engine_validates_once():
+    with pytest.raises(ValueError, match="balance for S1 must be an int"):
+        AllocationEngine([{"admission_no": "S1", "balance": "100"}])
+    engine = AllocationEngine([{"admission_no": "S1", "balance": 100}])
+    with pytest.raises(ValueError):
+        engine.allocate(-1, ["S1"])
+    with pytest.raises(ValueError):
+        engine.apply({"allocations": {"S2": 10}, "remaining_credit": 0}, ["S2"])
@@ -0,0 +1,49 @@
+from openpyxl import load_workbook
+
+from app.core.archive import archive_dir_for, archived_terms, history_transaction_results, iter_history
+from app.core.storage import ExcelBackend
+
+
+def test_new_term_rotates_history_out_of_the_workbook(workbook, payment):
+    backend = ExcelBackend(workbook)
+    backend.apply_payments([payment("T1", {"041": 100}, 5), payment("T2", {"1043": 200})])
+    backend.apply_payments([payment("T3", {"041": 300}, term="2026-T2")])
+
+    wb = load_workbook(workbook)
+    assert [r[0] for r in wb["TRANSACTIONS"].iter_rows(min_row=2, values_only=True)] == ["T3"]
+    assert [r[0] for r in wb["ALLOCATIONS"].iter_rows(min_row=2, values_only=True)] == ["T3"]
+    assert wb["CREDITS"].max_row == 1
+    assert archived_terms(archive_dir_for(workbook)) == ["2026-T1"]
+
+    assert [r[0] for r in iter_history(workbook, "TRANSACTIONS")] == ["T1", "T2", "T3"]
+    assert list(iter_history(workbook, "ALLOCATIONS", terms=["2026-T1"])) == [("T1", "041", 100), ("T2", "1043", 200)]
+    assert list(iter_history(workbook, "CREDITS")) == [("T1", "041", 5)]
+    assert history_transaction_results(workbook)["T1"] == {"allocations": {"041": 100}, "remaining_credit": 5}
+
+
+def test_rows_both_archived_and_live_are_returned_once(workbook, payment):
+    backend = ExcelBackend(workbook)
+    backend.apply_payments([payment("T1", {"041": 100})])
+    backend.apply_payments([payment("T2", {"041": 100}, term="2026-T2")])
+    # Simulate a crash after the shard was written but before the save
+    backend.archive_dir = False
+    backend.apply_payments([payment("T1", {"041": 100})])
+
+    assert [r[0] for r in iter_history(workbook, "TRANSACTIONS")] == ["T1", "T2"]
+
+
+def _live_transactions(path):
+    return [r[0] for r in load_workbook(path)["TRANSACTIONS"].iter_rows(min_row=2, values_only=True)]
+
+
+def test_batch_mixing_terms_keeps_each_of_them_live(workbook, payment):
+    backend = ExcelBackend(workbook)
+    backend.apply_payments([payment("T1", {"041": 100})])
+    backend.apply_payments([payment("T2", {"041": 200}, term="2026-T2")])
+    assert _live_transactions(workbook) == ["T2"]
+
+    # A new-term payment, then a late one for the previous term, in one batch
+    backend.apply_payments([payment("T3", {"041": 300}, term="2026-T2"), payment("T4", {"1043": 400})])
+    assert _live_transactions(workbook) == ["T2", "T3", "T4"]
+    assert [r[0] for r in iter_history(workbook, "TRANSACTIONS", terms=["2026-T1"])] == ["T1", "T4"]
+    assert [r[0] for r in iter_history(workbook, "TRANSACTIONS")] == ["T1", "T2", "T3", "T4"]
@@ -0,0 +1,37 @@
+from app.core.excel import read_history_rows, read_students_master
+from benchmarks.run import compare, measure
+from benchmarks.synthetic import generate_workbook
+
+
+def test_generate_workbook_is_deterministic(tmp_path):
+    first, second = tmp_path / "a.xlsx", tmp_path / "b.xlsx"
+    adms = generate_workbook(str(first), students=20, history=30, seed=7)
+    generate_workbook(str(second), students=20, history=30, seed=7)
+
+    assert len(adms) == 20
+    assert read_students_master(str(first)) == read_students_master(str(second))
+    assert len(read_history_rows(str(first), "TRANSACTIONS")) == 30
+
+
+def test_compare_flags_slower_results():
+    stats = measure(lambda i: None, 10)
+    assert stats["iterations"] == 10
+
+    baseline = {"params": {"students": 1}, "results": {"save": {"p95_ms": 100.0, "ops_per_sec": 10.0}}}
+    ok = {"params": {"students": 1}, "results": {"save": {"p95_ms": 110.0, "ops_per_sec": 9.0}}}
+    slow = {"params": {"students": 1}, "results": {"save": {"p95_ms": 200.0, "ops_per_sec": 5.0}}}
+    assert compare(ok, baseline) == []
+    assert len(compare(slow, baseline)) == 2
+
+    # A handful of workbook saves is gated on the median, not the slowest run
+    io = {"params": {}, "results": {"save": {"iterations": 20, "p50_ms": 100.0, "p95_ms": 150.0}}}
+    outlier = {"params": {}, "results": {"save": {"iterations": 20, "p50_ms": 105.0, "p95_ms": 400.0}}}
+    assert compare(outlier, io) == []
+    outlier["results"]["save"]["p50_ms"] = 200.0
+    assert compare(outlier, io) == ["save: p50 200.0ms vs baseline 100.0ms"]
+
+
+def test_app_import_defers_heavy_modules():
+    from benchmarks.cold_start import import_profile
+
+    assert import_profile()["deferred_modules_loaded"] == []
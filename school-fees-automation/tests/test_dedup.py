@@ -0,0 +1,65 @@
+import asyncio
+
+from openpyxl import load_workbook
+
+from app.core.dedup import TransactionIndex
+from app.core.persistence import WriteBehindWriter
+from app.core.pipeline import PaymentPipeline
+
+
+def test_index_is_seeded_from_history_sheets_once(workbook):
+    wb = load_workbook(workbook)
+    ws = wb.create_sheet("TRANSACTIONS")
+    ws.append(["TxID", "Amount", "Term", "ReferenceOrder", "RemainingCredit"])
+    ws.append(["OLD1", 12000, "2026-T1", "041", 2000])
+    ws = wb.create_sheet("ALLOCATIONS")
+    ws.append(["TxID", "AdmissionNo", "AllocatedAmount"])
+    ws.append(["OLD1", "041", 10000])
+    wb.save(workbook)
+
+    index = TransactionIndex(workbook)
+    index.refresh()
+    assert index.get("OLD1") == {"allocations": {"041": 10000}, "remaining_credit": 2000}
+    assert index.sidecar.path.exists()
+
+    # A fresh index reads the sidecar, even if the sheets are gone
+    wb = load_workbook(workbook)
+    del wb["TRANSACTIONS"]
+    wb.save(workbook)
+    again = TransactionIndex(workbook)
+    again.refresh()
+    assert "OLD1" in again
+
+
+def test_retried_trans_id_is_not_applied_twice(workbook):
+    writer = WriteBehindWriter(workbook, batch_size=1000)
+    pipeline = PaymentPipeline(workbook, "2026-T1", writer=writer)
+
+    async def run():
+        first = await pipeline.submit("T1", 3000, ["041"])
+        retry = await pipeline.submit("T1", 3000, ["041"])
+        await pipeline.stop()
+        return first, retry
+
+    first, retry = asyncio.run(run())
+    assert retry == {**first, "duplicate": True}
+    assert writer.ledger.get("041").balance == 7000
+    assert len(writer.pending()) == 1
+
+
+def test_trans_id_recovered_from_the_journal_survives_later_restarts(workbook, payment):
+    writer = WriteBehindWriter(workbook, batch_size=1000)
+    writer.submit(payment("T1", {"041": 3000}))
+    # Crash after the journal fsync, before the sidecar append
+    writer.transactions.sidecar.rewrite([])
+
+    recovered = WriteBehindWriter(workbook, batch_size=1000)
+    assert recovered.recover() == 1
+    assert "T1" in recovered.transactions
+    recovered.close()
+
+    restarted = WriteBehindWriter(workbook, batch_size=1000)
+    restarted.sync()
+    assert restarted.journal.read() == []
+    assert restarted.transactions.get("T1") == {"allocations": {"041": 3000}, "remaining_credit": 0}
+    restarted.close()
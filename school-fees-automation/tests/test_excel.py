@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+from openpyxl import load_workbook
+
+from app.core.excel import apply_payment_to_excel, read_students_master, students_master_schema
+from app.core.persistence import WriteBehindWriter
+from app.core.recompute import recompute_roster
+
+
+def _master(path):
+    return load_workbook(path)["STUDENTS_MASTER"]
+
+
+def test_schema_is_cached_until_the_header_row_changes(workbook):
+    first = students_master_schema(_master(workbook), workbook)
+    assert (first.admission_no, first.balance, first.status) == (1, 6, 7)
+    assert students_master_schema(_master(workbook), workbook) is first
+
+    wb = load_workbook(workbook)
+    ws = wb["STUDENTS_MASTER"]
+    ws.insert_cols(2)
+    ws.cell(row=1, column=2, value="Notes")
+    wb.save(workbook)
+
+    moved = students_master_schema(_master(workbook), workbook)
+    assert moved is not first
+    assert (moved.admission_no, moved.balance, moved.status) == (1, 7, 8)
+    assert read_students_master(workbook)[0]["balance"] == 10000
+
+
+def test_missing_required_column_is_reported(workbook):
+    wb = load_workbook(workbook)
+    wb["STUDENTS_MASTER"].cell(row=1, column=7, value="Remarks")
+    wb.save(workbook)
+
+    # Status is optional for reading but required for writing
+    assert len(read_students_master(workbook)) == 3
+    with pytest.raises(ValueError, match=r"Required columns \(Status\) not found in STUDENTS_MASTER"):
+        apply_payment_to_excel(workbook, "T1", 100, ["041"], {"041": 100}, 0, "2026-T1")
+
+
+def test_recompute_rebuilds_the_roster_from_history(workbook):
+    writer = WriteBehindWriter(workbook, batch_size=1000)
+    for tx_id, amount, refs, allocations, credit, term in [
+        ("T1", 4000, ["041"], {"041": 4000}, 0, "2025-T3"),
+        ("T2", 6000, ["1043", "2001"], {"1043": 5000}, 1000, "2026-T1"),
+    ]:
+        writer.submit({"tx_id": tx_id, "amount": amount, "reference_order": refs, "allocations": allocations,
+                       "remaining_credit": credit, "term": term})
+    writer.close()
+    expected = [tuple(r) for r in _master(workbook).iter_rows(values_only=True)]
+    assert expected[1:] == [
+        ("041", "Student 041", "F1", 4000, 0, 6000, "PARTIAL"),
+        ("1043", "Student 1043", "F1", 5000, 500, -500, "OVERPAID"),
+        ("2001", "Student 2001", "F1", 0, 500, -500, "OVERPAID"),
+    ]
+    assert recompute_roster(workbook) == 0
+
+    # A hand edit of PaidTotal is refused, or undone with force, keeping the fees charged
+    wb = load_workbook(workbook)
+    wb["STUDENTS_MASTER"]["D2"] = 1500
+    wb["STUDENTS_MASTER"]["G2"] = None
+    wb.save(workbook)
+    with pytest.raises(ValueError, match=r"1 student\(s\).*\(041\)"):
+        recompute_roster(workbook)
+    assert recompute_roster(workbook, force=True) == 1
+    row = [tuple(r) for r in _master(workbook).iter_rows(values_only=True)][1]
+    assert row == ("041", "Student 041", "F1", 4000, 0, 3500, "PARTIAL")
+
+
+def test_recompute_refuses_to_drop_opening_amounts(workbook):
+    wb = load_workbook(workbook)
+    # Paid before the app was in use: on the roster, not in the history
+    wb["STUDENTS_MASTER"]["D2"] = 3000
+    wb["STUDENTS_MASTER"]["F2"] = 7000
+    wb.save(workbook)
+    before = open(workbook, "rb").read()
+
+    with pytest.raises(ValueError, match=r"\(041\)"):
+        recompute_roster(workbook)
+    assert open(workbook, "rb").read() == before
+
+
+def test_recompute_waits_for_a_batch_being_saved(workbook, payment):
+    writer = WriteBehindWriter(workbook, batch_size=1000)
+    writer.submit(payment("T1", {"041": 100}))
+    save = writer.backend.apply_payments
+    recompute = threading.Thread(target=recompute_roster, args=(workbook,))
+
+    def slow_save(batch):
+        recompute.start()
+        # Loading the workbook now and saving it after this batch would lose T1
+        recompute.join(0.3)
+        assert recompute.is_alive()
+        save(batch)
+
+    writer.backend.apply_payments = slow_save
+    assert writer.flush() == 1
+    recompute.join(5)
+    assert not recompute.is_alive()
+    wb = load_workbook(workbook)
+    assert [r[0] for r in wb["TRANSACTIONS"].iter_rows(min_row=2, values_only=True)] == ["T1"]
+    assert writer.sync().get("041").balance == 9900
+    writer.close()
@@ -0,0 +1,124 @@
+import json
+
+import pytest
+from openpyxl import load_workbook
+
+from app.core.feed import ChangeFeed, feed_path_for
+from app.core.persistence import WriteBehindWriter
+
+
+def test_each_committed_payment_is_one_numbered_event(workbook, payment):
+    writer = WriteBehindWriter(workbook, batch_size=10)
+    writer.submit(payment("T1", {"041": 100}))
+    writer.submit_many([payment("T2", {"1043": 5000}, remaining_credit=300, refs=["1043"]),
+                        payment("T3", {"041": 50})])
+
+    events = writer.feed.read()
+    assert [(e["seq"], e["tx_id"]) for e in events] == [(1, "T1"), (2, "T2"), (3, "T3")]
+    assert events[1]["allocations"] == {"1043": 5000}
+    assert events[1]["credits"] == {"1043": 300}
+    assert events[1]["students"]["1043"] == {"balance": -300, "status": "OVERPAID",
+                                             "paid_total": 5000, "credit": 300}
+    assert events[2]["students"]["041"]["balance"] == 10000 - 150
+    assert [e["tx_id"] for e in writer.feed.read(after=1, limit=1)] == ["T2"]
+    assert writer.feed.read(after=3) == []
+    with pytest.raises(ValueError):
+        writer.feed.read(after=-1)
+
+
+def test_sequence_is_shared_by_writers_and_survives_reloads(workbook, payment):
+    # Two writers on one workbook stand in for two worker processes
+    a = WriteBehindWriter(workbook, batch_size=10)
+    b = WriteBehindWriter(workbook, batch_size=10)
+    a.submit(payment("T1", {"041": 100}))
+    b.submit(payment("T2", {"1043": 100}))
+    a.submit(payment("T3", {"041": 100}))
+    a.close()
+
+    # A restart replays nothing twice
+    c = WriteBehindWriter(workbook, batch_size=10)
+    c.sync()
+    events = ChangeFeed(feed_path_for(workbook)).read()
+    assert [(e["seq"], e["tx_id"]) for e in events] == [(1, "T1"), (2, "T2"), (3, "T3")]
+    assert events[1]["students"]["1043"]["balance"] == 4900
+    assert events[2]["students"]["041"]["balance"] == 9800
+    assert c.feed.last_seq() == 3
+
+
+def test_event_lost_in_a_crash_is_written_on_replay(workbook, payment):
+    writer = WriteBehindWriter(workbook, batch_size=10)
+    writer.submit(payment("T1", {"041": 100}))
+    writer.submit(payment("T2", {"041": 200}))
+    # Crash after the journal fsync, before the feed append of T2
+    path = feed_path_for(workbook)
+    with open(path, "rb") as fh:
+        first = fh.readline()
+    with open(path, "wb") as fh:
+        fh.write(first)
+
+    restarted = WriteBehindWriter(workbook, batch_size=10)
+    restarted.sync()
+    events = restarted.feed.read()
+    assert [(e["seq"], e["tx_id"]) for e in events] == [(1, "T1"), (2, "T2")]
+    assert events[1]["students"]["041"]["balance"] == 9700
+
+
+def _pay(client, tx_id, amount, ref):
+    callback = {"TransID": tx_id, "TransAmount": amount, "BillRefNumber": ref, "BusinessShortCode": "600100"}
+    assert client.post("/mpesa/callback", json=callback).json() == {"status": "ok"}
+
+
+def test_feed_long_poll_resumes_from_a_sequence_number(client):
+    _pay(client, "TX1", 300, "041")
+    _pay(client, "TX2", 400, "1043")
+
+    page = client.get("/reports/feed", params={"after": 0, "limit": 1}).json()
+    assert [e["tx_id"] for e in page["events"]] == ["TX1"]
+    assert page["last_seq"] == 1
+    page = client.get("/reports/feed", params={"after": page["last_seq"]}).json()
+    assert [(e["seq"], e["tx_id"]) for e in page["events"]] == [(2, "TX2")]
+    assert page["events"][0]["students"]["1043"]["balance"] == 4600
+
+    # Nothing new: the wait runs out and the cursor is unchanged
+    idle = client.get("/reports/feed", params={"after": 2, "wait": 0.3}).json()
+    assert idle == {"events": [], "last_seq": 2}
+    assert client.get("/reports/feed", params={"after": -1}).status_code == 400
+
+
+def test_feed_stream_honours_last_event_id(client):
+    for i, ref in enumerate(["041", "1043", "2001"], start=1):
+        _pay(client, f"TX{i}", 100, ref)
+
+    response = client.get("/reports/feed/stream", params={"limit": 2}, headers={"Last-Event-ID": "1"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    frames = [f for f in response.text.split("\n\n") if f]
+    assert [f.splitlines()[0] for f in frames] == ["id: 2", "id: 3"]
+    assert frames[0].splitlines()[1] == "event: payment"
+    assert json.loads(frames[1].splitlines()[2][len("data: "):])["tx_id"] == "TX3"
+
+
+def test_parked_payment_is_retracted_and_republished(workbook, payment):
+    from app.core.pipeline import PaymentPipeline
+
+    writer = WriteBehindWriter(workbook, batch_size=1000)
+    writer.submit(payment("T1", {"041": 100}))
+    # 041 is renamed while T1 is still only journalled: T1 goes to suspense
+    wb = load_workbook(workbook)
+    wb["STUDENTS_MASTER"]["A2"] = "0041"
+    wb.save(workbook)
+    writer.sync()
+    assert writer.suspense.get("T1") is not None
+
+    PaymentPipeline(workbook, "2026-T1", writer=writer).reprocess_suspense()
+    events = writer.feed.read()
+    assert [(e["seq"], e["tx_id"], e.get("retracted", False)) for e in events] == [
+        (1, "T1", False), (2, "T1", True), (3, "T1", False)]
+    assert events[1]["reason"] == "student not on roster"
+    assert events[2]["allocations"] == {"0041": 100}
+    assert events[2]["students"]["0041"]["balance"] == 9900
+    # Replaying the journal after a restart publishes nothing new
+    restarted = WriteBehindWriter(workbook, batch_size=1000)
+    restarted.sync()
+    assert restarted.feed.last_seq() == 3
+    restarted.close()
+    writer.close()
@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+
+from openpyxl import load_workbook
+
+from app.core.allocator import split_credit, status_for_balance, statuses_for_balances
+from app.core.ledger import StudentLedger
+
+
+def test_ledger_loads_students(workbook):
+    ledger = StudentLedger(workbook)
+    ledger.load()
+    assert len(ledger) == 3
+    assert ledger.get("041").balance == 10000
+    assert ledger.students_for(["1043", "999"]) == [{"admission_no": "1043", "balance": 5000}]
+
+
+def test_apply_allocation_updates_in_place(workbook):
+    ledger = StudentLedger(workbook)
+    ledger.load()
+    shares = ledger.apply_allocation(["041", "1043"], {"041": 10000, "1043": 5000}, 5001)
+    assert shares == {"041": 2501, "1043": 2500}
+    rec = ledger.get("041")
+    assert (rec.paid_total, rec.credit, rec.balance, rec.status) == (10000, 2501, -2501, "OVERPAID")
+
+
+def test_refresh_if_changed_reloads_external_edit(workbook):
+    ledger = StudentLedger(workbook)
+    ledger.load()
+    assert ledger.refresh_if_changed() is False
+
+    wb = load_workbook(workbook)
+    wb["STUDENTS_MASTER"]["F2"] = 123
+    wb.save(workbook)
+    st = os.stat(workbook)
+    os.utime(workbook, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+    assert ledger.refresh_if_changed() is True
+    assert ledger.get("041").balance == 123
+
+
+def test_split_credit_and_status():
+    assert split_credit(5, ["A", "B"]) == {"A": 3, "B": 2}
+    assert split_credit(1, ["A", "B"]) == {"A": 1}
+    assert status_for_balance(1) == "PARTIAL"
+    assert status_for_balance(0) == "PAID"
+    assert status_for_balance(-1) == "OVERPAID"
+    assert statuses_for_balances(np.array([5, 0, -3])).tolist() == ["PARTIAL", "PAID", "OVERPAID"]
@@ -0,0 +1,82 @@
+import asyncio
+
+from app.core.metrics import METRICS, Metrics
+from app.core.persistence import WriteBehindWriter
+from app.core.pipeline import PaymentPipeline
+
+
+def test_render_prometheus_summary_and_counters():
+    metrics = Metrics()
+    for ms in range(1, 101):
+        metrics.observe("parse", ms / 1000)
+    metrics.inc("ok", 3)
+    metrics.inc("rejected")
+
+    snap = metrics.snapshot()["parse"]
+    assert snap["count"] == 100
+    assert (snap["p50"], snap["p95"], snap["p99"]) == (0.051, 0.096, 0.1)
+
+    text = metrics.render()
+    assert "# TYPE fees_stage_seconds summary" in text
+    assert 'fees_stage_seconds{stage="parse",quantile="0.95"} 0.096000' in text
+    assert 'fees_stage_seconds_count{stage="parse"} 100' in text
+    assert 'fees_callbacks_total{result="ok"} 3' in text
+    assert 'fees_callbacks_total{result="rejected"} 1' in text
+
+
+def test_disabled_metrics_still_fill_requested_trace():
+    metrics = Metrics(enabled=False)
+    with metrics.stage("parse"):
+        pass
+    trace = {}
+    with metrics.stage("allocate", trace):
+        pass
+    metrics.inc("ok")
+    assert metrics.snapshot() == {} and metrics.counters() == {}
+    assert set(trace) == {"allocate"}
+
+
+def test_pipeline_records_stage_trace(workbook):
+    writer = WriteBehindWriter(workbook, batch_size=1000)
+    pipeline = PaymentPipeline(workbook, "2026-T1", writer=writer)
+    trace = {}
+
+    async def run():
+        await pipeline.start()
+        await pipeline.submit("T1", 1000, ["041"], trace=trace)
+        await pipeline.stop()
+
+    asyncio.run(run())
+    assert {"queue", "lock", "sync", "lookup", "allocate", "journal"} <= set(trace)
+    assert all(ms >= 0 for ms in trace.values())
+    writer.close()
+
+
+def _scrape_after_callback(client):
+    callback = {"TransID": "TX1", "TransAmount": 300, "BillRefNumber": "041", "BusinessShortCode": "600100"}
+    response = client.post("/mpesa/callback", json=callback, headers={"X-Fees-Trace": "1"})
+    assert response.json()["status"] == "ok"
+    scrape = client.get("/metrics")
+    assert scrape.headers["content-type"] == "text/plain; version=0.0.4; charset=utf-8"
+    return response.json(), scrape.text
+
+
+def test_metrics_endpoint_exposes_recorded_callbacks(client, monkeypatch):
+    monkeypatch.setattr(METRICS, "enabled", True)
+    METRICS.reset()
+    _, text = _scrape_after_callback(client)
+
+    assert 'fees_callbacks_total{result="ok"} 1' in text.splitlines()
+    assert 'fees_stage_seconds_count{stage="parse"} 1' in text.splitlines()
+    assert any(line.startswith('fees_stage_seconds{stage="journal",quantile="0.95"} ') for line in text.splitlines())
+    METRICS.reset()
+
+
+def test_metrics_endpoint_when_recording_is_off(client, monkeypatch):
+    monkeypatch.setattr(METRICS, "enabled", False)
+    METRICS.reset()
+    body, text = _scrape_after_callback(client)
+
+    # Only the metric headers; a requested trace is still filled in
+    assert all(line.startswith("# ") for line in text.splitlines())
+    assert "parse" in body["trace"]
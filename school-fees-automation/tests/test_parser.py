@@ -1,6 +1,6 @@
 import pytest
 
-from app.mpesa.parser import parse_reference
+from app.mpesa.parser import loose_reference, parse_reference, parse_references
 
 
 def test_parse_reference_pipe_separator():
@@ -29,3 +29,28 @@ def test_parse_reference_empty_input():
 def test_parse_reference_non_numeric():
     with pytest.raises(ValueError):
         parse_reference("041|10A")
+
+
+def test_parse_reference_single_number_fast_path():
+    assert parse_reference("2001") == ["2001"]
+    assert parse_reference(" 2001 ") == ["2001"]
+
+
+def test_parse_reference_error_precedence():
+    # Empty parts are reported before non-numeric ones, those before duplicates
+    with pytest.raises(ValueError, match="Empty reference part found"):
+        parse_reference("0 41||041")
+    with pytest.raises(ValueError, match="Non-numeric reference part: '0 41'"):
+        parse_reference("041|0 41|041")
+
+
+def test_parse_references_collects_errors():
+    results, errors = parse_references(["041", "041|10A", None, "041,1043"])
+    assert results == [["041"], None, None, ["041", "1043"]]
+    assert errors == {1: "Invalid character(s) in reference string: A", 2: "Reference string is None"}
+
+
+def test_loose_reference_salvages_digit_runs():
+    assert loose_reference("041 1043") == ["041", "1043"]
+    assert loose_reference("ADM 041/1043, 041") == ["041", "1043"]
+    assert loose_reference("fees") == []
@@ -0,0 +1,169 @@
+import threading
+from pathlib import Path
+
+import pytest
+from openpyxl import load_workbook
+
+from app.core.persistence import WriteBehindWriter
+
+
+def test_submit_is_journalled_until_batch_is_full(workbook, payment):
+    writer = WriteBehindWriter(workbook, batch_size=2)
+    writer.submit(payment("T1", {"041": 100}))
+
+    assert [e["tx_id"] for e in writer.journal.read()] == ["T1"]
+    wb = load_workbook(workbook)
+    assert "TRANSACTIONS" not in wb.sheetnames
+
+    writer.submit(payment("T2", {"1043": 200}))
+
+    assert writer.pending() == []
+    assert writer.journal.read() == []
+    wb = load_workbook(workbook)
+    assert [r[0] for r in wb["TRANSACTIONS"].iter_rows(min_row=2, values_only=True)] == ["T1", "T2"]
+    balances = {r[0]: r[5] for r in wb["STUDENTS_MASTER"].iter_rows(min_row=2, values_only=True)}
+    assert balances["041"] == 9900
+    assert balances["1043"] == 4800
+
+
+def test_leftover_journal_is_replayed_and_flushed_on_close(workbook, payment):
+    first = WriteBehindWriter(workbook, batch_size=10)
+    first.submit(payment("T1", {"041": 100}, remaining_credit=50, refs=["041"]))
+
+    # Simulate a restart: a new writer picks the entry up from the journal
+    writer = WriteBehindWriter(workbook, batch_size=10)
+    assert writer.sync().get("041").balance == 10000 - 150
+
+    writer.close()
+    assert writer.journal.read() == []
+    assert not writer.ledger.is_stale()
+    wb = load_workbook(workbook)
+    assert list(wb["CREDITS"].iter_rows(min_row=2, values_only=True)) == [("T1", "041", 50)]
+
+
+def test_writers_sharing_a_workbook_see_each_others_payments(workbook, payment):
+    # Two writers on one workbook stand in for two uvicorn worker processes
+    a = WriteBehindWriter(workbook, batch_size=10)
+    b = WriteBehindWriter(workbook, batch_size=10)
+    a.submit(payment("T1", {"041": 100}))
+    assert b.sync().get("041").balance == 9900
+
+    b.submit(payment("T2", {"041": 50}))
+    assert b.flush() == 2
+    # a's ledger reloads from the flushed workbook without double-applying
+    assert a.sync().get("041").balance == 9850
+    assert a.flush() == 0
+
+
+@pytest.mark.parametrize("backend", ["xlsx", "db"])
+def test_crash_between_save_and_journal_truncate_is_not_replayed(workbook, tmp_path, backend, payment):
+    path = workbook
+    if backend == "db":
+        from app.core.sqlite_store import import_from_excel
+
+        path = str(tmp_path / "fees.db")
+        import_from_excel(workbook, path).close()
+
+    writer = WriteBehindWriter(path, batch_size=1000)
+    writer.submit(payment("T1", {"041": 100}))
+    writer.submit(payment("T2", {"1043": 200}))
+    # The backend saved the batch, then the process died before truncating the journal
+    writer.backend.apply_payments(writer.journal.read())
+    writer.backend.close()
+
+    restarted = WriteBehindWriter(path, batch_size=1000)
+    restarted.submit(payment("T3", {"041": 50}))
+    assert [e["tx_id"] for e in restarted.journal.read()] == ["T3"]
+    assert restarted.ledger.get("041").balance == 10000 - 150
+    assert restarted.ledger.get("1043").balance == 5000 - 200
+    assert restarted.recover() == 1
+    assert sorted(restarted.backend.transaction_results()) == ["T1", "T2", "T3"]
+    restarted.close()
+
+
+def test_failed_save_leaves_previous_workbook_intact(workbook, monkeypatch, payment):
+    from openpyxl.workbook.workbook import Workbook
+
+    before = open(workbook, "rb").read()
+
+    def broken_save(self, filename):
+        with open(filename, "wb") as fh:
+            fh.write(b"PK partial")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(Workbook, "save", broken_save)
+    writer = WriteBehindWriter(workbook, batch_size=1000)
+    writer.submit(payment("T1", {"041": 100}))
+    with pytest.raises(OSError):
+        writer.flush()
+
+    assert open(workbook, "rb").read() == before
+    assert [p.name for p in Path(workbook).parent.iterdir() if p.name.endswith(".tmp")] == []
+    # The payment is still journalled for the next attempt
+    assert [e["tx_id"] for e in writer.journal.read()] == ["T1"]
+
+
+def test_pending_payment_for_a_renamed_student_is_parked(workbook, payment):
+    from app.core.pipeline import PaymentPipeline
+
+    writer = WriteBehindWriter(workbook, batch_size=1000)
+    writer.submit(payment("T1", {"041": 100}))
+    writer.submit(payment("T2", {"1043": 200}))
+    # The bursar renames 041 to 0041 while T1 is still only journalled
+    wb = load_workbook(workbook)
+    wb["STUDENTS_MASTER"]["A2"] = "0041"
+    wb.save(workbook)
+
+    writer.submit(payment("T3", {"1043": 300}))
+    assert [e["tx_id"] for e in writer.journal.read()] == ["T2", "T3"]
+    assert "T1" not in writer.transactions
+    parked = writer.suspense.get("T1")
+    assert parked["reason"] == "student not on roster"
+    assert parked["candidates"] == {"041": ["0041"]}
+    assert writer.flush() == 2
+    assert writer.ledger.get("1043").balance == 4500
+
+    # A restart does not bring it back, and re-processing pays the renamed student
+    restarted = WriteBehindWriter(workbook, batch_size=1000)
+    restarted.sync()
+    assert "T1" not in restarted.transactions
+    outcome = PaymentPipeline(workbook, "2026-T1", writer=restarted).reprocess_suspense()
+    assert outcome == {"applied": ["T1"], "pending": []}
+    assert restarted.ledger.get("0041").balance == 9900
+    restarted.close()
+
+
+def _in_thread(fn, *args):
+    # Another worker's writer has its own lock handles: run it where it may block
+    out = []
+    t = threading.Thread(target=lambda: out.append(fn(*args)))
+    t.start()
+    t.join(5)
+    assert not t.is_alive(), "blocked on the writer lock"
+    return out[0]
+
+
+def test_payments_are_journalled_while_a_batch_is_saved(workbook, payment):
+    a = WriteBehindWriter(workbook, batch_size=1000)
+    b = WriteBehindWriter(workbook, batch_size=1000)
+    a.submit(payment("T1", {"041": 100}))
+    save = a.backend.apply_payments
+    seen = {}
+
+    def slow_save(batch):
+        _in_thread(b.submit, payment("T2", {"1043": 200}))
+        save(batch)
+        # Saved but not yet dropped from the journal: T1 is not replayed twice
+        seen["041"] = _in_thread(b.sync).get("041").balance
+
+    a.backend.apply_payments = slow_save
+    assert a.flush() == 1
+    assert seen["041"] == 9900
+    assert [e["tx_id"] for e in a.journal.read()] == ["T2"]
+    assert a.sync().get("1043").balance == 4800
+    assert b.sync().get("041").balance == 9900
+    assert b.flush() == 1
+    wb = load_workbook(workbook)
+    assert [r[0] for r in wb["TRANSACTIONS"].iter_rows(min_row=2, values_only=True)] == ["T1", "T2"]
+    balances = {r[0]: r[5] for r in wb["STUDENTS_MASTER"].iter_rows(min_row=2, values_only=True)}
+    assert (balances["041"], balances["1043"]) == (9900, 4800)
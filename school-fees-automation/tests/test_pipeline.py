@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+from openpyxl import load_workbook
+
+from app.core.persistence import WriteBehindWriter
+from app.core.pipeline import PaymentPipeline
+
+
+def test_concurrent_submissions_are_serialized(workbook):
+    writer = WriteBehindWriter(workbook, batch_size=1000)
+    pipeline = PaymentPipeline(workbook, "2026-T1", writer=writer)
+
+    async def run():
+        await pipeline.start()
+        results = await asyncio.gather(*[
+            pipeline.submit(f"T{i}", 1000, ["041", "1043"]) for i in range(20)
+        ])
+        await pipeline.stop()
+        return results
+
+    results = asyncio.run(run())
+    # 15,000 owed in total: the first 15 payments are fully allocated, the rest is credit
+    assert sum(sum(r["allocations"].values()) for r in results) == 15000
+    assert sum(r["remaining_credit"] for r in results) == 5000
+
+    writer.close()
+    wb = load_workbook(workbook)
+    balances = {r[0]: r[5] for r in wb["STUDENTS_MASTER"].iter_rows(min_row=2, values_only=True)}
+    assert balances["041"] + balances["1043"] == 15000 - 20000
+    assert wb["TRANSACTIONS"].max_row == 21
+
+
+def test_accepted_payments_are_applied_in_background(workbook):
+    writer = WriteBehindWriter(workbook, batch_size=1000)
+    pipeline = PaymentPipeline(workbook, "2026-T1", writer=writer)
+
+    async def run():
+        await pipeline.start()
+        acks = [await pipeline.accept(f"A{i}", 1000, ["041"], {"TransID": f"A{i}"}) for i in range(3)]
+        await pipeline.stop()
+        return acks
+
+    assert asyncio.run(run()) == [{"accepted": True}] * 3
+    assert pipeline.status("A2") == {
+        "tx_id": "A2", "status": "applied", "allocations": {"041": 1000}, "remaining_credit": 0,
+    }
+    assert pipeline.status("nope")["status"] == "unknown"
+    # Applied items are compacted out of the inbox
+    assert pipeline.inbox.journal.read() == []
+    writer.close()
+
+
+def test_unapplied_inbox_items_are_replayed_on_start(workbook):
+    writer = WriteBehindWriter(workbook, batch_size=1000)
+    pipeline = PaymentPipeline(workbook, "2026-T1", writer=writer)
+    # Acknowledged before a crash, never allocated
+    pipeline.inbox.accept("R1", 2000, ["1043"], {"TransID": "R1"})
+    pipeline.inbox.accept("R2", 500, ["9999"], {"TransID": "R2"})
+    assert pipeline.status("R1")["status"] == "queued"
+
+    async def run():
+        await pipeline.start()
+        await pipeline.stop()
+
+    asyncio.run(run())
+    assert pipeline.status("R1")["allocations"] == {"1043": 2000}
+    # Nobody on the roster matches 9999: parked rather than credited to no one
+    assert pipeline.status("R2")["status"] == "suspense"
+    assert writer.ledger.get("1043").balance == 3000
+    writer.close()
+
+
+def test_references_are_resolved_against_the_roster(make_workbook):
+    path = make_workbook("fees.xlsx", [("041", 10000), ("1043", 5000), ("1034", 5000)])
+    writer = WriteBehindWriter(path, batch_size=1000)
+    pipeline = PaymentPipeline(path, "2026-T1", writer=writer)
+
+    async def run():
+        await pipeline.start()
+        results = [
+            await pipeline.submit("F1", 3000, ["41"]),
+            await pipeline.submit("F2", 3000, ["1304"], payload={"BillRefNumber": "1304"}),
+            await pipeline.submit("F2", 3000, ["1304"]),
+        ]
+        await pipeline.stop()
+        return results
+
+    leading_zero, typo, retry = asyncio.run(run())
+    assert leading_zero == {"allocations": {"041": 3000}, "remaining_credit": 0}
+    assert typo == {"suspense": True, "candidates": {"1304": ["1034"]}}
+    assert retry["duplicate"] is True
+    assert pipeline.status("F2") == {
+        "tx_id": "F2", "status": "suspense", "reason": "ambiguous reference", "candidates": {"1304": ["1034"]},
+    }
+    assert pipeline.suspense.items()[0]["payload"] == {"BillRefNumber": "1304"}
+    assert writer.ledger.get("1034").balance == 5000
+    writer.close()
+
+
+def test_suspense_is_reprocessed_in_one_batch(make_workbook):
+    path = make_workbook("fees.xlsx", [("041", 10000), ("1043", 5000), ("1034", 5000)])
+    writer = WriteBehindWriter(path, batch_size=1000)
+    pipeline = PaymentPipeline(path, "2026-T1", writer=writer)
+
+    async def park():
+        await pipeline.start()
+        await pipeline.submit("S1", 2000, ["1304"])
+        await pipeline.submit("S2", 3000, ["5005"])
+        await pipeline.submit("S3", 1000, ["9999"])
+        parked = await pipeline.park("S4", 4000, "unreadable reference", {"BillRefNumber": "fees"})
+        again = await pipeline.park("S4", 4000, "unreadable reference", {"BillRefNumber": "fees"})
+        await pipeline.stop()
+        return parked, again
+
+    parked, again = asyncio.run(park())
+    assert parked == {"suspense": True, "candidates": {}}
+    assert again["duplicate"] is True
+    assert [i["tx_id"] for i in pipeline.suspended()] == ["S1", "S2", "S3", "S4"]
+
+    # The bursar adds the missing student, then re-runs the queue
+    wb = load_workbook(path)
+    wb["STUDENTS_MASTER"].append(["5005", "New", "F1", 0, 0, 8000, "PARTIAL"])
+    wb.save(path)
+    saves = []
+    apply_payments = writer.backend.apply_payments
+    writer.backend.apply_payments = lambda batch: (saves.append(len(batch)), apply_payments(batch))
+
+    with pytest.raises(ValueError, match="Not in suspense: S9"):
+        pipeline.reprocess_suspense({"S9": ["041"]})
+    outcome = pipeline.reprocess_suspense({"S1": ["1034"], "S4": ["041"]})
+    assert outcome == {"applied": ["S1", "S2", "S4"], "pending": ["S3"]}
+    assert saves == [3]
+    assert [i["tx_id"] for i in pipeline.suspended()] == ["S3"]
+    assert pipeline.status("S2")["allocations"] == {"5005": 3000}
+    balances = {r[0]: r[5] for r in load_workbook(path)["STUDENTS_MASTER"].iter_rows(min_row=2, values_only=True)}
+    assert balances == {"041": 6000, "1043": 5000, "1034": 3000, "5005": 5000}
+    writer.close()
@@ -0,0 +1,67 @@
+from openpyxl import load_workbook
+
+from app.core.persistence import WriteBehindWriter
+from app.core.pipeline import PaymentPipeline
+from app.core.reconcile import reconcile_statement
+
+
+def test_reconcile_statement_applies_new_rows_once(workbook, tmp_path):
+    statement = tmp_path / "statement.csv"
+    statement.write_text(
+        "Receipt No.,Paid In,A/C No.\n"
+        "R1,\"6,000\",041|1043\n"
+        "R2,abc,041\n"
+        "R3,500,041 & 1043\n"
+        "R1,6000,041\n"
+        "R4,12000,1043\n"
+    )
+    summary = reconcile_statement(str(statement), workbook, "2026-T1")
+    assert summary["rows"] == 5
+    assert summary["applied"] == 3
+    assert summary["duplicates"] == 1
+    assert [r["tx_id"] for r in summary["rejected"]] == ["R2"]
+    assert summary["suspense"] == []
+    assert summary["allocated_total"] == 11000
+    assert summary["credit_total"] == 7500
+
+    wb = load_workbook(workbook)
+    assert [r[0] for r in wb["TRANSACTIONS"].iter_rows(min_row=2, values_only=True)] == ["R1", "R3", "R4"]
+
+    # Re-running the same statement applies nothing new
+    again = reconcile_statement(str(statement), workbook, "2026-T1")
+    assert again["applied"] == 0
+    assert again["duplicates"] == 4
+
+
+def test_unmatched_statement_rows_are_parked_in_suspense(workbook, tmp_path):
+    statement = tmp_path / "statement.csv"
+    statement.write_text(
+        "TransID,TransAmount,BillRefNumber\n"
+        "S1,700,41\n"
+        "S2,800,9999\n"
+        "S3,900,1034\n"
+        "S4,1000,N/A\n"
+    )
+    summary = reconcile_statement(str(statement), workbook, "2026-T1")
+    # "41" is 041 without its leading zero; the rest are not safe to allocate
+    assert summary["applied"] == 1
+    assert summary["allocated_total"] == 700
+    assert [(p["row"], p["tx_id"], p["reason"]) for p in summary["suspense"]] == [
+        (3, "S2", "no matching student"),
+        (4, "S3", "ambiguous reference"),
+        (5, "S4", "unreadable reference: Invalid character(s) in reference string: /AN"),
+    ]
+
+    writer = WriteBehindWriter(workbook)
+    writer.sync()
+    assert writer.transactions.get("S1")["allocations"] == {"041": 700}
+    assert all(tx_id not in writer.transactions for tx_id in ("S2", "S3", "S4"))
+    assert writer.suspense.get("S3")["candidates"] == {"1034": ["1043"]}
+    assert writer.suspense.get("S4")["payload"] == {"row": 5, "tx_id": "S4", "amount": 1000, "raw_ref": "N/A"}
+
+    # Parked rows are not parked again on a re-run, and can be reprocessed
+    again = reconcile_statement(str(statement), workbook, "2026-T1")
+    assert again["duplicates"] == 4
+    outcome = PaymentPipeline(workbook, "2026-T1", writer=writer).reprocess_suspense({"S2": ["2001"]})
+    assert outcome == {"applied": ["S2"], "pending": ["S3", "S4"]}
+    writer.close()
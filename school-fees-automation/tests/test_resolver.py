@@ -0,0 +1,37 @@
+from app.core.resolver import AdmissionIndex
+
+ROSTER = ["041", "1043", "1034", "2001", "20011", "3005", "3006", "3007", "3008", "3009", "30010"]
+
+
+def test_exact_and_leading_zero_matches_resolve():
+    index = AdmissionIndex(ROSTER)
+    assert index.lookup("041").match == "exact"
+    normalized = index.lookup("0041")
+    assert (normalized.match, normalized.admission_no) == ("normalized", "041")
+    assert index.lookup("41").admission_no == "041"
+    assert index.resolve(["41", "041", "1043"]) == (["041", "1043"], {})
+
+
+def test_typos_and_prefixes_only_give_candidates():
+    index = AdmissionIndex(ROSTER)
+    swapped = index.lookup("1403")
+    assert (swapped.match, swapped.admission_no, swapped.candidates) == ("fuzzy", None, ["1043"])
+    # One digit off from both 1043 and 1034 (and a prefix of neither)
+    assert index.lookup("1033").candidates == ["1034", "1043"]
+    # Truncated: a prefix of 20011, one deletion away from 2001
+    assert index.lookup("200").candidates == ["2001", "20011"]
+    # A prefix of more than MAX_PREFIX_CANDIDATES numbers only keeps its one-edit matches
+    assert index.lookup("300").candidates == ["3005", "3006", "3007", "3008", "3009"]
+    assert index.lookup("77").match == "none"
+    assert index.resolve(["1043", "1403", "9999"]) == (["1043", "1403", "9999"], {"1403": ["1043"]})
+
+
+def test_index_follows_ledger_reloads(workbook):
+    from app.core.ledger import StudentLedger
+
+    ledger = StudentLedger(workbook)
+    index = AdmissionIndex()
+    ledger.add_listener(index)
+    ledger.load()
+    assert len(index) == 3
+    assert index.lookup("2010").candidates == ["2001"]
@@ -0,0 +1,75 @@
+import pytest
+
+from app.core.persistence import WriteBehindWriter
+from app.core.sqlite_store import import_from_excel
+from app.reports.snapshot import SnapshotExporter, export_snapshot, main, open_snapshot, snapshot_dir_for
+
+
+@pytest.fixture
+def ledger(make_workbook, payment):
+    path = make_workbook("fees.xlsx", [
+        ("041", 10000, "F1"), ("052", 8000, "F2"), ("063", 3000, "F2"), ("074", 0, "F1"),
+    ])
+    writer = WriteBehindWriter(path, batch_size=1000)
+    writer.submit(payment("T0", {"063": 1000}, term="2025-T3"))
+    writer.submit(payment("T1", {"041": 4000}))
+    writer.submit(payment("T2", {"063": 2000}, 1000, refs=["063", "074"]))
+    writer.close()
+    return path
+
+
+def test_snapshot_answers_filtered_and_grouped_queries(ledger):
+    export_snapshot(ledger)
+    snap = open_snapshot(ledger)
+
+    assert snap.rows("students") == 4
+    assert snap.aggregate("students", "balance", by="class_name", where={"balance__gt": 0}) == {
+        "F1": {"total": 6000, "count": 1},
+        "F2": {"total": 8000, "count": 1},
+    }
+    overpaid = snap.select("students", columns=["admission_no", "balance"], where={"status": "OVERPAID"},
+                           order_by="balance")
+    assert overpaid == [{"admission_no": "063", "balance": -500}, {"admission_no": "074", "balance": -500}]
+    assert snap.aggregate("credits", "amount", where={"term": "2026-T1"}) == {"total": 1000, "count": 2}
+    assert snap.aggregate("transactions", "amount", by="term") == {
+        "2025-T3": {"total": 1000, "count": 1},
+        "2026-T1": {"total": 7000, "count": 2},
+    }
+    assert snap.aggregate("allocations", "amount", where={"admission_no__in": ["041", "063"]})["total"] == 7000
+
+    with pytest.raises(ValueError, match="Unknown column"):
+        snap.aggregate("students", "fees")
+    with pytest.raises(ValueError, match="operator"):
+        snap.mask("students", {"balance__between": 1})
+
+
+def test_snapshot_of_sqlite_ledger_matches_workbook(tmp_path, ledger):
+    db = str(tmp_path / "fees.db")
+    import_from_excel(ledger, db).close()
+    export_snapshot(db)
+    export_snapshot(ledger)
+    from_db, from_xlsx = open_snapshot(db), open_snapshot(ledger)
+    for table in ("students", "transactions", "allocations", "credits"):
+        assert from_db.select(table) == from_xlsx.select(table)
+
+
+def test_exporter_only_rewrites_changed_ledgers(tmp_path, make_workbook, ledger, payment):
+    other = make_workbook("other.xlsx", [("1", 500)])
+    exporter = SnapshotExporter([ledger, other, str(tmp_path / "missing.xlsx")], interval=60)
+    assert exporter.export_changed() == [ledger, other]
+    assert exporter.export_changed() == []
+
+    writer = WriteBehindWriter(ledger, batch_size=1000)
+    writer.submit(payment("T3", {"052": 500}))
+    writer.close()
+    assert exporter.export_changed() == [ledger]
+    assert open_snapshot(ledger).aggregate("transactions", "amount")["count"] == 4
+    # The previous generation is kept for readers that still have it open
+    assert len([d for d in snapshot_dir_for(ledger).iterdir() if d.is_dir()]) == 2
+
+
+def test_cli_query(capsys, ledger):
+    main(["export", ledger])
+    capsys.readouterr()
+    main(["query", ledger, "students", "--where", "balance__gt=0", "--sum", "balance", "--by", "class_name"])
+    assert '"F2": {\n    "total": 8000' in capsys.readouterr().out
@@ -0,0 +1,64 @@
+import pytest
+from openpyxl import load_workbook
+
+from app.core.excel import apply_payments_to_excel
+from app.core.persistence import WriteBehindWriter
+from app.core.sqlite_store import SqliteBackend, export_to_excel, import_from_excel
+
+PAYMENTS = [
+    {"tx_id": "T1", "amount": 6000, "reference_order": ["041", "1043"],
+     "allocations": {"041": 6000}, "remaining_credit": 0, "term": "2026-T1"},
+    {"tx_id": "T2", "amount": 20000, "reference_order": ["1043", "041"],
+     "allocations": {"1043": 5000, "041": 4000}, "remaining_credit": 11001, "term": "2026-T1"},
+]
+
+
+def _students(path):
+    wb = load_workbook(path)
+    return [r for r in wb["STUDENTS_MASTER"].iter_rows(min_row=2, values_only=True)]
+
+
+def test_sqlite_backend_matches_excel_semantics(workbook, tmp_path):
+    db = tmp_path / "ledger.db"
+    backend = import_from_excel(workbook, str(db))
+    backend.apply_payments(PAYMENTS)
+    # Replaying an applied payment is a no-op
+    backend.apply_payments(PAYMENTS[:1])
+    backend.close()
+
+    apply_payments_to_excel(workbook, PAYMENTS)
+    exported = tmp_path / "exported.xlsx"
+    export_to_excel(str(db), str(exported))
+
+    assert _students(exported) == _students(workbook)
+    wb, expected = load_workbook(exported), load_workbook(workbook)
+    for sheet in ("TRANSACTIONS", "ALLOCATIONS", "CREDITS"):
+        assert list(wb[sheet].values) == list(expected[sheet].values)
+
+
+def test_writer_persists_to_sqlite_per_payment(workbook, tmp_path):
+    db = str(tmp_path / "ledger.db")
+    import_from_excel(workbook, db).close()
+
+    writer = WriteBehindWriter(db)
+    writer.submit(PAYMENTS[0])
+    assert writer.pending() == []
+    assert writer.backend.transaction_results()["T1"] == {"allocations": {"041": 6000}, "remaining_credit": 0}
+    # Reload from the database itself
+    writer.ledger.load()
+    assert writer.ledger.get("041").balance == 4000
+    writer.close()
+
+
+def test_import_refuses_a_database_that_holds_a_ledger(workbook, tmp_path):
+    db = str(tmp_path / "ledger.db")
+    backend = import_from_excel(workbook, db)
+    backend.apply_payments(PAYMENTS[:1])
+    backend.close()
+
+    with pytest.raises(ValueError, match="already holds a ledger"):
+        import_from_excel(workbook, db)
+    backend = SqliteBackend(db)
+    assert backend.conn.execute("SELECT tx_id, admission_no, amount FROM allocations").fetchall() == [("T1", "041", 6000)]
+    assert {s["admission_no"]: s["balance"] for s in backend.load_students()}["041"] == 4000
+    backend.close()
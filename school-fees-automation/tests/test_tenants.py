@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+import pytest
+from openpyxl import load_workbook
+
+from app.core.tenants import Tenant, TenantRouter, load_tenants
+
+
+def _router(make_workbook, pool_size=16):
+    schools = []
+    for name, shortcode, prefix in [("north", "600100", None), ("south", "600200", "SO"),
+                                    ("east", "600200", "EA"), ("west", None, "WE")]:
+        path = make_workbook(f"{name}.xlsx", [("041", 10000), ("1043", 5000)])
+        schools.append(Tenant(name, path, "2026-T1", shortcode=shortcode, prefix=prefix))
+    return TenantRouter(schools, pool_size=pool_size)
+
+
+def test_route_by_shortcode_and_prefix(make_workbook):
+    router = _router(make_workbook)
+    assert router.route("600100", "041|1043")[0].name == "north"
+    # Shared shortcode: the account prefix decides, and is stripped
+    tenant, ref = router.route("600200", "ea-041,1043")
+    assert (tenant.name, ref) == ("east", "041,1043")
+    assert router.route(600200, "SO041")[0].name == "south"
+    assert router.route("600200", "041")[0] is None
+    # Prefix alone routes when the shortcode is unknown
+    assert router.route("999999", "WE#041") == (router.get("west"), "041")
+
+
+
+def test_route_falls_back_to_the_only_school_on_a_shortcode(make_workbook):
+    path = make_workbook("fees.xlsx", [("041", 10000)])
+    router = TenantRouter([
+        Tenant("north", path, "2026-T1", shortcode="1", prefix="NORTH"),
+        Tenant("south", path, "2026-T1", shortcode="2", prefix="SOUTH"),
+    ])
+    # The payer left out the prefix, but the paybill names one school
+    assert router.route("2", "041") == (router.get("south"), "041")
+    # Another school's prefix does not pull the payment off its paybill
+    assert router.route("1", "SOUTH041") == (router.get("north"), "SOUTH041")
+    assert router.route("3", "SOUTH041") == (None, "SOUTH041")
+
+
+def test_pool_evicts_least_recently_used_school(tmp_path, make_workbook):
+    router = _router(make_workbook, pool_size=2)
+
+    async def run():
+        north = await router.pipeline(router.get("north"))
+        await north.submit("N1", 1000, ["041"])
+        await router.pipeline(router.get("south"))
+        await router.pipeline(router.get("north"))
+        await router.pipeline(router.get("east"))
+        assert router.open_schools() == ["north", "east"]
+        await router.pipeline(router.get("west"))
+        assert router.open_schools() == ["east", "west"]
+        await router.close()
+
+    asyncio.run(run())
+    # Evicting north flushed its payment to its own workbook
+    wb = load_workbook(tmp_path / "north.xlsx")
+    assert wb["TRANSACTIONS"].max_row == 2
+    assert "TRANSACTIONS" not in load_workbook(tmp_path / "south.xlsx").sheetnames
+
+
+def test_load_tenants_resolves_relative_ledgers(tmp_path):
+    config = tmp_path / "schools.json"
+    config.write_text(json.dumps({"pool_size": 4, "schools": [
+        {"name": "north", "ledger": "north.xlsx", "term": "2026-T1", "shortcode": "600100"},
+    ]}))
+    tenants, pool_size = load_tenants(str(config))
+    assert pool_size == 4
+    assert tenants[0].ledger_path == str(tmp_path / "north.xlsx")
+
+    with pytest.raises(ValueError):
+        Tenant("lost", "x.xlsx", "2026-T1")
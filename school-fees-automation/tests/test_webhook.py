@@ -0,0 +1,65 @@
+import threading
+import time
+
+from app.core.pipeline import PaymentPipeline
+from app.mpesa import webhook
+
+
+def _callback(tx_id, amount, ref):
+    return {"TransID": tx_id, "TransAmount": amount, "BillRefNumber": ref, "BusinessShortCode": "600100"}
+
+
+def _wait_for_status(client, tx_id, status):
+    deadline = time.monotonic() + 5
+    while True:
+        body = client.get(f"/mpesa/status/{tx_id}").json()
+        if body["status"] == status or time.monotonic() > deadline:
+            return body
+        time.sleep(0.02)
+
+
+def test_async_ack_and_payment_status(client, monkeypatch):
+    monkeypatch.setattr(webhook, "ACK_MODE", "async")
+    # Hold allocation back so the payment can be seen queued
+    gate = threading.Event()
+    process = PaymentPipeline._process
+
+    def gated(self, *args, **kwargs):
+        gate.wait(5)
+        return process(self, *args, **kwargs)
+
+    monkeypatch.setattr(PaymentPipeline, "_process", gated)
+
+    assert client.post("/mpesa/callback", json=_callback("TX1", 300, "041")).json() == webhook.ACCEPTED
+    queued = client.get("/mpesa/status/TX1").json()
+    assert queued["status"] == "queued"
+    gate.set()
+    applied = _wait_for_status(client, "TX1", "applied")
+    assert applied["allocations"] == {"041": 300}
+    # A retried callback is acknowledged the same way
+    assert client.post("/mpesa/callback", json=_callback("TX1", 300, "041")).json() == webhook.ACCEPTED
+
+    missing = client.get("/mpesa/status/NOPE")
+    assert missing.status_code == 404
+
+
+def test_suspense_listing_and_reprocess(client):
+    assert client.post("/mpesa/callback", json=_callback("TX2", 500, "9999")).json() == {
+        "status": "ok", "suspense": True,
+    }
+    listed = client.get("/mpesa/suspense").json()
+    assert listed["count"] == 1
+    assert listed["items"][0]["reason"] == "no matching student"
+    assert client.get("/mpesa/status/TX2").json()["status"] == "suspense"
+
+    for body in ("[1, 2]", '{"assign": ["TX2"]}', '{"assign": {"TX2": 2001}}', "not json"):
+        response = client.post("/mpesa/suspense/reprocess", content=body)
+        assert response.status_code == 400, body
+    assert client.post("/mpesa/suspense/reprocess", json={"assign": {"TX9": "2001"}}).status_code == 400
+
+    # Without an assignment nothing matches yet
+    assert client.post("/mpesa/suspense/reprocess").json() == {"applied": [], "pending": ["TX2"]}
+    outcome = client.post("/mpesa/suspense/reprocess", json={"assign": {"TX2": "2001"}}).json()
+    assert outcome == {"applied": ["TX2"], "pending": []}
+    assert client.get("/mpesa/suspense").json()["count"] == 0
+    assert client.get("/mpesa/status/TX2").json()["remaining_credit"] == 500